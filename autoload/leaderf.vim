@@ -85,6 +85,9 @@ call s:InitVar('g:Lf_MruFileExclude', [])
 call s:InitVar('g:Lf_MruMaxFiles', 100)
 call s:InitVar('g:Lf_HighlightIndividual', 1)
 call s:InitVar('g:Lf_NumberOfHighlight', 100)
+call s:InitVar('g:Lf_FilterLatency', 12)
+call s:InitVar('g:Lf_QueryCacheSize', 64)
+call s:InitVar('g:Lf_FrecencyBoost', 1)
 call s:InitVar('g:Lf_WildIgnore', {
             \ 'dir': [],
             \ 'file': []
@@ -114,6 +117,7 @@ call s:InitVar('g:Lf_StlPalette', {})
 call s:InitVar('g:Lf_Ctags', 'ctags')
 call s:InitVar('g:Lf_PreviewCode', 0)
 call s:InitVar('g:Lf_UseVersionControlTool', 1)
+call s:InitVar('g:Lf_UseBuiltinIndexer', 0)
 call s:InitVar('g:Lf_RememberLastSearch', 0)
 call s:InitVar('g:Lf_UseCache', 1)
 call s:InitVar('g:Lf_RootMarkers', ['.git', '.hg', '.svn'])
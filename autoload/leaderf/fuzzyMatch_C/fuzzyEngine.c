@@ -68,20 +68,6 @@ typedef struct MergeTaskItem
     FeResult* buffer;
 }MergeTaskItem;
 
-typedef struct PySetTaskItem
-{
-    uint32_t function;
-    uint32_t offset;
-    uint32_t length;
-    union
-    {
-        weight_t* weights;
-        uint32_t* path_weights;
-    };
-    PyObject* text_list;
-    PyObject* py_source;
-}PySetTaskItem;
-
 typedef struct FeCircularQueue
 {
     void**          buffer;
@@ -116,6 +102,8 @@ struct FuzzyEngine
         {
             PatternContext* pPattern_ctxt;
             uint8_t         is_name_only;
+            /* the pattern after ';' in refinement mode, e.g. def of abc;def */
+            PatternContext* pRefine_pattern_ctxt;
         };
         struct
         {
@@ -124,7 +112,14 @@ struct FuzzyEngine
             const char* dirname;
         };
     };
+    /* the patterns of AND mode, e.g. abc def, the buffer is reused by every call */
+    PatternContext** pPattern_ctxts;
+    uint32_t        pattern_count;
+    uint32_t        pattern_capacity;
     FeString*       source;
+    FeString*       refine_source;
+    /* set by cancel() from another thread, checked by the worker threads for each item */
+    volatile uint8_t cancelled;
     union
     {
         FeResult*        results;
@@ -328,12 +323,13 @@ enum
     GET_WEIGHT = 0,
     GET_HIGHLIGHTS,
     GET_PATH_WEIGHT,
+    GET_REFINE_WEIGHT,
+    GET_AND_WEIGHT,
+    GET_AND_HIGHLIGHTS,
     Q_SORT,
     Q_SORT_2,
     MERGE,
-    MERGE_2,
-    PY_SET_ITEM,
-    PY_SET_ITEM_2
+    MERGE_2
 };
 
 /* sort in descending order */
@@ -350,7 +346,7 @@ static int compare2(const void* a, const void* b)
     uint32_t wa = ((const FeResult*)a)->path_weight;
     uint32_t wb = ((const FeResult*)b)->path_weight;
 
-    return (int)wb - (int)wa;
+    return (wa < wb) - (wa > wb);
 }
 
 #if defined(_MSC_VER)
@@ -376,7 +372,8 @@ static void* _worker(void* pParam)
                     FeResult* results = pEngine->results + pTask->offset;
                     uint32_t length = pTask->length;
                     uint32_t i = 0;
-                    for ( ; i < length; ++i )
+                    /* stop as soon as possible if the call is cancelled */
+                    for ( ; i < length && !pEngine->cancelled; ++i )
                     {
                         results[i].weight = getWeight(tasks[i].str, tasks[i].len,
                                                       pEngine->pPattern_ctxt, pEngine->is_name_only);
@@ -410,6 +407,75 @@ static void* _worker(void* pParam)
                     }
                 }
                 break;
+            case GET_REFINE_WEIGHT:
+                {
+                    FeString* tasks = pEngine->source + pTask->offset;
+                    FeString* refine_tasks = pEngine->refine_source + pTask->offset;
+                    FeResult* results = pEngine->results + pTask->offset;
+                    uint32_t length = pTask->length;
+                    uint32_t i = 0;
+                    /* stop as soon as possible if the call is cancelled */
+                    for ( ; i < length && !pEngine->cancelled; ++i )
+                    {
+                        weight_t weight = getWeight(tasks[i].str, tasks[i].len, pEngine->pPattern_ctxt, 1);
+                        if ( weight > MIN_WEIGHT )
+                        {
+                            weight_t refine_weight = getWeight(refine_tasks[i].str, refine_tasks[i].len,
+                                                               pEngine->pRefine_pattern_ctxt, 0);
+                            weight = refine_weight > MIN_WEIGHT ? weight + refine_weight : MIN_WEIGHT;
+                        }
+                        results[i].weight = weight;
+                        results[i].index = pTask->offset + i;
+                    }
+                }
+                break;
+            case GET_AND_WEIGHT:
+                {
+                    FeString* tasks = pEngine->source + pTask->offset;
+                    FeResult* results = pEngine->results + pTask->offset;
+                    uint32_t length = pTask->length;
+                    uint32_t i = 0;
+                    /* stop as soon as possible if the call is cancelled */
+                    for ( ; i < length && !pEngine->cancelled; ++i )
+                    {
+                        weight_t weight = 0;
+                        uint32_t k = 0;
+                        for ( ; k < pEngine->pattern_count; ++k )
+                        {
+                            weight_t w = getWeight(tasks[i].str, tasks[i].len,
+                                                   pEngine->pPattern_ctxts[k], pEngine->is_name_only);
+                            /* stop at the first pattern that does not match */
+                            if ( w <= MIN_WEIGHT )
+                            {
+                                weight = MIN_WEIGHT;
+                                break;
+                            }
+                            weight += w;
+                        }
+                        results[i].weight = weight;
+                        results[i].index = pTask->offset + i;
+                    }
+                }
+                break;
+            case GET_AND_HIGHLIGHTS:
+                {
+                    FeString* tasks = pEngine->source + pTask->offset;
+                    uint32_t pattern_count = pEngine->pattern_count;
+                    HighlightGroup** results = pEngine->highlights + pTask->offset * pattern_count;
+                    uint32_t length = pTask->length;
+                    uint32_t i = 0;
+                    for ( ; i < length; ++i )
+                    {
+                        uint32_t k = 0;
+                        for ( ; k < pattern_count; ++k )
+                        {
+                            results[i * pattern_count + k] = getHighlights(tasks[i].str, tasks[i].len,
+                                                                           pEngine->pPattern_ctxts[k],
+                                                                           pEngine->is_name_only);
+                        }
+                    }
+                }
+                break;
             case Q_SORT:
                 {
                     FeResult* tasks = pEngine->results + pTask->offset;
@@ -476,46 +542,6 @@ static void* _worker(void* pParam)
                     }
                 }
                 break;
-            case PY_SET_ITEM:
-                {
-                    PySetTaskItem* pPySetTask = (PySetTaskItem*)pTask;
-                    weight_t* weights = pPySetTask->weights + pPySetTask->offset;
-                    FeResult* results = pEngine->results + pPySetTask->offset;
-                    PyObject* text_list = pPySetTask->text_list;
-                    PyObject* py_source = pPySetTask->py_source;
-                    uint32_t i = 0;
-                    uint32_t length = pPySetTask->length;
-
-                    for ( i = 0; i < length; ++i )
-                    {
-                        weights[i] = results[i].weight;
-                        PyObject* item = PyList_GET_ITEM(py_source, results[i].index);
-                        Py_INCREF(item);
-                        /* PyList_SET_ITEM() steals a reference to item.     */
-                        PyList_SET_ITEM(text_list, pPySetTask->offset + i, item);
-                    }
-                }
-                break;
-            case PY_SET_ITEM_2:
-                {
-                    PySetTaskItem* pPySetTask = (PySetTaskItem*)pTask;
-                    uint32_t* path_weights = pPySetTask->path_weights + pPySetTask->offset;
-                    FeResult* results = pEngine->results + pPySetTask->offset;
-                    PyObject* text_list = pPySetTask->text_list;
-                    PyObject* py_source = pPySetTask->py_source;
-                    uint32_t i = 0;
-                    uint32_t length = pPySetTask->length;
-
-                    for ( i = 0; i < length; ++i )
-                    {
-                        path_weights[i] = results[i].path_weight;
-                        PyObject* item = PyList_GET_ITEM(py_source, results[i].index);
-                        Py_INCREF(item);
-                        /* PyList_SET_ITEM() steals a reference to item.     */
-                        PyList_SET_ITEM(text_list, pPySetTask->offset + i, item);
-                    }
-                }
-                break;
             }
 
             QUEUE_TASK_DONE(pEngine->task_queue);
@@ -544,7 +570,11 @@ FuzzyEngine* createFuzzyEngine(uint32_t cpu_count)
     pEngine->cpu_count = cpu_count;
     pEngine->threads = NULL;
     pEngine->pPattern_ctxt = NULL;
+    pEngine->pPattern_ctxts = NULL;
+    pEngine->pattern_count = 0;
+    pEngine->pattern_capacity = 0;
     pEngine->source = NULL;
+    pEngine->cancelled = 0;
 
     int32_t ret = 0;
     QUEUE_INIT(pEngine->task_queue, MAX_TASK_COUNT(cpu_count) + cpu_count + 1, ret);
@@ -590,16 +620,62 @@ void closeFuzzyEngine(FuzzyEngine* pEngine)
     }
 
     QUEUE_DESTROY(pEngine->task_queue);
+    free(pEngine->pPattern_ctxts);
     free(pEngine);
 }
 
+/**
+ * `py_pattern` is either a pattern returned by initPattern(), or a list of them.
+ * in the latter case, pEngine->pPattern_ctxts holds the patterns, otherwise pEngine->pattern_count is 0.
+ */
+static int32_t setPatterns(FuzzyEngine* pEngine, PyObject* py_pattern)
+{
+    if ( !PyList_Check(py_pattern) && !PyTuple_Check(py_pattern) )
+    {
+        pEngine->pattern_count = 0;
+        pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_pattern, NULL);
+        return pEngine->pPattern_ctxt ? 0 : -1;
+    }
+
+    uint32_t count = (uint32_t)PySequence_Fast_GET_SIZE(py_pattern);
+    if ( count == 0 )
+    {
+        PyErr_SetString(PyExc_ValueError, "parameter `pattern` must not be empty.");
+        return -1;
+    }
+
+    if ( count > pEngine->pattern_capacity )
+    {
+        PatternContext** ctxts = (PatternContext**)realloc(pEngine->pPattern_ctxts, count * sizeof(PatternContext*));
+        if ( !ctxts )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return -1;
+        }
+        pEngine->pPattern_ctxts = ctxts;
+        pEngine->pattern_capacity = count;
+    }
+
+    uint32_t i = 0;
+    for ( ; i < count; ++i )
+    {
+        pEngine->pPattern_ctxts[i] = (PatternContext*)PyCapsule_GetPointer(PySequence_Fast_GET_ITEM(py_pattern, i), NULL);
+        if ( !pEngine->pPattern_ctxts[i] )
+            return -1;
+    }
+    pEngine->pattern_count = count;
+    pEngine->pPattern_ctxt = pEngine->pPattern_ctxts[0];
+
+    return 0;
+}
+
 static int32_t pyObject_ToStringAndSize(PyObject* obj, char** buffer, uint32_t* size)
 {
     Py_ssize_t length = 0;
 #if PY_MAJOR_VERSION >= 3
     *buffer = (char*)PyUnicode_AsUTF8AndSize(obj, &length);
     *size = (uint32_t)length;
-    if ( buffer )
+    if ( *buffer )
         return 0;
     else
         return -1;
@@ -613,6 +689,279 @@ static int32_t pyObject_ToStringAndSize(PyObject* obj, char** buffer, uint32_t*
 #endif
 }
 
+#define CORPUS_NAME "fuzzyEngine.Corpus"
+
+/* the number of the lowest bits of the mantissa of a weight that are replaced by the prior */
+#define PRIOR_BITS 4
+#define MAX_PRIOR ((1 << PRIOR_BITS) - 1)
+
+/* the minimum size of a block of the corpus arena */
+#define ARENA_BLOCK_SIZE (1 << 20)
+
+typedef struct FeArenaBlock
+{
+    struct FeArenaBlock* next;
+    size_t size;
+    size_t used;
+    char   data[1];
+}FeArenaBlock;
+
+/**
+ * A copy of the strings in a python list, the strings are stored in an arena
+ * that consists of several blocks, so that the address of a string never
+ * changes once it has been copied.
+ */
+typedef struct FeCorpus
+{
+    PyObject*     py_source;    /* the list that the corpus is created from */
+    FeString*     strings;
+    uint32_t      size;
+    uint32_t      capacity;
+    FeArenaBlock* blocks;       /* the block in use is the first one */
+    uint8_t*      priors;       /* the prior of each string, see setCorpusPriors() */
+    uint32_t      prior_count;
+}FeCorpus;
+
+static void clearCorpus(FeCorpus* pCorpus)
+{
+    FeArenaBlock* pBlock = pCorpus->blocks;
+    while ( pBlock )
+    {
+        FeArenaBlock* pNext = pBlock->next;
+        free(pBlock);
+        pBlock = pNext;
+    }
+    pCorpus->blocks = NULL;
+    pCorpus->size = 0;
+}
+
+static void delCorpus(PyObject* obj)
+{
+    FeCorpus* pCorpus = (FeCorpus*)PyCapsule_GetPointer(obj, CORPUS_NAME);
+    if ( !pCorpus )
+        return;
+
+    clearCorpus(pCorpus);
+    free(pCorpus->strings);
+    free(pCorpus->priors);
+    Py_XDECREF(pCorpus->py_source);
+    free(pCorpus);
+}
+
+static char* arenaAlloc(FeCorpus* pCorpus, size_t size)
+{
+    FeArenaBlock* pBlock = pCorpus->blocks;
+    if ( !pBlock || pBlock->size - pBlock->used < size )
+    {
+        size_t block_size = size > ARENA_BLOCK_SIZE ? size : ARENA_BLOCK_SIZE;
+        pBlock = (FeArenaBlock*)malloc(sizeof(FeArenaBlock) + block_size);
+        if ( !pBlock )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pBlock->next = pCorpus->blocks;
+        pBlock->size = block_size;
+        pBlock->used = 0;
+        pCorpus->blocks = pBlock;
+    }
+
+    char* p = pBlock->data + pBlock->used;
+    pBlock->used += size;
+
+    return p;
+}
+
+/**
+ * copy the strings in range [pCorpus->size, end) of the list into the corpus.
+ * the list may grow after the corpus is created, e.g., it is being appended by
+ * a reader thread, so the new strings are copied lazily when they are needed.
+ */
+static int32_t extendCorpus(FeCorpus* pCorpus, uint32_t end)
+{
+    if ( end <= pCorpus->size )
+        return 0;
+
+    if ( end > pCorpus->capacity )
+    {
+        uint32_t capacity = pCorpus->capacity > 0 ? pCorpus->capacity : 1024;
+        while ( capacity < end )
+        {
+            capacity <<= 1;
+        }
+        FeString* strings = (FeString*)realloc(pCorpus->strings, capacity * sizeof(FeString));
+        if ( !strings )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return -1;
+        }
+        pCorpus->strings = strings;
+        pCorpus->capacity = capacity;
+    }
+
+    uint32_t i = pCorpus->size;
+    for ( ; i < end; ++i )
+    {
+        char* str = NULL;
+        uint32_t len = 0;
+        if ( pyObject_ToStringAndSize(PyList_GET_ITEM(pCorpus->py_source, i), &str, &len) < 0 )
+        {
+            pCorpus->size = i;
+            fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+            return -1;
+        }
+
+        /* the string is null-terminated, getPathWeight() needs it */
+        char* p = arenaAlloc(pCorpus, len + 1);
+        if ( !p )
+        {
+            pCorpus->size = i;
+            return -1;
+        }
+        memcpy(p, str, len);
+        p[len] = '\0';
+        pCorpus->strings[i].str = p;
+        pCorpus->strings[i].len = len;
+    }
+    pCorpus->size = end;
+
+    return 0;
+}
+
+/**
+ * get the corpus from `py_source` and copy the strings in range [*begin, *end)
+ * into it if they have not been copied.
+ * `*end` < 0 means the end of the list.
+ * return NULL if `py_source` is not a corpus or an error occurs.
+ */
+static FeCorpus* getCorpus(PyObject* py_source, Py_ssize_t* begin, Py_ssize_t* end)
+{
+    if ( !PyCapsule_IsValid(py_source, CORPUS_NAME) )
+        return NULL;
+
+    FeCorpus* pCorpus = (FeCorpus*)PyCapsule_GetPointer(py_source, CORPUS_NAME);
+    Py_ssize_t list_size = PyList_Size(pCorpus->py_source);
+    /* the list has been changed in place, e.g., a line is removed from it */
+    if ( list_size < (Py_ssize_t)pCorpus->size )
+        clearCorpus(pCorpus);
+
+    if ( *end < 0 || *end > list_size )
+        *end = list_size;
+    if ( *begin < 0 || *begin > *end )
+        *begin = *end;
+
+    if ( extendCorpus(pCorpus, (uint32_t)*end) < 0 )
+        return NULL;
+
+    return pCorpus;
+}
+
+/**
+ * registerCorpus(source)
+ *
+ * `source` is a list of strings.
+ * return a corpus object that can be passed to fuzzyMatch(), fuzzyMatchEx(), fuzzyMatchPart(),
+ * getHighlights() and guessMatch() as the parameter `source`, so that the strings are converted
+ * only once instead of every time these functions are called.
+ * The strings appended to `source` after the corpus is created are copied when they are used.
+ */
+static PyObject* fuzzyEngine_registerCorpus(PyObject* self, PyObject* args)
+{
+    PyObject* py_source = NULL;
+    if ( !PyArg_ParseTuple(args, "O:registerCorpus", &py_source) )
+        return NULL;
+
+    if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+        return NULL;
+    }
+
+    FeCorpus* pCorpus = (FeCorpus*)calloc(1, sizeof(FeCorpus));
+    if ( !pCorpus )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return PyErr_NoMemory();
+    }
+
+    Py_INCREF(py_source);
+    pCorpus->py_source = py_source;
+
+    PyObject* py_corpus = PyCapsule_New(pCorpus, CORPUS_NAME, delCorpus);
+    if ( !py_corpus )
+    {
+        Py_DECREF(py_source);
+        free(pCorpus);
+        return NULL;
+    }
+
+    if ( extendCorpus(pCorpus, (uint32_t)PyList_Size(py_source)) < 0 )
+    {
+        Py_DECREF(py_corpus);
+        if ( !PyErr_Occurred() )
+            PyErr_SetString(PyExc_ValueError, "can not register the corpus.");
+        return NULL;
+    }
+
+    return py_corpus;
+}
+
+/**
+ * setCorpusPriors(corpus, priors)
+ *
+ * `priors` is a bytes-like object, e.g., an array('B'), priors[i] is the prior of the i-th string
+ * of the corpus, from 0 to MAX_PRIOR, a greater value is clamped to MAX_PRIOR.
+ * The strings that have no prior, e.g., those after len(priors), have a prior 0.
+ * The priors break the ties of the weights returned by fuzzyMatch(), fuzzyMatchEx(), fuzzyMatchPart()
+ * and refineMatch() when `source` is the corpus, see addPrior().
+ */
+static PyObject* fuzzyEngine_setCorpusPriors(PyObject* self, PyObject* args)
+{
+    PyObject* py_corpus = NULL;
+    Py_buffer view;
+#if PY_MAJOR_VERSION >= 3
+    if ( !PyArg_ParseTuple(args, "Oy*:setCorpusPriors", &py_corpus, &view) )
+        return NULL;
+#else
+    if ( !PyArg_ParseTuple(args, "Os*:setCorpusPriors", &py_corpus, &view) )
+        return NULL;
+#endif
+
+    FeCorpus* pCorpus = (FeCorpus*)PyCapsule_GetPointer(py_corpus, CORPUS_NAME);
+    if ( !pCorpus )
+    {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    uint32_t count = (uint32_t)view.len;
+    uint8_t* priors = NULL;
+    if ( count > 0 )
+    {
+        priors = (uint8_t*)malloc(count);
+        if ( !priors )
+        {
+            PyBuffer_Release(&view);
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return PyErr_NoMemory();
+        }
+
+        const uint8_t* p = (const uint8_t*)view.buf;
+        uint32_t i = 0;
+        for ( ; i < count; ++i )
+        {
+            priors[i] = MIN(p[i], MAX_PRIOR);
+        }
+    }
+    PyBuffer_Release(&view);
+
+    free(pCorpus->priors);
+    pCorpus->priors = priors;
+    pCorpus->prior_count = count;
+
+    Py_RETURN_NONE;
+}
+
 static void delFuzzyEngine(PyObject* obj)
 {
     closeFuzzyEngine((FuzzyEngine*)PyCapsule_GetPointer(obj, NULL));
@@ -625,6 +974,10 @@ static void delFuzzyEngine(PyObject* obj)
  *      It defaults to `False`, which means do not auto free the fuzzyEngine object,
  *      so that you should call closeFuzzyEngine() manually.
  *  return a fuzzyEngine object
+ *
+ *  NOTE: the GIL is released while the worker threads are running, so a fuzzyEngine object and the corpus
+ *  passed to it must not be used by more than one thread at the same time, and `source` must not be
+ *  modified by other threads during the call.
  */
 static PyObject* fuzzyEngine_createFuzzyEngine(PyObject* self, PyObject* args, PyObject* kwargs)
 {
@@ -640,6 +993,32 @@ static PyObject* fuzzyEngine_createFuzzyEngine(PyObject* self, PyObject* args, P
     return PyCapsule_New(pEngine, NULL, auto_free ? delFuzzyEngine : NULL);
 }
 
+/**
+ * cancel(engine, cancelled=True)
+ *
+ * set or clear the cancel flag of `engine`, it is meant to be called while another thread is
+ * running fuzzyMatch(), fuzzyMatchEx(), refineMatch() or fuzzyMatchPart() on `engine`.
+ * while the flag is set, the worker threads skip the remaining tasks and the running call returns None.
+ * the flag is not cleared automatically, it must be cleared before `engine` is used again.
+ */
+static PyObject* fuzzyEngine_cancel(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* py_engine = NULL;
+    uint8_t cancelled = 1;
+    static char* kwlist[] = {"engine", "cancelled", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "O|b:cancel", kwlist, &py_engine, &cancelled) )
+        return NULL;
+
+    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
+    if ( !pEngine )
+        return NULL;
+
+    pEngine->cancelled = cancelled;
+
+    Py_RETURN_NONE;
+}
+
 /**
  * closeFuzzyEngine(engine)
  */
@@ -675,9 +1054,12 @@ static PyObject* fuzzyEngine_initPattern(PyObject* self, PyObject* args)
     return PyCapsule_New(pCtxt, NULL, delPatternContext);
 }
 
+/* the name of the capsule of the weights returned by guessMatch(), they are uint32_t instead of weight_t */
+#define PATH_WEIGHTS_NAME "fuzzyEngine.PathWeights"
+
 static void delWeights(PyObject* obj)
 {
-    free(PyCapsule_GetPointer(obj, NULL));
+    free(PyCapsule_GetPointer(obj, PyCapsule_GetName(obj)));
 }
 
 static PyObject* createWeights(void* weights)
@@ -685,45 +1067,850 @@ static PyObject* createWeights(void* weights)
     return PyCapsule_New(weights, NULL, delWeights);
 }
 
+static PyObject* createPathWeights(uint32_t* weights)
+{
+    return PyCapsule_New(weights, PATH_WEIGHTS_NAME, delWeights);
+}
+
 /**
- * fuzzyMatch(engine, source, pattern, is_name_only=False, sort_results=True)
- *
- * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
- * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
- *
- * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
+ * return the weights in `py_weights`, which is created by createWeights() or createPathWeights(),
+ * `*is_path_weight` is set to 1 if it is created by createPathWeights(), otherwise 0.
  */
-static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject* kwargs)
+static void* getWeights(PyObject* py_weights, uint8_t* is_path_weight)
 {
-    PyObject* py_engine = NULL;
-    PyObject* py_source = NULL;
-    PyObject* py_patternCtxt = NULL;
-    uint8_t is_name_only = 0;
-    uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", NULL};
+    *is_path_weight = (uint8_t)PyCapsule_IsValid(py_weights, PATH_WEIGHTS_NAME);
+    return PyCapsule_GetPointer(py_weights, *is_path_weight ? PATH_WEIGHTS_NAME : NULL);
+}
 
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bb:fuzzyMatch", kwlist, &py_engine,
-                                      &py_source, &py_patternCtxt, &is_name_only, &sort_results) )
-        return NULL;
+/**
+ * return nonzero if weights_a[i] is greater than weights_b[j], they are compared as
+ * path weights if `is_path_weight` is nonzero.
+ * The weights are 4 bytes whichever type they are, so they are copied by memcpy().
+ */
+static int isWeightGreater(const void* weights_a, uint32_t i, const void* weights_b, uint32_t j,
+                           uint8_t is_path_weight)
+{
+    if ( is_path_weight )
+    {
+        return ((const uint32_t*)weights_a)[i] > ((const uint32_t*)weights_b)[j];
+    }
+    else
+    {
+        return ((const weight_t*)weights_a)[i] > ((const weight_t*)weights_b)[j];
+    }
+}
 
-    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
-    if ( !pEngine )
+/**
+ * return a new array.array of `typecode` whose content is a copy of the `size` bytes of `data`.
+ */
+static PyObject* createArray(const char* typecode, const void* data, Py_ssize_t size)
+{
+    PyObject* py_module = PyImport_ImportModule("array");
+    if ( !py_module )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
+    PyObject* py_bytes = PyBytes_FromStringAndSize((const char*)data, size);
+    if ( !py_bytes )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+        Py_DECREF(py_module);
         return NULL;
     }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
-    if ( source_size == 0 )
-    {
-        return Py_BuildValue("([],[])");
+    PyObject* py_array = PyObject_CallMethod(py_module, "array", "sO", typecode, py_bytes);
+    Py_DECREF(py_bytes);
+    Py_DECREF(py_module);
+
+    return py_array;
+}
+
+/**
+ * copy the `count` indices of `py_indices`, which is a buffer of uint32_t, e.g., array('I'), to `indices`.
+ * return -1 if any of them is not less than `end`.
+ */
+static int32_t getIndices(PyObject* py_indices, uint32_t end, uint32_t count, uint32_t* indices)
+{
+    Py_buffer view;
+    if ( PyObject_GetBuffer(py_indices, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0 )
+        return -1;
+
+    if ( view.itemsize != sizeof(uint32_t) || view.len != (Py_ssize_t)(count * sizeof(uint32_t)) )
+    {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_TypeError, "parameter `indices` must be an array('I').");
+        return -1;
+    }
+
+    memcpy(indices, view.buf, count * sizeof(uint32_t));
+    PyBuffer_Release(&view);
+
+    uint32_t i = 0;
+    for ( ; i < count; ++i )
+    {
+        if ( indices[i] >= end )
+        {
+            PyErr_SetString(PyExc_ValueError, "parameter `indices` does not match the corpus.");
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+/**
+ * sort pEngine->results[0:results_count] in descending order of weight, or path weight if
+ * `is_path_weight` is nonzero. If there are too many results, they are sorted by the worker threads.
+ * This function does not touch any python object, so it can be called without holding the GIL.
+ * return 0 on success, -1 if out of memory.
+ */
+static int32_t sortResults(FuzzyEngine* pEngine, TaskItem* tasks, uint32_t task_count,
+                           uint32_t results_count, uint8_t is_path_weight)
+{
+    FeResult* results = pEngine->results;
+    if ( task_count == 1 || results_count < 60000 )
+    {
+        qsort(results, results_count, sizeof(FeResult), is_path_weight ? compare2 : compare);
+        return 0;
+    }
+
+    uint32_t chunk_size = (results_count + task_count - 1) / task_count;
+    if ( chunk_size < 2000 )
+    {
+        chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
+    }
+    task_count = (results_count + chunk_size - 1) / chunk_size;
+    FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
+    if ( !buffer )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return -1;
+    }
+#if defined(_MSC_VER)
+    QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
+#endif
+    uint32_t i = 0;
+    for ( ; i < task_count; ++i )
+    {
+        uint32_t offset = i * chunk_size;
+        uint32_t length = MIN(chunk_size, results_count - offset);
+
+        tasks[i].function = is_path_weight ? Q_SORT_2 : Q_SORT;
+        tasks[i].offset = offset;
+        tasks[i].length = length;
+        QUEUE_PUT(pEngine->task_queue, tasks + i);
+    }
+
+    QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+
+    MergeTaskItem* merge_tasks = NULL;
+    merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
+    if ( !merge_tasks )
+    {
+        free(buffer);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return -1;
+    }
+
+    while ( chunk_size < results_count )
+    {
+        uint32_t q = results_count / (chunk_size << 1);
+        uint32_t r = results_count % (chunk_size << 1);
+#if defined(_MSC_VER)
+        QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
+#endif
+        for ( i = 0; i < q; ++i )
+        {
+            merge_tasks[i].function = is_path_weight ? MERGE_2 : MERGE;
+            merge_tasks[i].offset_1 = i * (chunk_size << 1);
+            merge_tasks[i].length_1 = chunk_size;
+            merge_tasks[i].length_2 = chunk_size;
+            merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
+            QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
+        }
+
+        if ( r > chunk_size )
+        {
+            merge_tasks[i].function = is_path_weight ? MERGE_2 : MERGE;
+            merge_tasks[i].offset_1 = i * (chunk_size << 1);
+            merge_tasks[i].length_1 = chunk_size;
+            merge_tasks[i].length_2 = r - chunk_size;
+            merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
+            QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
+        }
+
+        QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+
+        chunk_size <<= 1;
+    }
+
+    free(buffer);
+    free(merge_tasks);
+
+    return 0;
+}
+
+/* every path weight can be represented by a double exactly */
+#define SORT_KEY(result, is_path_weight) \
+    ((is_path_weight) ? (double)(result).path_weight : (double)(result).weight)
+
+/**
+ * rearrange results[0:results_count] so that results[0:top_k] are the top_k results with
+ * the largest weights, or path weights if `is_path_weight` is nonzero, and sort results[0:top_k]
+ * in descending order of them. The order of the other results is unspecified.
+ */
+static void selectTopK(FeResult* results, uint32_t results_count, uint32_t top_k, uint8_t is_path_weight)
+{
+    int64_t left = 0;
+    int64_t right = (int64_t)results_count - 1;
+    int64_t k = (int64_t)top_k - 1;
+    while ( left < right )
+    {
+        double pivot = SORT_KEY(results[left + ((right - left) >> 1)], is_path_weight);
+        int64_t i = left - 1;
+        int64_t j = right + 1;
+        for ( ;; )
+        {
+            do
+            {
+                ++i;
+            } while ( SORT_KEY(results[i], is_path_weight) > pivot );
+
+            do
+            {
+                --j;
+            } while ( SORT_KEY(results[j], is_path_weight) < pivot );
+
+            if ( i >= j )
+                break;
+
+            FeResult tmp = results[i];
+            results[i] = results[j];
+            results[j] = tmp;
+        }
+
+        /* the weights of results[left:j+1] are not less than those of results[j+1:right+1] */
+        if ( k <= j )
+        {
+            right = j;
+        }
+        else
+        {
+            left = j + 1;
+        }
+    }
+
+    qsort(results, top_k, sizeof(FeResult), is_path_weight ? compare2 : compare);
+}
+
+/**
+ * return `weight` with the lowest PRIOR_BITS bits of its mantissa replaced by `prior`,
+ * so that the weights that are equal or nearly equal are ordered by prior,
+ * and the order of the weights that differ by more than 2^PRIOR_BITS ulps is not changed.
+ * only a positive weight is changed, because the order of the bits of a negative float is reversed.
+ */
+static weight_t addPrior(weight_t weight, uint8_t prior)
+{
+    if ( weight > 0 )
+    {
+        uint32_t bits;
+        memcpy(&bits, &weight, sizeof(bits));
+        bits = (bits & ~(uint32_t)MAX_PRIOR) | prior;
+        memcpy(&weight, &bits, sizeof(weight));
+    }
+
+    return weight;
+}
+
+/**
+ * move the matched results to the front of `results` and return the number of them.
+ * if the corpus has priors, add them to the weights, the i-th result is the string
+ * index_map[i] of the corpus if index_map is not NULL, otherwise begin + i * unit.
+ */
+static uint32_t compactResults(FeResult* results, uint32_t source_size, const FeCorpus* pCorpus,
+                               uint32_t begin, uint32_t unit, const uint32_t* index_map)
+{
+    const uint8_t* priors = pCorpus ? pCorpus->priors : NULL;
+    uint32_t prior_count = priors ? pCorpus->prior_count : 0;
+    uint32_t results_count = 0;
+    uint32_t i = 0;
+    for ( ; i < source_size; ++i )
+    {
+        if ( results[i].weight > MIN_WEIGHT )
+        {
+            if ( priors )
+            {
+                uint32_t index = index_map ? index_map[results[i].index] : begin + results[i].index * unit;
+                results[i].weight = addPrior(results[i].weight, index < prior_count ? priors[index] : 0);
+            }
+            if ( i > results_count )
+            {
+                results[results_count] = results[i];
+            }
+            ++results_count;
+        }
+    }
+
+    return results_count;
+}
+
+/**
+ * return a tuple (array('f') of weight, array('I') of index) of results[0:results_count],
+ * the index is the index of the corpus, i.e., index_map[index] if index_map is not NULL,
+ * otherwise begin + index * unit.
+ */
+static PyObject* createResultArrays(const FeResult* results, uint32_t results_count,
+                                    uint32_t begin, uint32_t unit, const uint32_t* index_map)
+{
+    if ( results_count == 0 )
+    {
+        return Py_BuildValue("(NN)", createArray("f", NULL, 0), createArray("I", NULL, 0));
+    }
+
+    /* the weights are followed by the indices */
+    weight_t* weights = (weight_t*)malloc(results_count * (sizeof(weight_t) + sizeof(uint32_t)));
+    if ( !weights )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    uint32_t* indices = (uint32_t*)(weights + results_count);
+    uint32_t i = 0;
+    for ( ; i < results_count; ++i )
+    {
+        weights[i] = results[i].weight;
+        indices[i] = index_map ? index_map[results[i].index] : begin + results[i].index * unit;
+    }
+
+    PyObject* py_weight_array = createArray("f", weights, results_count * sizeof(weight_t));
+    PyObject* py_index_array = createArray("I", indices, results_count * sizeof(uint32_t));
+    free(weights);
+    if ( !py_weight_array || !py_index_array )
+    {
+        Py_XDECREF(py_weight_array);
+        Py_XDECREF(py_index_array);
+        return NULL;
+    }
+
+    return Py_BuildValue("(NN)", py_weight_array, py_index_array);
+}
+
+/**
+ * fuzzyMatch(engine, source, pattern, is_name_only=False, sort_results=True, begin=0, end=-1, top_k=0,
+ *            indices=None, return_array=False)
+ *
+ * `source` is a list of strings or a corpus returned by registerCorpus().
+ * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
+ * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
+ * `begin` and `end` are optional, if `source` is a corpus, only the items in range [begin, end) are matched,
+ * `end` < 0 means the end of the corpus. They are ignored if `source` is a list.
+ * `top_k` is optional, if it is greater than 0 and `sort_results` is `True`, only the first `top_k` items of
+ * the results are sorted, the rest items are in unspecified order, use sortResult() to sort them.
+ * `indices` and `return_array` are the same as those of fuzzyMatchEx(), `top_k` is ignored if `return_array`
+ * is True, so that the results can be merged by mergeArray().
+ *
+ * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
+ */
+static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* py_engine = NULL;
+    PyObject* py_source = NULL;
+    PyObject* py_patternCtxt = NULL;
+    uint8_t is_name_only = 0;
+    uint8_t sort_results = 1;
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    uint32_t top_k = 0;
+    PyObject* py_indices = NULL;
+    uint8_t return_array = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "begin", "end",
+                             "top_k", "indices", "return_array", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbnnIOb:fuzzyMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &is_name_only, &sort_results, &begin, &end, &top_k,
+                                      &py_indices, &return_array) )
+        return NULL;
+
+    if ( py_indices == Py_None )
+    {
+        py_indices = NULL;
+    }
+
+    if ( return_array )
+    {
+        top_k = 0;
+    }
+
+    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
+    if ( !pEngine )
+        return NULL;
+
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
+    {
+        py_source = pCorpus->py_source;
+    }
+    else if ( PyErr_Occurred() )
+    {
+        return NULL;
+    }
+    else if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a corpus.");
+        return NULL;
+    }
+    else
+    {
+        begin = 0;
+    }
+
+    uint32_t source_size = 0;
+    if ( py_indices )
+    {
+        if ( !pCorpus )
+        {
+            PyErr_SetString(PyExc_TypeError, "parameter `indices` can only be used if `source` is a corpus.");
+            return NULL;
+        }
+
+        Py_ssize_t index_count = PyObject_Length(py_indices);
+        if ( index_count < 0 )
+            return NULL;
+
+        source_size = (uint32_t)index_count;
+    }
+    else
+    {
+        source_size = pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source);
+    }
+
+    if ( source_size == 0 )
+    {
+        if ( return_array )
+        {
+            return createResultArrays(NULL, 0, 0, 1, NULL);
+        }
+        return Py_BuildValue("([],[])");
+    }
+
+    pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
+    if ( !pEngine->pPattern_ctxt )
+        return NULL;
+
+    pEngine->is_name_only = is_name_only;
+
+    uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
+    uint32_t chunk_size = (source_size + max_task_count - 1) / max_task_count;
+    uint32_t task_count = (source_size + chunk_size - 1) / chunk_size;
+    if ( chunk_size == 1 || pEngine->cpu_count == 1 )
+    {
+        chunk_size = source_size;
+        task_count = 1;
+    }
+
+    /* if `source` is a corpus, use the strings in it directly */
+    FeString* source_buffer = NULL;
+    uint32_t* index_map = NULL;     /* a copy of `indices`, it is freed together with source_buffer */
+    if ( pCorpus && py_indices )
+    {
+        source_buffer = (FeString*)malloc(source_size * (sizeof(FeString) + sizeof(uint32_t)));
+        if ( !source_buffer )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        index_map = (uint32_t*)(source_buffer + source_size);
+        if ( getIndices(py_indices, (uint32_t)end, source_size, index_map) < 0 )
+        {
+            free(source_buffer);
+            return NULL;
+        }
+        uint32_t j = 0;
+        for ( ; j < source_size; ++j )
+        {
+            source_buffer[j] = pCorpus->strings[index_map[j]];
+        }
+        pEngine->source = source_buffer;
+    }
+    else if ( pCorpus )
+    {
+        pEngine->source = pCorpus->strings + begin;
+    }
+    else
+    {
+        source_buffer = (FeString*)malloc(source_size * sizeof(FeString));
+        if ( !source_buffer )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pEngine->source = source_buffer;
+    }
+
+    TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
+    if ( !tasks )
+    {
+        free(source_buffer);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    pEngine->results = (FeResult*)malloc(source_size * sizeof(FeResult));
+    if ( !pEngine->results )
+    {
+        free(source_buffer);
+        free(tasks);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    FeResult* results = pEngine->results;
+
+    if ( !pEngine->threads )
+    {
+#if defined(_MSC_VER)
+        pEngine->threads = (HANDLE*)malloc(pEngine->cpu_count * sizeof(HANDLE));
+#else
+        pEngine->threads = (pthread_t*)malloc(pEngine->cpu_count * sizeof(pthread_t));
+#endif
+        if ( !pEngine->threads )
+        {
+            free(source_buffer);
+            free(tasks);
+            free(results);
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+
+        uint32_t i = 0;
+        for ( ; i < pEngine->cpu_count; ++i)
+        {
+#if defined(_MSC_VER)
+            pEngine->threads[i] = CreateThread(NULL, 0, _worker, pEngine, 0, NULL);
+            if ( !pEngine->threads[i] )
+#else
+            int ret = pthread_create(&pEngine->threads[i], NULL, _worker, pEngine);
+            if ( ret != 0 )
+#endif
+            {
+                free(source_buffer);
+                free(tasks);
+                free(results);
+                free(pEngine->threads);
+                fprintf(stderr, "pthread_create error!\n");
+                return NULL;
+            }
+        }
+    }
+
+#if defined(_MSC_VER)
+    QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
+#endif
+
+    uint32_t i = 0;
+    for ( ; i < task_count; ++i )
+    {
+        uint32_t offset = i * chunk_size;
+        uint32_t length = MIN(chunk_size, source_size - offset);
+
+        tasks[i].function = GET_WEIGHT;
+        tasks[i].offset = offset;
+        tasks[i].length = length;
+
+        if ( !pCorpus )
+        {
+            uint32_t j = 0;
+            for ( ; j < length; ++j )
+            {
+                FeString *s = pEngine->source + offset + j;
+                PyObject* item = PyList_GET_ITEM(py_source, offset + j);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+                {
+                    free(source_buffer);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
+            }
+        }
+
+        QUEUE_PUT(pEngine->task_queue, tasks + i);
+    }
+
+    uint32_t results_count = 0;
+    int32_t ret = 0;
+    uint8_t cancelled = 0;
+
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
+
+    QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+
+    /* the results are incomplete if the call is cancelled, see cancel() */
+    cancelled = pEngine->cancelled;
+    if ( !cancelled )
+    {
+        results_count = compactResults(results, source_size, pCorpus, (uint32_t)begin, 1, index_map);
     }
 
-    pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
-    if ( !pEngine->pPattern_ctxt )
+    if ( results_count > 0 && sort_results )
+    {
+        if ( top_k > 0 && top_k < results_count )
+        {
+            selectTopK(results, results_count, top_k, 0);
+        }
+        else
+        {
+            ret = sortResults(pEngine, tasks, task_count, results_count, 0);
+        }
+    }
+
+    Py_END_ALLOW_THREADS
+
+    if ( ret < 0 )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        return NULL;
+    }
+
+    if ( cancelled )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        Py_RETURN_NONE;
+    }
+
+    if ( return_array )
+    {
+        PyObject* py_result = createResultArrays(results, results_count, (uint32_t)begin, 1, index_map);
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        return py_result;
+    }
+
+    if ( results_count == 0 )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        return Py_BuildValue("([],[])");
+    }
+
+    weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
+    if ( !weights )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    PyObject* text_list = PyList_New(results_count);
+    for ( i = 0; i < results_count; ++i )
+    {
+        weights[i] = results[i].weight;
+        PyObject* item = PyList_GET_ITEM(py_source, begin + results[i].index);
+        Py_INCREF(item);
+        /* PyList_SET_ITEM() steals a reference to item.     */
+        PyList_SET_ITEM(text_list, i, item);
+    }
+
+    free(source_buffer);
+    free(tasks);
+    free(results);
+
+    return Py_BuildValue("(NN)", createWeights(weights), text_list);
+}
+
+/**
+ * `py_digest` is a tuple (starts, lengths), both are buffers of uint32_t, e.g., array('I'),
+ * starts[i] and lengths[i] are the byte offset and the byte length of the digest of the i-th string
+ * of the corpus.
+ * fill `digests` with the digests of the first string of each unit in range [begin, end) of the corpus,
+ * or the digests of the strings indices[0], ..., indices[index_count - 1] if `indices` is not NULL,
+ * all of the indices must be less than `end`.
+ * if `py_digest` is NULL, the strings themselves are used.
+ */
+static int32_t getDigests(FeCorpus* pCorpus, PyObject* py_digest, uint32_t begin, uint32_t end, uint32_t unit,
+                          const uint32_t* indices, uint32_t index_count, FeString* digests)
+{
+    uint32_t count = indices ? index_count : (end - begin) / unit;
+    uint32_t i = 0;
+
+    if ( !py_digest )
+    {
+        for ( ; i < count; ++i )
+        {
+            digests[i] = pCorpus->strings[indices ? indices[i] : begin + i * unit];
+        }
+        return 0;
+    }
+
+    Py_buffer starts;
+    Py_buffer lengths;
+
+    if ( !PyTuple_Check(py_digest) || PyTuple_Size(py_digest) != 2 )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `digest` must be a tuple (starts, lengths).");
+        return -1;
+    }
+
+    if ( PyObject_GetBuffer(PyTuple_GET_ITEM(py_digest, 0), &starts, PyBUF_FORMAT) < 0 )
+        return -1;
+
+    if ( PyObject_GetBuffer(PyTuple_GET_ITEM(py_digest, 1), &lengths, PyBUF_FORMAT) < 0 )
+    {
+        PyBuffer_Release(&starts);
+        return -1;
+    }
+
+    if ( starts.itemsize != sizeof(uint32_t) || lengths.itemsize != sizeof(uint32_t)
+         || starts.len < (Py_ssize_t)(end * sizeof(uint32_t)) || lengths.len < (Py_ssize_t)(end * sizeof(uint32_t)) )
+    {
+        PyBuffer_Release(&starts);
+        PyBuffer_Release(&lengths);
+        PyErr_SetString(PyExc_ValueError, "parameter `digest` does not match the corpus.");
+        return -1;
+    }
+
+    const uint32_t* start_array = (const uint32_t*)starts.buf;
+    const uint32_t* length_array = (const uint32_t*)lengths.buf;
+    for ( ; i < count; ++i )
+    {
+        uint32_t index = indices ? indices[i] : begin + i * unit;
+        FeString* s = pCorpus->strings + index;
+        uint32_t start = MIN(start_array[index], s->len);
+        digests[i].str = s->str + start;
+        digests[i].len = MIN(length_array[index], s->len - start);
+    }
+
+    PyBuffer_Release(&starts);
+    PyBuffer_Release(&lengths);
+
+    return 0;
+}
+
+/**
+ * fuzzyMatchEx(engine, source, pattern, is_name_only=False, sort_results=True, is_and_mode=False, begin=0, end=-1,
+ *              digest=None, unit=1, indices=None, return_array=False)
+ *
+ * same as fuzzyMatch(), the only difference is the return value.
+ * return a tuple, (a list of corresponding weight, a sorted list of index to items from `source` that match `pattern`).
+ * if `source` is a corpus, the index is relative to `begin`.
+ * `digest` is optional, it is only used if `source` is a corpus, it is a tuple (starts, lengths) of two
+ * array('I'), if it is given, only the part [starts[i], starts[i] + lengths[i]) in bytes of the i-th string
+ * of the corpus is matched, so that the digests need not be extracted from the strings every time.
+ * `unit` is optional, it indicates how many consecutive items of `source` are considered as a unit,
+ * only the first item of each unit is matched, and the index returned is the index of the unit.
+ * `pattern` can also be a list of patterns, e.g., the patterns of AND mode, then an item matches
+ * only if it matches all of them, and the weight is the sum of the weights.
+ * `indices` is optional, it is only used if `source` is a corpus, it is an array('I') of the indices of
+ * the strings of the corpus to be matched, all of them must be less than `end`, `begin` and `unit` are ignored.
+ * if `return_array` is True, return a tuple (array('f') of weight, array('I') of index), the index is the
+ * index of the corpus instead, i.e., begin + index * unit, or indices[index] if `indices` is given.
+ */
+static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* py_engine = NULL;
+    PyObject* py_source = NULL;
+    PyObject* py_patternCtxt = NULL;
+    uint8_t is_name_only = 0;
+    uint8_t sort_results = 1;
+    uint8_t is_and_mode = 0;
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    PyObject* py_digest = NULL;
+    uint32_t unit = 1;
+    PyObject* py_indices = NULL;
+    uint8_t return_array = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "is_and_mode",
+                             "begin", "end", "digest", "unit", "indices", "return_array", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbbnnOIOb:fuzzyMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &is_name_only, &sort_results, &is_and_mode, &begin, &end,
+                                      &py_digest, &unit, &py_indices, &return_array) )
+        return NULL;
+
+    if ( unit == 0 )
+    {
+        PyErr_SetString(PyExc_ValueError, "parameter `unit` must be greater than 0.");
+        return NULL;
+    }
+
+    if ( is_and_mode && return_array )
+    {
+        PyErr_SetString(PyExc_ValueError, "parameter `is_and_mode` and `return_array` can not be both True.");
+        return NULL;
+    }
+
+    if ( py_digest == Py_None )
+    {
+        py_digest = NULL;
+    }
+
+    if ( py_indices == Py_None )
+    {
+        py_indices = NULL;
+    }
+
+    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
+    if ( !pEngine )
+        return NULL;
+
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
+    {
+        py_source = pCorpus->py_source;
+    }
+    else if ( PyErr_Occurred() )
+    {
+        return NULL;
+    }
+    else if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a corpus.");
+        return NULL;
+    }
+    else
+    {
+        begin = 0;
+    }
+
+    uint32_t source_size = 0;
+    if ( py_indices )
+    {
+        if ( !pCorpus )
+        {
+            PyErr_SetString(PyExc_TypeError, "parameter `indices` can only be used if `source` is a corpus.");
+            return NULL;
+        }
+
+        Py_ssize_t index_count = PyObject_Length(py_indices);
+        if ( index_count < 0 )
+            return NULL;
+
+        source_size = (uint32_t)index_count;
+    }
+    else
+    {
+        source_size = (pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source)) / unit;
+    }
+
+    if ( source_size == 0 )
+    {
+        if ( return_array )
+        {
+            return Py_BuildValue("(NN)", createArray("f", NULL, 0), createArray("I", NULL, 0));
+        }
+        return Py_BuildValue("([],[])");
+    }
+
+    if ( setPatterns(pEngine, py_patternCtxt) < 0 )
         return NULL;
 
     pEngine->is_name_only = is_name_only;
@@ -737,17 +1924,53 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
         task_count = 1;
     }
 
-    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
-    if ( !pEngine->source )
+    /* if `source` is a corpus, use the strings in it directly */
+    FeString* source_buffer = NULL;
+    uint32_t* index_map = NULL;     /* a copy of `indices`, it is freed together with source_buffer */
+    if ( pCorpus && (py_digest || unit > 1 || py_indices) )
     {
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
+        source_buffer = (FeString*)malloc(source_size * (sizeof(FeString) + (py_indices ? sizeof(uint32_t) : 0)));
+        if ( !source_buffer )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        if ( py_indices )
+        {
+            index_map = (uint32_t*)(source_buffer + source_size);
+            if ( getIndices(py_indices, (uint32_t)end, source_size, index_map) < 0 )
+            {
+                free(source_buffer);
+                return NULL;
+            }
+        }
+        if ( getDigests(pCorpus, py_digest, (uint32_t)begin, (uint32_t)end, unit, index_map, source_size,
+                        source_buffer) < 0 )
+        {
+            free(source_buffer);
+            return NULL;
+        }
+        pEngine->source = source_buffer;
+    }
+    else if ( pCorpus )
+    {
+        pEngine->source = pCorpus->strings + begin;
+    }
+    else
+    {
+        source_buffer = (FeString*)malloc(source_size * sizeof(FeString));
+        if ( !source_buffer )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pEngine->source = source_buffer;
     }
 
     TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
     if ( !tasks )
     {
-        free(pEngine->source);
+        free(source_buffer);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
@@ -755,7 +1978,7 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
     pEngine->results = (FeResult*)malloc(source_size * sizeof(FeResult));
     if ( !pEngine->results )
     {
-        free(pEngine->source);
+        free(source_buffer);
         free(tasks);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
@@ -772,7 +1995,7 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
 #endif
         if ( !pEngine->threads )
         {
-            free(pEngine->source);
+            free(source_buffer);
             free(tasks);
             free(results);
             fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
@@ -790,7 +2013,7 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
             if ( ret != 0 )
 #endif
             {
-                free(pEngine->source);
+                free(source_buffer);
                 free(tasks);
                 free(results);
                 free(pEngine->threads);
@@ -810,240 +2033,206 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
         uint32_t offset = i * chunk_size;
         uint32_t length = MIN(chunk_size, source_size - offset);
 
-        tasks[i].function = GET_WEIGHT;
+        tasks[i].function = pEngine->pattern_count > 0 ? GET_AND_WEIGHT : GET_WEIGHT;
         tasks[i].offset = offset;
         tasks[i].length = length;
 
-        uint32_t j = 0;
-        for ( ; j < length; ++j )
+        if ( !pCorpus )
         {
-            FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            uint32_t j = 0;
+            for ( ; j < length; ++j )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
+                FeString *s = pEngine->source + offset + j;
+                PyObject* item = PyList_GET_ITEM(py_source, (offset + j) * unit);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+                {
+                    free(source_buffer);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
             }
         }
 
         QUEUE_PUT(pEngine->task_queue, tasks + i);
     }
 
+    uint32_t results_count = 0;
+    int32_t ret = 0;
+    uint8_t cancelled = 0;
+
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
+
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    uint32_t results_count = 0;
-    for ( i = 0; i < source_size; ++i )
+    /* the results are incomplete if the call is cancelled, see cancel() */
+    cancelled = pEngine->cancelled;
+    if ( !cancelled )
     {
-        if ( results[i].weight > MIN_WEIGHT )
-        {
-            if ( i > results_count )
-            {
-                results[results_count] = results[i];
-            }
-            ++results_count;
-        }
+        results_count = compactResults(results, source_size, pCorpus, (uint32_t)begin, unit, index_map);
     }
 
-    if ( results_count == 0 )
+    if ( results_count > 0 && sort_results )
     {
-        free(pEngine->source);
+        ret = sortResults(pEngine, tasks, task_count, results_count, 0);
+    }
+
+    Py_END_ALLOW_THREADS
+
+    if ( ret < 0 )
+    {
+        free(source_buffer);
         free(tasks);
         free(results);
-        return Py_BuildValue("([],[])");
+        return NULL;
     }
 
-    if ( sort_results )
+    if ( cancelled )
     {
-        if ( task_count == 1 || results_count < 60000 )
-        {
-            qsort(results, results_count, sizeof(FeResult), compare);
-        }
-        else
-        {
-            chunk_size = (results_count + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
-                chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-            }
-            task_count = (results_count + chunk_size - 1) / chunk_size;
-            FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
-            if ( !buffer )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-#if defined(_MSC_VER)
-            QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-            for ( i = 0; i < task_count; ++i )
-            {
-                uint32_t offset = i * chunk_size;
-                uint32_t length = MIN(chunk_size, results_count - offset);
-
-                tasks[i].function = Q_SORT;
-                tasks[i].offset = offset;
-                tasks[i].length = length;
-                QUEUE_PUT(pEngine->task_queue, tasks + i);
-            }
-
-            QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-            MergeTaskItem* merge_tasks = NULL;
-            merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
-            if ( !merge_tasks )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(buffer);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-
-            while ( chunk_size < results_count )
-            {
-                uint32_t q = results_count / (chunk_size << 1);
-                uint32_t r = results_count % (chunk_size << 1);
-#if defined(_MSC_VER)
-                QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
-#endif
-                for ( i = 0; i < q; ++i )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                if ( r > chunk_size )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = r - chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-                chunk_size <<= 1;
-            }
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        Py_RETURN_NONE;
+    }
 
-            free(buffer);
-            free(merge_tasks);
+    if ( results_count == 0 )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        if ( return_array )
+        {
+            return Py_BuildValue("(NN)", createArray("f", NULL, 0), createArray("I", NULL, 0));
         }
+        return Py_BuildValue("([],[])");
     }
 
-    weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
-    if ( !weights )
+    if ( return_array )
     {
-        free(pEngine->source);
+        PyObject* py_result = createResultArrays(results, results_count, (uint32_t)begin, unit, index_map);
+        free(source_buffer);
         free(tasks);
         free(results);
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
+        return py_result;
     }
-
-    PyObject* text_list = PyList_New(results_count);
-    if ( task_count == 1 || results_count < 40000 )
+    else if ( is_and_mode )
     {
+        PyObject* weight_list = PyList_New(results_count);
+        PyObject* index_list = PyList_New(results_count);
         for ( i = 0; i < results_count; ++i )
         {
-            weights[i] = results[i].weight;
             /* PyList_SET_ITEM() steals a reference to item.     */
-            /* PySequence_ITEM() return value: New reference. */
-            PyList_SET_ITEM(text_list, i, PySequence_ITEM(py_source, results[i].index));
+            PyList_SET_ITEM(weight_list, i, Py_BuildValue("f", results[i].weight));
+            PyList_SET_ITEM(index_list, i, Py_BuildValue("I", results[i].index));
         }
+
+        free(source_buffer);
+        free(tasks);
+        free(results);
+
+        return Py_BuildValue("(NN)", weight_list, index_list);
     }
     else
     {
-        chunk_size = (results_count + task_count - 1) / task_count;
-        if ( chunk_size < 8000 )
-        {
-            chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-        }
-        task_count = (results_count + chunk_size - 1) / chunk_size;
-
-        PySetTaskItem* py_set_tasks = NULL;
-        py_set_tasks = (PySetTaskItem*)malloc(task_count * sizeof(PySetTaskItem));
-        if ( !py_set_tasks )
+        weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
+        if ( !weights )
         {
-            free(pEngine->source);
+            free(source_buffer);
             free(tasks);
             free(results);
             fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
             return NULL;
         }
 
-#if defined(_MSC_VER)
-        QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-        for ( i = 0; i < task_count; ++i )
+        PyObject* index_list = PyList_New(results_count);
+        for ( i = 0; i < results_count; ++i )
         {
-            uint32_t offset = i * chunk_size;
-            uint32_t length = MIN(chunk_size, results_count - offset);
-
-            py_set_tasks[i].function = PY_SET_ITEM;
-            py_set_tasks[i].offset = offset;
-            py_set_tasks[i].length = length;
-            py_set_tasks[i].weights = weights;
-            py_set_tasks[i].text_list = text_list;
-            py_set_tasks[i].py_source = py_source;
-            QUEUE_PUT(pEngine->task_queue, py_set_tasks + i);
+            weights[i] = results[i].weight;
+            /* PyList_SET_ITEM() steals a reference to item.     */
+            /* PySequence_ITEM() return value: New reference. */
+            PyList_SET_ITEM(index_list, i, Py_BuildValue("I", results[i].index));
         }
 
-        QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+        free(source_buffer);
+        free(tasks);
+        free(results);
 
-        free(py_set_tasks);
+        return Py_BuildValue("(NN)", createWeights(weights), index_list);
     }
-
-    free(pEngine->source);
-    free(tasks);
-    free(results);
-
-    return Py_BuildValue("(NN)", createWeights(weights), text_list);
 }
 
 /**
- * fuzzyMatchEx(engine, source, pattern, is_name_only=False, sort_results=True, is_and_mode=False)
+ * refineMatch(engine, source, pattern, refine_pattern, refine_source=None, sort_results=True, begin=0, end=-1,
+ *             digest=None, refine_digest=None, unit=1)
  *
- * same as fuzzyMatch(), the only difference is the return value.
- * return a tuple, (a list of corresponding weight, a sorted list of index to items from `source` that match `pattern`).
+ * match in refinement mode, e.g., abc;def, `pattern` is the part before ';' and is matched against the
+ * name only, `refine_pattern` is the part after ';' and is matched against the full path.
+ * if `source` is a list, `refine_source` is a list of the same length, `source[i]` and `refine_source[i]`
+ * are the two parts of the i-th item.
+ * if `source` is a corpus, `digest` and `refine_digest` are the offsets of the two parts,
+ * see fuzzyMatchEx() for the details of `digest`, `begin`, `end` and `unit`.
+ *
+ * return a tuple, (a list of corresponding weight, a sorted list of index to items from `source` that match
+ * both patterns), the weight is the sum of the two weights.
  */
-static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObject* kwargs)
+static PyObject* fuzzyEngine_refineMatch(PyObject* self, PyObject* args, PyObject* kwargs)
 {
     PyObject* py_engine = NULL;
     PyObject* py_source = NULL;
     PyObject* py_patternCtxt = NULL;
-    uint8_t is_name_only = 0;
+    PyObject* py_refinePatternCtxt = NULL;
+    PyObject* py_refine_source = NULL;
     uint8_t sort_results = 1;
-    uint8_t is_and_mode = 0;
-    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "is_and_mode", NULL};
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    PyObject* py_digest = NULL;
+    PyObject* py_refine_digest = NULL;
+    uint32_t unit = 1;
+    static char* kwlist[] = {"engine", "source", "pattern", "refine_pattern", "refine_source", "sort_results",
+                             "begin", "end", "digest", "refine_digest", "unit", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOOO|ObnnOOI:refineMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &py_refinePatternCtxt, &py_refine_source, &sort_results,
+                                      &begin, &end, &py_digest, &py_refine_digest, &unit) )
+        return NULL;
 
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbb:fuzzyMatch", kwlist, &py_engine,
-                                      &py_source, &py_patternCtxt, &is_name_only, &sort_results, &is_and_mode) )
+    if ( unit == 0 )
+    {
+        PyErr_SetString(PyExc_ValueError, "parameter `unit` must be greater than 0.");
         return NULL;
+    }
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+        if ( !py_digest || py_digest == Py_None || !py_refine_digest || py_refine_digest == Py_None )
+        {
+            PyErr_SetString(PyExc_TypeError, "parameter `digest` and `refine_digest` are required for a corpus.");
+            return NULL;
+        }
+    }
+    else if ( PyErr_Occurred() )
+    {
+        return NULL;
+    }
+    else if ( !PyList_Check(py_source) || !py_refine_source || !PyList_Check(py_refine_source)
+              || PyList_Size(py_source) != PyList_Size(py_refine_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a corpus, or a list of the same length as `refine_source`.");
         return NULL;
     }
+    else
+    {
+        begin = 0;
+    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = (pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source)) / unit;
     if ( source_size == 0 )
     {
         return Py_BuildValue("([],[])");
@@ -1053,7 +2242,9 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
     if ( !pEngine->pPattern_ctxt )
         return NULL;
 
-    pEngine->is_name_only = is_name_only;
+    pEngine->pRefine_pattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_refinePatternCtxt, NULL);
+    if ( !pEngine->pRefine_pattern_ctxt )
+        return NULL;
 
     uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
     uint32_t chunk_size = (source_size + max_task_count - 1) / max_task_count;
@@ -1064,17 +2255,31 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
         task_count = 1;
     }
 
-    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
-    if ( !pEngine->source )
+    /* the first half is the parts before ';', the second half is the parts after ';' */
+    FeString* source_buffer = (FeString*)malloc(2 * source_size * sizeof(FeString));
+    if ( !source_buffer )
     {
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
+    pEngine->source = source_buffer;
+    pEngine->refine_source = source_buffer + source_size;
+
+    if ( pCorpus )
+    {
+        if ( getDigests(pCorpus, py_digest, (uint32_t)begin, (uint32_t)end, unit, NULL, 0, pEngine->source) < 0
+             || getDigests(pCorpus, py_refine_digest, (uint32_t)begin, (uint32_t)end, unit, NULL, 0,
+                           pEngine->refine_source) < 0 )
+        {
+            free(source_buffer);
+            return NULL;
+        }
+    }
 
     TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
     if ( !tasks )
     {
-        free(pEngine->source);
+        free(source_buffer);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
@@ -1082,7 +2287,7 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
     pEngine->results = (FeResult*)malloc(source_size * sizeof(FeResult));
     if ( !pEngine->results )
     {
-        free(pEngine->source);
+        free(source_buffer);
         free(tasks);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
@@ -1099,7 +2304,7 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
 #endif
         if ( !pEngine->threads )
         {
-            free(pEngine->source);
+            free(source_buffer);
             free(tasks);
             free(results);
             fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
@@ -1117,7 +2322,7 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
             if ( ret != 0 )
 #endif
             {
-                free(pEngine->source);
+                free(source_buffer);
                 free(tasks);
                 free(results);
                 free(pEngine->threads);
@@ -1137,266 +2342,404 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
         uint32_t offset = i * chunk_size;
         uint32_t length = MIN(chunk_size, source_size - offset);
 
-        tasks[i].function = GET_WEIGHT;
+        tasks[i].function = GET_REFINE_WEIGHT;
         tasks[i].offset = offset;
         tasks[i].length = length;
 
-        uint32_t j = 0;
-        for ( ; j < length; ++j )
+        if ( !pCorpus )
         {
-            FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            uint32_t j = 0;
+            for ( ; j < length; ++j )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
+                FeString *s = pEngine->source + offset + j;
+                FeString *r = pEngine->refine_source + offset + j;
+                PyObject* item = PyList_GET_ITEM(py_source, (offset + j) * unit);
+                PyObject* refine_item = PyList_GET_ITEM(py_refine_source, (offset + j) * unit);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0
+                     || pyObject_ToStringAndSize(refine_item, &r->str, &r->len) < 0 )
+                {
+                    free(source_buffer);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
             }
         }
 
         QUEUE_PUT(pEngine->task_queue, tasks + i);
     }
 
+    uint32_t results_count = 0;
+    int32_t ret = 0;
+    uint8_t cancelled = 0;
+
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
+
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    uint32_t results_count = 0;
-    for ( i = 0; i < source_size; ++i )
+    /* the results are incomplete if the call is cancelled, see cancel() */
+    cancelled = pEngine->cancelled;
+    if ( !cancelled )
     {
-        if ( results[i].weight > MIN_WEIGHT )
-        {
-            if ( i > results_count )
-            {
-                results[results_count] = results[i];
-            }
-            ++results_count;
-        }
+        results_count = compactResults(results, source_size, pCorpus, (uint32_t)begin, unit, NULL);
     }
 
-    if ( results_count == 0 )
+    if ( results_count > 0 && sort_results )
     {
-        free(pEngine->source);
+        ret = sortResults(pEngine, tasks, task_count, results_count, 0);
+    }
+
+    Py_END_ALLOW_THREADS
+
+    if ( ret < 0 )
+    {
+        free(source_buffer);
         free(tasks);
         free(results);
-        return Py_BuildValue("([],[])");
+        return NULL;
     }
 
-    if ( sort_results )
+    if ( cancelled )
     {
-        if ( task_count == 1 || results_count < 60000 )
-        {
-            qsort(results, results_count, sizeof(FeResult), compare);
-        }
-        else
-        {
-            chunk_size = (results_count + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
-                chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-            }
-            task_count = (results_count + chunk_size - 1) / chunk_size;
-            FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
-            if ( !buffer )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-#if defined(_MSC_VER)
-            QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-            for ( i = 0; i < task_count; ++i )
-            {
-                uint32_t offset = i * chunk_size;
-                uint32_t length = MIN(chunk_size, results_count - offset);
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        Py_RETURN_NONE;
+    }
 
-                tasks[i].function = Q_SORT;
-                tasks[i].offset = offset;
-                tasks[i].length = length;
-                QUEUE_PUT(pEngine->task_queue, tasks + i);
-            }
+    if ( results_count == 0 )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        return Py_BuildValue("([],[])");
+    }
 
-            QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+    weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
+    if ( !weights )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(results);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
 
-            MergeTaskItem* merge_tasks = NULL;
-            merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
-            if ( !merge_tasks )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(buffer);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
+    PyObject* index_list = PyList_New(results_count);
+    for ( i = 0; i < results_count; ++i )
+    {
+        weights[i] = results[i].weight;
+        /* PyList_SET_ITEM() steals a reference to item.     */
+        PyList_SET_ITEM(index_list, i, Py_BuildValue("I", results[i].index));
+    }
 
-            while ( chunk_size < results_count )
-            {
-                uint32_t q = results_count / (chunk_size << 1);
-                uint32_t r = results_count % (chunk_size << 1);
-#if defined(_MSC_VER)
-                QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
-#endif
-                for ( i = 0; i < q; ++i )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
+    free(source_buffer);
+    free(tasks);
+    free(results);
 
-                if ( r > chunk_size )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = r - chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
+    return Py_BuildValue("(NN)", createWeights(weights), index_list);
+}
 
-                QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+/**
+ * merge(tuple_a, tuple_b, top_k=0)
+ * tuple_a, tuple_b are the return value of fuzzyEngine_fuzzyMatch, or both are the return value
+ * of fuzzyEngine_guessMatch.
+ * if `top_k` is greater than 0, only the first `top_k` items of tuple_a and tuple_b are sorted,
+ * and only the first `top_k` items of the return value are sorted.
+ */
+static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
+{
+    PyObject* weight_list_a = NULL;
+    PyObject* text_list_a = NULL;
+    PyObject* weight_list_b = NULL;
+    PyObject* text_list_b = NULL;
+    uint32_t top_k = 0;
+    if ( !PyArg_ParseTuple(args, "(OO)(OO)|I:merge", &weight_list_a, &text_list_a,  &weight_list_b, &text_list_b, &top_k) )
+        return NULL;
 
-                chunk_size <<= 1;
-            }
+    uint32_t size_a = (uint32_t)PyList_Size(text_list_a);
+    if ( size_a == 0 )
+    {
+        return Py_BuildValue("(OO)", weight_list_b, text_list_b);
+    }
+    uint32_t size_b = (uint32_t)PyList_Size(text_list_b);
+    if ( size_b == 0 )
+    {
+        return Py_BuildValue("(OO)", weight_list_a, text_list_a);
+    }
 
-            free(buffer);
-            free(merge_tasks);
-        }
+    uint8_t is_path_weight = 0;
+    uint8_t is_path_weight_b = 0;
+    weight_t* weights_a = (weight_t*)getWeights(weight_list_a, &is_path_weight);
+    if ( !weights_a )
+        return NULL;
+    weight_t* weights_b = (weight_t*)getWeights(weight_list_b, &is_path_weight_b);
+    if ( !weights_b )
+        return NULL;
+    if ( is_path_weight != is_path_weight_b )
+    {
+        PyErr_SetString(PyExc_TypeError, "the weights of the tuples must be of the same type.");
+        return NULL;
     }
 
-    if ( is_and_mode )
+    weight_t* weights = (weight_t*)malloc((size_a + size_b) * sizeof(weight_t));
+    if ( !weights )
     {
-        PyObject* weight_list = PyList_New(results_count);
-        PyObject* index_list = PyList_New(results_count);
-        for ( i = 0; i < results_count; ++i )
-        {
-            /* PyList_SET_ITEM() steals a reference to item.     */
-            PyList_SET_ITEM(weight_list, i, Py_BuildValue("f", results[i].weight));
-            PyList_SET_ITEM(index_list, i, Py_BuildValue("I", results[i].index));
-        }
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
 
-        free(pEngine->source);
-        free(tasks);
-        free(results);
+    PyObject* text_list = PyList_New(size_a + size_b);
 
-        return Py_BuildValue("(NN)", weight_list, index_list);
+    uint32_t i = 0;
+    uint32_t j = 0;
+
+    /* merge the sorted part of the two lists, the rest items are appended */
+    uint32_t end_a = size_a;
+    uint32_t end_b = size_b;
+    uint32_t merge_count = size_a + size_b;
+    if ( top_k > 0 )
+    {
+        end_a = MIN(top_k, size_a);
+        end_b = MIN(top_k, size_b);
+        merge_count = top_k;
     }
-    else
+
+    while ( i + j < merge_count && i < end_a && j < end_b )
     {
-        weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
-        if ( !weights )
+        if ( isWeightGreater(weights_a, i, weights_b, j, is_path_weight) )
         {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
-            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-            return NULL;
+            memcpy(weights + i + j, weights_a + i, sizeof(weight_t));
+            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
+            ++i;
         }
-
-        PyObject* index_list = PyList_New(results_count);
-        for ( i = 0; i < results_count; ++i )
+        else
         {
-            weights[i] = results[i].weight;
-            /* PyList_SET_ITEM() steals a reference to item.     */
-            /* PySequence_ITEM() return value: New reference. */
-            PyList_SET_ITEM(index_list, i, Py_BuildValue("I", results[i].index));
+            memcpy(weights + i + j, weights_b + j, sizeof(weight_t));
+            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
+            ++j;
         }
+    }
+    while ( i + j < merge_count && i < end_a )
+    {
+        memcpy(weights + i + j, weights_a + i, sizeof(weight_t));
+        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
+        ++i;
+    }
+    while ( i + j < merge_count && j < end_b )
+    {
+        memcpy(weights + i + j, weights_b + j, sizeof(weight_t));
+        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
+        ++j;
+    }
+    /* these loops append the rest items of list a first, so can not be merged with the above ones */
+    while ( i < size_a )
+    {
+        memcpy(weights + i + j, weights_a + i, sizeof(weight_t));
+        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
+        ++i;
+    }
+    while ( j < size_b )
+    {
+        memcpy(weights + i + j, weights_b + j, sizeof(weight_t));
+        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
+        ++j;
+    }
 
-        free(pEngine->source);
-        free(tasks);
-        free(results);
-
-        return Py_BuildValue("(NN)", createWeights(weights), index_list);
+    if ( is_path_weight )
+    {
+        return Py_BuildValue("(NN)", createPathWeights((uint32_t*)weights), text_list);
     }
+
+    return Py_BuildValue("(NN)", createWeights(weights), text_list);
 }
 
 /**
- * merge(tuple_a, tuple_b)
- * tuple_a, tuple_b are the return value of fuzzyEngine_fuzzyMatch
+ * mergeArray(tuple_a, tuple_b)
+ * tuple_a, tuple_b are the return value of fuzzyMatchEx(..., return_array=True), i.e.,
+ * (array('f') of weight, array('I') of index), they are sorted in descending order of weight.
+ * return a new tuple of the same type that contains the items of both.
  */
-static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
+static PyObject* fuzzyEngine_mergeArray(PyObject* self, PyObject* args)
 {
-    PyObject* weight_list_a = NULL;
-    PyObject* text_list_a = NULL;
-    PyObject* weight_list_b = NULL;
-    PyObject* text_list_b = NULL;
-    if ( !PyArg_ParseTuple(args, "(OO)(OO):merge", &weight_list_a, &text_list_a,  &weight_list_b, &text_list_b) )
+    PyObject* py_arrays[4];
+    if ( !PyArg_ParseTuple(args, "(OO)(OO):mergeArray", &py_arrays[0], &py_arrays[1], &py_arrays[2], &py_arrays[3]) )
         return NULL;
 
-    uint32_t size_a = (uint32_t)PyList_Size(text_list_a);
-    if ( size_a == 0 )
+    Py_buffer views[4];
+    uint32_t i = 0;
+    for ( ; i < 4; ++i )
     {
-        return Py_BuildValue("(OO)", weight_list_b, text_list_b);
+        if ( PyObject_GetBuffer(py_arrays[i], &views[i], PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0 )
+            break;
+
+        if ( views[i].itemsize != sizeof(uint32_t) )
+        {
+            PyBuffer_Release(&views[i]);
+            PyErr_SetString(PyExc_TypeError, "the items of the tuples must be array('f') and array('I').");
+            break;
+        }
     }
-    uint32_t size_b = (uint32_t)PyList_Size(text_list_b);
-    if ( size_b == 0 )
+
+    if ( i < 4 || views[0].len != views[1].len || views[2].len != views[3].len )
     {
-        return Py_BuildValue("(OO)", weight_list_a, text_list_a);
+        if ( i == 4 )
+        {
+            PyErr_SetString(PyExc_ValueError, "the weights and the indices must have the same length.");
+        }
+        while ( i > 0 )
+        {
+            PyBuffer_Release(&views[--i]);
+        }
+        return NULL;
     }
 
-    weight_t* weights = (weight_t*)malloc((size_a + size_b) * sizeof(weight_t));
+    uint32_t size_a = (uint32_t)(views[0].len / sizeof(weight_t));
+    uint32_t size_b = (uint32_t)(views[2].len / sizeof(weight_t));
+    const weight_t* weights_a = (const weight_t*)views[0].buf;
+    const uint32_t* indices_a = (const uint32_t*)views[1].buf;
+    const weight_t* weights_b = (const weight_t*)views[2].buf;
+    const uint32_t* indices_b = (const uint32_t*)views[3].buf;
+
+    /* the weights are followed by the indices, one more item in case both are empty */
+    weight_t* weights = (weight_t*)malloc((size_a + size_b + 1) * (sizeof(weight_t) + sizeof(uint32_t)));
     if ( !weights )
     {
+        for ( i = 0; i < 4; ++i )
+        {
+            PyBuffer_Release(&views[i]);
+        }
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
+    uint32_t* indices = (uint32_t*)(weights + size_a + size_b);
 
-    PyObject* text_list = PyList_New(size_a + size_b);
-
-    uint32_t i = 0;
     uint32_t j = 0;
-
-    weight_t* weights_a = (weight_t*)PyCapsule_GetPointer(weight_list_a, NULL);
-    weight_t w_a = weights_a[i];
-    weight_t* weights_b = (weight_t*)PyCapsule_GetPointer(weight_list_b, NULL);
-    weight_t w_b = weights_b[j];
+    i = 0;
     while ( i < size_a && j < size_b )
     {
-        if ( w_a > w_b )
+        if ( weights_a[i] > weights_b[j] )
         {
             weights[i + j] = weights_a[i];
-            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
+            indices[i + j] = indices_a[i];
             ++i;
-            if ( i < size_a )
-            {
-                w_a = weights_a[i];
-            }
         }
         else
         {
             weights[i + j] = weights_b[j];
-            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
+            indices[i + j] = indices_b[j];
             ++j;
-            if ( j < size_b )
-            {
-                w_b = weights_b[j];
-            }
         }
     }
-    while ( i < size_a )
+    memcpy(weights + i + j, weights_a + i, (size_a - i) * sizeof(weight_t));
+    memcpy(indices + i + j, indices_a + i, (size_a - i) * sizeof(uint32_t));
+    memcpy(weights + size_a + j, weights_b + j, (size_b - j) * sizeof(weight_t));
+    memcpy(indices + size_a + j, indices_b + j, (size_b - j) * sizeof(uint32_t));
+
+    for ( i = 0; i < 4; ++i )
     {
-        weights[i + j] = weights_a[i];
-        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
-        ++i;
+        PyBuffer_Release(&views[i]);
     }
-    while ( j < size_b )
+
+    PyObject* py_weight_array = createArray("f", weights, (size_a + size_b) * sizeof(weight_t));
+    PyObject* py_index_array = createArray("I", indices, (size_a + size_b) * sizeof(uint32_t));
+    free(weights);
+    if ( !py_weight_array || !py_index_array )
     {
-        weights[i + j] = weights_b[j];
-        PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
-        ++j;
+        Py_XDECREF(py_weight_array);
+        Py_XDECREF(py_index_array);
+        return NULL;
     }
-    return Py_BuildValue("(NN)", createWeights(weights), text_list);
+
+    return Py_BuildValue("(NN)", py_weight_array, py_index_array);
+}
+
+/**
+ * sortResult(tuple, begin)
+ * `tuple` is the return value of fuzzyEngine_fuzzyMatch, fuzzyEngine_guessMatch or fuzzyEngine_merge
+ * called with `top_k`,
+ * sort the items from index `begin` in descending order of weight, the items before `begin` must
+ * have been sorted and not less than the rest ones.
+ * return a new tuple, (a list of corresponding weight, a sorted list of items).
+ */
+static PyObject* fuzzyEngine_sortResult(PyObject* self, PyObject* args)
+{
+    PyObject* weight_list = NULL;
+    PyObject* text_list = NULL;
+    uint32_t begin = 0;
+    if ( !PyArg_ParseTuple(args, "(OO)I:sortResult", &weight_list, &text_list, &begin) )
+        return NULL;
+
+    uint32_t size = (uint32_t)PyList_Size(text_list);
+    if ( begin + 1 >= size )
+    {
+        return Py_BuildValue("(OO)", weight_list, text_list);
+    }
+
+    uint8_t is_path_weight = 0;
+    weight_t* weights_a = (weight_t*)getWeights(weight_list, &is_path_weight);
+    if ( !weights_a )
+        return NULL;
+
+    weight_t* weights = (weight_t*)malloc(size * sizeof(weight_t));
+    if ( !weights )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    uint32_t results_count = size - begin;
+    FeResult* results = (FeResult*)malloc(results_count * sizeof(FeResult));
+    if ( !results )
+    {
+        free(weights);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    uint32_t i = 0;
+    for ( ; i < results_count; ++i )
+    {
+        /* weight and path_weight share the same 4 bytes */
+        memcpy(&results[i].weight, weights_a + begin + i, sizeof(weight_t));
+        results[i].index = begin + i;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    qsort(results, results_count, sizeof(FeResult), is_path_weight ? compare2 : compare);
+    Py_END_ALLOW_THREADS
+
+    PyObject* sorted_list = PyList_New(size);
+    for ( i = 0; i < size; ++i )
+    {
+        uint32_t index = i;
+        if ( i >= begin )
+        {
+            index = results[i - begin].index;
+        }
+        memcpy(weights + i, weights_a + index, sizeof(weight_t));
+        PyObject* item = PyList_GET_ITEM(text_list, index);
+        Py_INCREF(item);
+        /* PyList_SET_ITEM() steals a reference to item.     */
+        PyList_SET_ITEM(sorted_list, i, item);
+    }
+
+    free(results);
+
+    if ( is_path_weight )
+    {
+        return Py_BuildValue("(NN)", createPathWeights((uint32_t*)weights), sorted_list);
+    }
+
+    return Py_BuildValue("(NN)", createWeights(weights), sorted_list);
 }
 /**
- * getHighlights(engine, source, pattern, is_name_only=False)
+ * getHighlights(engine, source, pattern, is_name_only=False, begin=0, end=-1)
  *
  * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
+ * `source`, `begin` and `end` are the same as those of fuzzyMatch().
  *
  * return a list of list of pair [col, length], where `col` is the column number(start from 1, the value must
  * correspond to the byte index of `text`) and `length` is the length of the highlight in bytes.
@@ -1405,6 +2748,7 @@ static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
  *          [ [3,2], [5,2], [9,3], ... ],
  *          ...
  *       ]
+ * if `pattern` is a list of patterns, return a list of the above for each pattern.
  *  NOTE: this function must be called after fuzzyMatch() is called, because this function assume that all the
  *  texts in `source` match `pattern` and all the threads in FuzzyEngine have already been started.
  */
@@ -1414,53 +2758,80 @@ static PyObject* fuzzyEngine_getHighlights(PyObject* self, PyObject* args, PyObj
     PyObject* py_patternCtxt = NULL;
     PyObject* py_engine = NULL;
     uint8_t is_name_only = 0;
-    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", NULL};
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "begin", "end", NULL};
 
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|b:fuzzyMatch", kwlist, &py_engine,
-                                      &py_source, &py_patternCtxt, &is_name_only) )
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bnn:fuzzyMatch", kwlist, &py_engine,
+                                      &py_source, &py_patternCtxt, &is_name_only, &begin, &end) )
         return NULL;
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+        py_source = pCorpus->py_source;
+    }
+    else if ( PyErr_Occurred() )
+    {
+        return NULL;
+    }
+    else if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a corpus.");
         return NULL;
     }
+    else
+    {
+        begin = 0;
+    }
 
-    pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
-    if ( !pEngine->pPattern_ctxt )
+    if ( setPatterns(pEngine, py_patternCtxt) < 0 )
         return NULL;
 
+    /* the highlights of the patterns of each item are stored consecutively */
+    uint32_t pattern_count = pEngine->pattern_count > 0 ? pEngine->pattern_count : 1;
+
     pEngine->is_name_only = is_name_only;
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source);
 
     uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
     uint32_t chunk_size = (source_size + max_task_count - 1) / max_task_count;
     uint32_t task_count = (source_size + chunk_size - 1) / chunk_size;
 
-    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
-    if ( !pEngine->source )
+    /* if `source` is a corpus, use the strings in it directly */
+    FeString* source_buffer = NULL;
+    if ( pCorpus )
     {
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
+        pEngine->source = pCorpus->strings + begin;
+    }
+    else
+    {
+        source_buffer = (FeString*)malloc(source_size * sizeof(FeString));
+        if ( !source_buffer )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pEngine->source = source_buffer;
     }
 
     TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
     if ( !tasks )
     {
-        free(pEngine->source);
+        free(source_buffer);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
 
-    pEngine->highlights = (HighlightGroup**)malloc(source_size * sizeof(HighlightGroup*));
+    pEngine->highlights = (HighlightGroup**)malloc(source_size * pattern_count * sizeof(HighlightGroup*));
     if ( !pEngine->highlights )
     {
-        free(pEngine->source);
+        free(source_buffer);
         free(tasks);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
@@ -1476,41 +2847,59 @@ static PyObject* fuzzyEngine_getHighlights(PyObject* self, PyObject* args, PyObj
         uint32_t offset = i * chunk_size;
         uint32_t length = MIN(chunk_size, source_size - offset);
 
-        tasks[i].function = GET_HIGHLIGHTS;
+        tasks[i].function = pEngine->pattern_count > 0 ? GET_AND_HIGHLIGHTS : GET_HIGHLIGHTS;
         tasks[i].offset = offset;
         tasks[i].length = length;
 
-        uint32_t j = 0;
-        for ( ; j < length; ++j )
+        if ( !pCorpus )
         {
-            FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            uint32_t j = 0;
+            for ( ; j < length; ++j )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(pEngine->highlights);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
+                FeString *s = pEngine->source + offset + j;
+                PyObject* item = PyList_GET_ITEM(py_source, offset + j);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+                {
+                    free(source_buffer);
+                    free(tasks);
+                    free(pEngine->highlights);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
             }
         }
 
         QUEUE_PUT(pEngine->task_queue, tasks + i);
     }
 
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+    Py_END_ALLOW_THREADS
 
-    PyObject* res = PyList_New(source_size);
-    for ( i = 0; i < source_size; ++i )
+    PyObject* res = NULL;
+    if ( pEngine->pattern_count > 0 )
+    {
+        res = PyList_New(pattern_count);
+        for ( i = 0; i < pattern_count; ++i )
+        {
+            PyList_SetItem(res, i, PyList_New(source_size));
+        }
+    }
+    else
+    {
+        res = PyList_New(source_size);
+    }
+
+    int32_t error = 0;
+    for ( i = 0; i < source_size * pattern_count; ++i )
     {
         HighlightGroup* pGroup = pEngine->highlights[i];
-        if ( !pGroup )
+        if ( !pGroup || error )
         {
-            free(pEngine->source);
-            free(tasks);
-            free(pEngine->highlights);
-            Py_XDECREF(res);
-            return NULL;
+            error = 1;
+            free(pGroup);
+            continue;
         }
 
         PyObject* list = PyList_New(pGroup->end_index);
@@ -1519,11 +2908,27 @@ static PyObject* fuzzyEngine_getHighlights(PyObject* self, PyObject* args, PyObj
         {
             PyList_SetItem(list, j, Py_BuildValue("[H,H]", pGroup->positions[j].col, pGroup->positions[j].len));
         }
-        PyList_SetItem(res, i, list);
+        if ( pEngine->pattern_count > 0 )
+        {
+            PyList_SetItem(PyList_GET_ITEM(res, i % pattern_count), i / pattern_count, list);
+        }
+        else
+        {
+            PyList_SetItem(res, i, list);
+        }
         free(pGroup);
     }
 
-    free(pEngine->source);
+    if ( error )
+    {
+        free(source_buffer);
+        free(tasks);
+        free(pEngine->highlights);
+        Py_XDECREF(res);
+        return NULL;
+    }
+
+    free(source_buffer);
     free(tasks);
     free(pEngine->highlights);
 
@@ -1531,14 +2936,16 @@ static PyObject* fuzzyEngine_getHighlights(PyObject* self, PyObject* args, PyObj
 }
 
 /**
- * guessMatch(engine, source, filename, suffix, dirname, icon, sort_results=True)
+ * guessMatch(engine, source, filename, suffix, dirname, icon, sort_results=True, begin=0, end=-1, top_k=0)
  *
+ * `source`, `begin`, `end` and `top_k` are the same as those of fuzzyMatch().
  * e.g., /usr/src/example.tar.gz
  * `filename` is "example.tar"
  * `suffix` is ".gz"
  * `dirname` is "/usr/src"
  *
  * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
+ * the weights are path weights, they can only be passed to merge() and sortResult() with other path weights.
  */
 static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject* kwargs)
 {
@@ -1549,23 +2956,41 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
     const char* dirname = NULL;
     PyObject* py_icon = NULL;
     uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "filename", "suffix", "dirname", "icon", "sort_results", NULL};
-
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOsssO|b:guessMatch", kwlist, &py_engine,
-                                      &py_source, &filename, &suffix, &dirname, &py_icon, &sort_results) )
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    uint32_t top_k = 0;
+    static char* kwlist[] = {"engine", "source", "filename", "suffix", "dirname", "icon", "sort_results",
+                             "begin", "end", "top_k", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOsssO|bnnI:guessMatch", kwlist, &py_engine, &py_source,
+                                      &filename, &suffix, &dirname, &py_icon, &sort_results, &begin, &end,
+                                      &top_k) )
         return NULL;
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+        py_source = pCorpus->py_source;
+    }
+    else if ( PyErr_Occurred() )
+    {
+        return NULL;
+    }
+    else if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a corpus.");
         return NULL;
     }
+    else
+    {
+        begin = 0;
+    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source);
     if ( source_size == 0 )
     {
         return Py_BuildValue("([],[])");
@@ -1676,14 +3101,21 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
         for ( ; j < length; ++j )
         {
             FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            if ( pCorpus )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
+                *s = pCorpus->strings[begin + offset + j];
+            }
+            else
+            {
+                PyObject* item = PyList_GET_ITEM(py_source, offset + j);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+                {
+                    free(pEngine->source);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
             }
 
             if ( icon_len > 0 )
@@ -1696,94 +3128,33 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
         QUEUE_PUT(pEngine->task_queue, tasks + i);
     }
 
+    int32_t ret = 0;
+
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
+
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
     if ( sort_results )
     {
-        if ( task_count == 1 || source_size < 60000 )
+        if ( top_k > 0 && top_k < source_size )
         {
-            qsort(results, source_size, sizeof(FeResult), compare2);
+            selectTopK(results, source_size, top_k, 1);
         }
         else
         {
-            chunk_size = (source_size + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
-                chunk_size = (source_size + (task_count >> 1) - 1) / (task_count >> 1);
-            }
-            task_count = (source_size + chunk_size - 1) / chunk_size;
-            FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
-            if ( !buffer )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-#if defined(_MSC_VER)
-            QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-            for ( i = 0; i < task_count; ++i )
-            {
-                uint32_t offset = i * chunk_size;
-                uint32_t length = MIN(chunk_size, source_size - offset);
-
-                tasks[i].function = Q_SORT_2;
-                tasks[i].offset = offset;
-                tasks[i].length = length;
-                QUEUE_PUT(pEngine->task_queue, tasks + i);
-            }
-
-            QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-            MergeTaskItem* merge_tasks = NULL;
-            merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
-            if ( !merge_tasks )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(buffer);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-
-            while ( chunk_size < source_size )
-            {
-                uint32_t q = source_size / (chunk_size << 1);
-                uint32_t r = source_size % (chunk_size << 1);
-#if defined(_MSC_VER)
-                QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
-#endif
-                for ( i = 0; i < q; ++i )
-                {
-                    merge_tasks[i].function = MERGE_2;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                if ( r > chunk_size )
-                {
-                    merge_tasks[i].function = MERGE_2;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = r - chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+            ret = sortResults(pEngine, tasks, task_count, source_size, 1);
+        }
+    }
 
-                chunk_size <<= 1;
-            }
+    Py_END_ALLOW_THREADS
 
-            free(buffer);
-            free(merge_tasks);
-        }
+    if ( ret < 0 )
+    {
+        free(pEngine->source);
+        free(tasks);
+        free(results);
+        return NULL;
     }
 
     uint32_t* path_weights = (uint32_t*)malloc(source_size * sizeof(uint32_t));
@@ -1797,63 +3168,20 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
     }
 
     PyObject* text_list = PyList_New(source_size);
-    if ( task_count == 1 || source_size < 40000 )
-    {
-        for ( i = 0; i < source_size; ++i )
-        {
-            path_weights[i] = results[i].path_weight;
-            /* PyList_SET_ITEM() steals a reference to item.     */
-            /* PySequence_ITEM() return value: New reference. */
-            PyList_SET_ITEM(text_list, i, PySequence_ITEM(py_source, results[i].index));
-        }
-    }
-    else
+    for ( i = 0; i < source_size; ++i )
     {
-        chunk_size = (source_size + task_count - 1) / task_count;
-        if ( chunk_size < 8000 )
-        {
-            chunk_size = (source_size + (task_count >> 1) - 1) / (task_count >> 1);
-        }
-        task_count = (source_size + chunk_size - 1) / chunk_size;
-
-        PySetTaskItem* py_set_tasks = NULL;
-        py_set_tasks = (PySetTaskItem*)malloc(task_count * sizeof(PySetTaskItem));
-        if ( !py_set_tasks )
-        {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
-            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-            return NULL;
-        }
-
-#if defined(_MSC_VER)
-        QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-        for ( i = 0; i < task_count; ++i )
-        {
-            uint32_t offset = i * chunk_size;
-            uint32_t length = MIN(chunk_size, source_size - offset);
-
-            py_set_tasks[i].function = PY_SET_ITEM_2;
-            py_set_tasks[i].offset = offset;
-            py_set_tasks[i].length = length;
-            py_set_tasks[i].path_weights = path_weights;
-            py_set_tasks[i].text_list = text_list;
-            py_set_tasks[i].py_source = py_source;
-            QUEUE_PUT(pEngine->task_queue, py_set_tasks + i);
-        }
-
-        QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-        free(py_set_tasks);
+        path_weights[i] = results[i].path_weight;
+        PyObject* item = PyList_GET_ITEM(py_source, begin + results[i].index);
+        Py_INCREF(item);
+        /* PyList_SET_ITEM() steals a reference to item.     */
+        PyList_SET_ITEM(text_list, i, item);
     }
 
     free(pEngine->source);
     free(tasks);
     free(results);
 
-    return Py_BuildValue("(NN)", createWeights(path_weights), text_list);
+    return Py_BuildValue("(NN)", createPathWeights(path_weights), text_list);
 }
 
 enum
@@ -1863,6 +3191,7 @@ enum
     Category_File,
     Category_Gtags,
     Category_Line,
+    Category_Digest,
 };
 
 typedef struct RgParameter
@@ -1885,6 +3214,25 @@ typedef struct GtagsParameter
     uint32_t match_path;
 }GtagsParameter;
 
+/**
+ * describe the digest of a string the same way as python does, i.e.,
+ * text = text[skip:]
+ * if separator: text = (text.rsplit if reverse else text.split)(separator, maxsplit)[field]
+ * text = text[:len(text) - trim]
+ * if rstrip: text = text.rstrip()
+ */
+typedef struct DigestParameter
+{
+    uint32_t skip;          /* in characters */
+    int32_t maxsplit;       /* -1 means no limit */
+    int32_t field;          /* negative value counts from the end */
+    uint32_t reverse;
+    uint32_t trim;          /* in characters */
+    uint32_t rstrip;
+    uint32_t separator_len;
+    char separator[1];
+}DigestParameter;
+
 static void delParamObj(PyObject* obj)
 {
     free(PyCapsule_GetPointer(obj, NULL));
@@ -1962,6 +3310,52 @@ static PyObject* fuzzyEngine_createGtagsParameter(PyObject* self, PyObject* args
     return PyCapsule_New(param, NULL, delParamObj);
 }
 
+/**
+ * createDigestParameter(separator="", maxsplit=-1, field=0, reverse=False, skip=0, trim=0, rstrip=False)
+ *
+ * the digest of a string is text[skip:], split by `separator` if it is not empty,
+ * `field` is the index of the part in the list returned by text.split(separator, maxsplit),
+ * or text.rsplit(separator, maxsplit) if `reverse` is True.
+ * `trim` characters are removed from the end of the digest, and then the trailing whitespace
+ * is removed if `rstrip` is True.
+ * if there is no such field, the digest is empty.
+ */
+static PyObject* fuzzyEngine_createDigestParameter(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    const char* separator = "";
+    Py_ssize_t separator_len = 0;
+    int32_t maxsplit = -1;
+    int32_t field = 0;
+    uint8_t reverse = 0;
+    uint32_t skip = 0;
+    uint32_t trim = 0;
+    uint8_t rstrip = 0;
+    static char* kwlist[] = {"separator", "maxsplit", "field", "reverse", "skip", "trim", "rstrip", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "|s#iibIIb:createDigestParameter", kwlist, &separator,
+                                      &separator_len, &maxsplit, &field, &reverse, &skip, &trim, &rstrip) )
+        return NULL;
+
+    /* the separator is copied, it must outlive the python string */
+    DigestParameter* param = (DigestParameter*)malloc(sizeof(DigestParameter) + separator_len);
+    if ( !param )
+    {
+        return NULL;
+    }
+
+    param->skip = skip;
+    param->maxsplit = maxsplit;
+    param->field = field;
+    param->reverse = reverse;
+    param->trim = trim;
+    param->rstrip = rstrip;
+    param->separator_len = (uint32_t)separator_len;
+    memcpy(param->separator, separator, separator_len);
+    param->separator[separator_len] = '\0';
+
+    return PyCapsule_New(param, NULL, delParamObj);
+}
+
 static void rg_getDigest(char** str, uint32_t* length, RgParameter* param)
 {
     char* s = *str;
@@ -2131,10 +3525,137 @@ static void line_getDigest(char** str, uint32_t* length, Parameter* param)
 }
 
 /**
- * fuzzyMatchPart(engine, source, pattern, category, param, is_name_only=False, sort_results=True)
+ * return the first occurrence of the separator in [begin, end),
+ * or the last one if `reverse` is nonzero, NULL if not found.
+ */
+static char* findSeparator(char* begin, char* end, DigestParameter* param, uint32_t reverse)
+{
+    uint32_t sep_len = param->separator_len;
+    if ( (uint32_t)(end - begin) < sep_len )
+        return NULL;
+
+    if ( reverse )
+    {
+        char* p = end - sep_len;
+        for ( ; p >= begin; --p )
+        {
+            if ( *p == param->separator[0] && memcmp(p, param->separator, sep_len) == 0 )
+                return p;
+        }
+    }
+    else
+    {
+        char* last = end - sep_len;
+        char* p = begin;
+        for ( ; p <= last; ++p )
+        {
+            if ( *p == param->separator[0] && memcmp(p, param->separator, sep_len) == 0 )
+                return p;
+        }
+    }
+
+    return NULL;
+}
+
+static void digest_getDigest(char** str, uint32_t* length, DigestParameter* param)
+{
+    char* s = *str;
+    char* end = s + *length;
+    uint32_t i = 0;
+
+    for ( ; i < param->skip && s < end; ++i )
+    {
+        ++s;
+        while ( s < end && ((uint8_t)*s & 0xC0) == 0x80 )
+            ++s;
+    }
+
+    if ( param->separator_len > 0 )
+    {
+        uint32_t sep_len = param->separator_len;
+        uint32_t count = 0;
+        char* p = NULL;
+        char* q = NULL;
+
+        /* count the separators that take part in splitting */
+        if ( param->reverse )
+        {
+            q = end;
+            while ( (param->maxsplit < 0 || count < (uint32_t)param->maxsplit)
+                    && (p = findSeparator(s, q, param, 1)) != NULL )
+            {
+                ++count;
+                q = p;
+            }
+        }
+        else
+        {
+            q = s;
+            while ( (param->maxsplit < 0 || count < (uint32_t)param->maxsplit)
+                    && (p = findSeparator(q, end, param, 0)) != NULL )
+            {
+                ++count;
+                q = p + sep_len;
+            }
+        }
+
+        int64_t field = param->field < 0 ? (int64_t)param->field + count + 1 : param->field;
+        if ( field < 0 || field > (int64_t)count )
+        {
+            *length = 0;
+            return;
+        }
+
+        if ( param->reverse )
+        {
+            /* the fields are counted from the end */
+            uint32_t k = count - (uint32_t)field;
+            for ( i = 0; i < k; ++i )
+            {
+                end = findSeparator(s, end, param, 1);
+            }
+            if ( k < count )
+            {
+                s = findSeparator(s, end, param, 1) + sep_len;
+            }
+        }
+        else
+        {
+            for ( i = 0; i < (uint32_t)field; ++i )
+            {
+                s = findSeparator(s, end, param, 0) + sep_len;
+            }
+            if ( (uint32_t)field < count )
+            {
+                end = findSeparator(s, end, param, 0);
+            }
+        }
+    }
+
+    for ( i = 0; i < param->trim && end > s; ++i )
+    {
+        --end;
+        while ( end > s && ((uint8_t)*end & 0xC0) == 0x80 )
+            --end;
+    }
+
+    if ( param->rstrip )
+    {
+        while ( end > s && isspace((uint8_t)end[-1]) )
+            --end;
+    }
+
+    *str = s;
+    *length = (uint32_t)(end - s);
+}
+
+/**
+ * fuzzyMatchPart(engine, source, pattern, category, param, is_name_only=False, sort_results=True, begin=0, end=-1,
+ *                top_k=0, indices=None, return_array=False)
  *
  * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
  * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
+ * `source`, `begin`, `end`, `top_k`, `indices` and `return_array` are the same as those of fuzzyMatch().
  *
  * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
  */
@@ -2147,25 +3668,78 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
     uint32_t category;
     uint8_t is_name_only = 0;
     uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "pattern", "category", "param", "is_name_only", "sort_results", NULL};
-
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOOIO|bb:fuzzyMatch", kwlist, &py_engine, &py_source,
-                                      &py_patternCtxt, &category, &py_param, &is_name_only, &sort_results) )
+    Py_ssize_t begin = 0;
+    Py_ssize_t end = -1;
+    uint32_t top_k = 0;
+    PyObject* py_indices = NULL;
+    uint8_t return_array = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "category", "param", "is_name_only", "sort_results",
+                             "begin", "end", "top_k", "indices", "return_array", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOOIO|bbnnIOb:fuzzyMatch", kwlist, &py_engine, &py_source, &py_patternCtxt,
+                                      &category, &py_param, &is_name_only, &sort_results, &begin, &end, &top_k,
+                                      &py_indices, &return_array) )
         return NULL;
 
+    if ( py_indices == Py_None )
+    {
+        py_indices = NULL;
+    }
+
+    if ( return_array )
+    {
+        top_k = 0;
+    }
+
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
+    FeCorpus* pCorpus = getCorpus(py_source, &begin, &end);
+    if ( pCorpus )
+    {
+        py_source = pCorpus->py_source;
+    }
+    else if ( PyErr_Occurred() )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
         return NULL;
     }
+    else if ( !PyList_Check(py_source) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a corpus.");
+        return NULL;
+    }
+    else
+    {
+        begin = 0;
+    }
+
+    uint32_t source_size = 0;
+    if ( py_indices )
+    {
+        if ( !pCorpus )
+        {
+            PyErr_SetString(PyExc_TypeError, "parameter `indices` can only be used if `source` is a corpus.");
+            return NULL;
+        }
+
+        Py_ssize_t index_count = PyObject_Length(py_indices);
+        if ( index_count < 0 )
+            return NULL;
+
+        source_size = (uint32_t)index_count;
+    }
+    else
+    {
+        source_size = pCorpus ? (uint32_t)(end - begin) : (uint32_t)PyList_Size(py_source);
+    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
     if ( source_size == 0 )
     {
+        if ( return_array )
+        {
+            return createResultArrays(NULL, 0, 0, 1, NULL);
+        }
         return Py_BuildValue("([],[])");
     }
 
@@ -2184,13 +3758,25 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
         task_count = 1;
     }
 
-    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
+    /* a copy of `indices` follows the strings, it is freed together with them */
+    pEngine->source = (FeString*)malloc(source_size * (sizeof(FeString) + (py_indices ? sizeof(uint32_t) : 0)));
     if ( !pEngine->source )
     {
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
 
+    uint32_t* index_map = NULL;
+    if ( py_indices )
+    {
+        index_map = (uint32_t*)(pEngine->source + source_size);
+        if ( getIndices(py_indices, (uint32_t)end, source_size, index_map) < 0 )
+        {
+            free(pEngine->source);
+            return NULL;
+        }
+    }
+
     TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
     if ( !tasks )
     {
@@ -2265,14 +3851,21 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
         for ( ; j < length; ++j )
         {
             FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            if ( pCorpus )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
+                *s = pCorpus->strings[index_map ? index_map[offset + j] : begin + offset + j];
+            }
+            else
+            {
+                PyObject* item = PyList_GET_ITEM(py_source, offset + j);
+                if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+                {
+                    free(pEngine->source);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                    return NULL;
+                }
             }
 
             switch ( category )
@@ -2314,121 +3907,87 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
             case Category_Line:
                 line_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
                 break;
+            case Category_Digest:
+            {
+                DigestParameter* param = (DigestParameter*)PyCapsule_GetPointer(py_param, NULL);
+                if ( !param )
+                {
+                    free(pEngine->source);
+                    free(tasks);
+                    free(results);
+                    fprintf(stderr, "PyCapsule_GetPointer error!\n");
+                    return NULL;
+                }
+                digest_getDigest(&s->str, &s->len, param);
+                break;
+            }
             }
         }
 
         QUEUE_PUT(pEngine->task_queue, tasks + i);
     }
 
+    uint32_t results_count = 0;
+    int32_t ret = 0;
+    uint8_t cancelled = 0;
+
+    /* the worker threads do not touch any python object, so release the GIL while waiting for them */
+    Py_BEGIN_ALLOW_THREADS
+
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    uint32_t results_count = 0;
-    for ( i = 0; i < source_size; ++i )
+    /* the results are incomplete if the call is cancelled, see cancel() */
+    cancelled = pEngine->cancelled;
+    if ( !cancelled )
     {
-        if ( results[i].weight > MIN_WEIGHT )
+        results_count = compactResults(results, source_size, pCorpus, (uint32_t)begin, 1, index_map);
+    }
+
+    if ( results_count > 0 && sort_results )
+    {
+        if ( top_k > 0 && top_k < results_count )
         {
-            if ( i > results_count )
-            {
-                results[results_count] = results[i];
-            }
-            ++results_count;
+            selectTopK(results, results_count, top_k, 0);
+        }
+        else
+        {
+            ret = sortResults(pEngine, tasks, task_count, results_count, 0);
         }
     }
 
-    if ( results_count == 0 )
+    Py_END_ALLOW_THREADS
+
+    if ( ret < 0 )
     {
         free(pEngine->source);
         free(tasks);
         free(results);
-        return Py_BuildValue("([],[])");
+        return NULL;
     }
 
-    if ( sort_results )
+    if ( cancelled )
     {
-        if ( task_count == 1 || results_count < 60000 )
-        {
-            qsort(results, results_count, sizeof(FeResult), compare);
-        }
-        else
-        {
-            chunk_size = (results_count + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
-                chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-            }
-            task_count = (results_count + chunk_size - 1) / chunk_size;
-            FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
-            if ( !buffer )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-#if defined(_MSC_VER)
-            QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-            for ( i = 0; i < task_count; ++i )
-            {
-                uint32_t offset = i * chunk_size;
-                uint32_t length = MIN(chunk_size, results_count - offset);
-
-                tasks[i].function = Q_SORT;
-                tasks[i].offset = offset;
-                tasks[i].length = length;
-                QUEUE_PUT(pEngine->task_queue, tasks + i);
-            }
-
-            QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-            MergeTaskItem* merge_tasks = NULL;
-            merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
-            if ( !merge_tasks )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(buffer);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-
-            while ( chunk_size < results_count )
-            {
-                uint32_t q = results_count / (chunk_size << 1);
-                uint32_t r = results_count % (chunk_size << 1);
-#if defined(_MSC_VER)
-                QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
-#endif
-                for ( i = 0; i < q; ++i )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                if ( r > chunk_size )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = r - chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
-
-                QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+        free(pEngine->source);
+        free(tasks);
+        free(results);
+        Py_RETURN_NONE;
+    }
 
-                chunk_size <<= 1;
-            }
+    if ( return_array )
+    {
+        PyObject* py_result = createResultArrays(results, results_count, (uint32_t)begin, 1, index_map);
+        free(pEngine->source);
+        free(tasks);
+        free(results);
+        return py_result;
+    }
 
-            free(buffer);
-            free(merge_tasks);
-        }
+    if ( results_count == 0 )
+    {
+        free(pEngine->source);
+        free(tasks);
+        free(results);
+        return Py_BuildValue("([],[])");
     }
 
     weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
@@ -2442,56 +4001,13 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
     }
 
     PyObject* text_list = PyList_New(results_count);
-    if ( task_count == 1 || results_count < 40000 )
-    {
-        for ( i = 0; i < results_count; ++i )
-        {
-            weights[i] = results[i].weight;
-            /* PyList_SET_ITEM() steals a reference to item.     */
-            /* PySequence_ITEM() return value: New reference. */
-            PyList_SET_ITEM(text_list, i, PySequence_ITEM(py_source, results[i].index));
-        }
-    }
-    else
+    for ( i = 0; i < results_count; ++i )
     {
-        chunk_size = (results_count + task_count - 1) / task_count;
-        if ( chunk_size < 8000 )
-        {
-            chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-        }
-        task_count = (results_count + chunk_size - 1) / chunk_size;
-
-        PySetTaskItem* py_set_tasks = NULL;
-        py_set_tasks = (PySetTaskItem*)malloc(task_count * sizeof(PySetTaskItem));
-        if ( !py_set_tasks )
-        {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
-            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-            return NULL;
-        }
-
-#if defined(_MSC_VER)
-        QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-        for ( i = 0; i < task_count; ++i )
-        {
-            uint32_t offset = i * chunk_size;
-            uint32_t length = MIN(chunk_size, results_count - offset);
-
-            py_set_tasks[i].function = PY_SET_ITEM;
-            py_set_tasks[i].offset = offset;
-            py_set_tasks[i].length = length;
-            py_set_tasks[i].weights = weights;
-            py_set_tasks[i].text_list = text_list;
-            py_set_tasks[i].py_source = py_source;
-            QUEUE_PUT(pEngine->task_queue, py_set_tasks + i);
-        }
-
-        QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
-
-        free(py_set_tasks);
+        weights[i] = results[i].weight;
+        PyObject* item = PyList_GET_ITEM(py_source, begin + results[i].index);
+        Py_INCREF(item);
+        /* PyList_SET_ITEM() steals a reference to item.     */
+        PyList_SET_ITEM(text_list, i, item);
     }
 
     free(pEngine->source);
@@ -2505,16 +4021,23 @@ static PyMethodDef fuzzyEngine_Methods[] =
 {
     { "createFuzzyEngine", (PyCFunction)fuzzyEngine_createFuzzyEngine, METH_VARARGS | METH_KEYWORDS, "" },
     { "closeFuzzyEngine", (PyCFunction)fuzzyEngine_closeFuzzyEngine, METH_VARARGS, "" },
+    { "cancel", (PyCFunction)fuzzyEngine_cancel, METH_VARARGS | METH_KEYWORDS, "" },
     { "initPattern", (PyCFunction)fuzzyEngine_initPattern, METH_VARARGS, "initialize the pattern." },
+    { "registerCorpus", (PyCFunction)fuzzyEngine_registerCorpus, METH_VARARGS, "" },
+    { "setCorpusPriors", (PyCFunction)fuzzyEngine_setCorpusPriors, METH_VARARGS, "" },
     { "fuzzyMatch", (PyCFunction)fuzzyEngine_fuzzyMatch, METH_VARARGS | METH_KEYWORDS, "" },
     { "fuzzyMatchEx", (PyCFunction)fuzzyEngine_fuzzyMatchEx, METH_VARARGS | METH_KEYWORDS, "" },
     { "fuzzyMatchPart", (PyCFunction)fuzzyEngine_fuzzyMatchPart, METH_VARARGS | METH_KEYWORDS, "" },
+    { "refineMatch", (PyCFunction)fuzzyEngine_refineMatch, METH_VARARGS | METH_KEYWORDS, "" },
     { "getHighlights", (PyCFunction)fuzzyEngine_getHighlights, METH_VARARGS | METH_KEYWORDS, "" },
     { "guessMatch", (PyCFunction)fuzzyEngine_guessMatch, METH_VARARGS | METH_KEYWORDS, "" },
     { "merge", (PyCFunction)fuzzyEngine_merge, METH_VARARGS, "" },
+    { "mergeArray", (PyCFunction)fuzzyEngine_mergeArray, METH_VARARGS, "" },
+    { "sortResult", (PyCFunction)fuzzyEngine_sortResult, METH_VARARGS, "" },
     { "createRgParameter", (PyCFunction)fuzzyEngine_createRgParameter, METH_VARARGS, "" },
     { "createParameter", (PyCFunction)fuzzyEngine_createParameter, METH_VARARGS, "" },
     { "createGtagsParameter", (PyCFunction)fuzzyEngine_createGtagsParameter, METH_VARARGS, "" },
+    { "createDigestParameter", (PyCFunction)fuzzyEngine_createDigestParameter, METH_VARARGS | METH_KEYWORDS, "" },
     { NULL, NULL, 0, NULL }
 };
 
@@ -2567,6 +4090,12 @@ PyMODINIT_FUNC PyInit_fuzzyEngine(void)
         return NULL;
     }
 
+    if ( PyModule_AddObject(module, "Category_Digest", Py_BuildValue("I", Category_Digest)) )
+    {
+        Py_DECREF(module);
+        return NULL;
+    }
+
     return module;
 }
 
@@ -2610,6 +4139,12 @@ PyMODINIT_FUNC initfuzzyEngine(void)
         return;
     }
 
+    if ( PyModule_AddObject(module, "Category_Digest", Py_BuildValue("I", Category_Digest)) )
+    {
+        Py_DECREF(module);
+        return;
+    }
+
 }
 
 #endif
@@ -116,6 +116,43 @@
 
 #endif
 
+#if defined(__x86_64__) || defined(__i386__) || defined(_M_AMD64) || defined(_M_X64) || defined(_M_IX86)
+
+    #define FM_X86
+
+    #if defined(__SSE2__) || defined(_M_AMD64) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+        #define FM_SSE2
+        #include <emmintrin.h>
+    #endif
+
+    /* AVX2 is used only if the cpu supports it, see initFindByte2() */
+    #if defined(FM_SSE2) && (defined(__clang__) || (defined(__GNUC__) && __GNUC__ >= 5))
+        #define FM_AVX2
+        #define FM_TARGET_AVX2 __attribute__((target("avx2")))
+        #include <immintrin.h>
+    #elif defined(FM_SSE2) && defined(_MSC_VER) && _MSC_VER >= 1900
+        #define FM_AVX2
+        #define FM_TARGET_AVX2
+        #include <immintrin.h>
+    #endif
+
+#endif
+
+#if defined(FM_SSE2) && defined(_MSC_VER)
+
+    static uint32_t FM_CTZ32(uint32_t x)
+    {
+        unsigned long index;
+        _BitScanForward(&index, x);
+        return index;
+    }
+
+#elif defined(FM_SSE2)
+
+    #define FM_CTZ32(x) ((uint32_t)__builtin_ctz(x))
+
+#endif
+
 static uint64_t deBruijn = 0x022FDD63CC95386D;
 
 static uint8_t MultiplyDeBruijnBitPosition[64] =
@@ -132,7 +169,7 @@ static uint8_t MultiplyDeBruijnBitPosition[64] =
 
 #define FM_CTZ(x) MultiplyDeBruijnBitPosition[((uint64_t)((x) & -(int64_t)(x)) * deBruijn) >> 58]
 
-static uint16_t valTable[64] =
+static uint16_t valTable[65] =
 {
     0,   1,   4,   7,   13,  19,  25,  31,
     37,  43,  49,  55,  61,  67,  73,  79,
@@ -141,7 +178,8 @@ static uint16_t valTable[64] =
     181, 187, 193, 199, 205, 211, 217, 223,
     229, 235, 241, 247, 253, 259, 265, 271,
     277, 283, 289, 295, 301, 307, 313, 319,
-    325, 331, 337, 343, 349, 355, 361, 367
+    325, 331, 337, 343, 349, 355, 361, 367,
+    373
 };
 
 typedef struct TextContext
@@ -160,37 +198,601 @@ typedef struct ValueElements
     uint16_t end;
 }ValueElements;
 
+/**
+ * the mask of `c` for the pattern starting from the k-th character,
+ * i.e., `pattern_mask[c] >> k` if the pattern is shorter than 64 characters.
+ */
+#define FM_MASK_WINDOW(ctxt, c, k) ((ctxt)->long_pattern_mask ? getMaskWindow(ctxt, (uint8_t)(c), k) \
+                                    : (ctxt)->pattern_mask[(uint8_t)(c)] >> (k))
+
+#define FM_UPPER    1
+#define FM_LOWER    2
+#define FM_ALNUM    4
+
+/* the character classification of a character or a symbol, see initPattern() */
+#define FM_ISUPPER(ctxt, c) ((ctxt)->ctype[(uint8_t)(c)] & FM_UPPER)
+#define FM_ISLOWER(ctxt, c) ((ctxt)->ctype[(uint8_t)(c)] & FM_LOWER)
+#define FM_ISALNUM(ctxt, c) ((ctxt)->ctype[(uint8_t)(c)] & FM_ALNUM)
+#define FM_TOLOWER(ctxt, c) ((ctxt)->lower[(uint8_t)(c)])
+#define FM_TOUPPER(ctxt, c) ((ctxt)->upper[(uint8_t)(c)])
+
+/**
+ * the symbols for the non-ASCII characters that are not in the pattern,
+ * the non-ASCII characters of the pattern use the symbols after them.
+ */
+#define SYMBOL_OTHER_LOWER  0x80
+#define SYMBOL_OTHER_UPPER  0x81
+#define SYMBOL_OTHER_ALNUM  0x82
+#define SYMBOL_OTHER_PUNCT  0x83
+#define SYMBOL_FIRST_FREE   0x84
+
+/* the size of the buffer on the stack used to convert a text to symbols */
+#define SYMBOL_BUFFER_SIZE  1024
+
+typedef struct CaseRange
+{
+    uint32_t first;         /* the first uppercase letter */
+    uint32_t last;          /* the last uppercase letter */
+    int32_t delta;          /* lowercase = uppercase + delta */
+    uint8_t is_alternate;   /* uppercase and lowercase letters alternate, delta is 1 */
+}CaseRange;
+
+/**
+ * the uppercase/lowercase pairs of the common scripts:
+ * Latin-1, Latin Extended-A, Greek, Cyrillic, Armenian, Latin Extended Additional
+ * and the fullwidth Latin letters.
+ */
+static CaseRange caseTable[] =
+{
+    { 0x00C0, 0x00D6,   32, 0 },
+    { 0x00D8, 0x00DE,   32, 0 },
+    { 0x0100, 0x012E,    1, 1 },
+    { 0x0132, 0x0136,    1, 1 },
+    { 0x0139, 0x0147,    1, 1 },
+    { 0x014A, 0x0176,    1, 1 },
+    { 0x0178, 0x0178, -121, 0 },
+    { 0x0179, 0x017D,    1, 1 },
+    { 0x0386, 0x0386,   38, 0 },
+    { 0x0388, 0x038A,   37, 0 },
+    { 0x038C, 0x038C,   64, 0 },
+    { 0x038E, 0x038F,   63, 0 },
+    { 0x0391, 0x03A1,   32, 0 },
+    { 0x03A3, 0x03AB,   32, 0 },
+    { 0x0400, 0x040F,   80, 0 },
+    { 0x0410, 0x042F,   32, 0 },
+    { 0x0460, 0x0480,    1, 1 },
+    { 0x048A, 0x04BE,    1, 1 },
+    { 0x04C1, 0x04CD,    1, 1 },
+    { 0x04D0, 0x052E,    1, 1 },
+    { 0x0531, 0x0556,   48, 0 },
+    { 0x1E00, 0x1E94,    1, 1 },
+    { 0x1EA0, 0x1EFE,    1, 1 },
+    { 0xFF21, 0xFF3A,   32, 0 },
+};
+
+/**
+ * return the lowercase letter of `cp` if `cp` is an uppercase letter,
+ * otherwise return 0.
+ */
+static uint32_t FM_toLower(uint32_t cp)
+{
+    if ( cp < 0xC0 || (cp > 0x1EFF && cp < 0xFF21) || cp > 0xFF3A )
+        return 0;
+
+    uint32_t i;
+    for ( i = 0; i < sizeof(caseTable)/sizeof(caseTable[0]); ++i )
+    {
+        CaseRange* r = caseTable + i;
+        if ( cp >= r->first && cp <= r->last )
+        {
+            if ( r->is_alternate && ((cp - r->first) & 1) )
+                return 0;
+            else
+                return cp + r->delta;
+        }
+    }
+
+    return 0;
+}
+
+/**
+ * return the uppercase letter of `cp` if `cp` is a lowercase letter,
+ * otherwise return 0.
+ */
+static uint32_t FM_toUpper(uint32_t cp)
+{
+    if ( cp < 0xE0 || (cp > 0x1EFF && cp < 0xFF41) || cp > 0xFF5A )
+        return 0;
+
+    uint32_t i;
+    for ( i = 0; i < sizeof(caseTable)/sizeof(caseTable[0]); ++i )
+    {
+        CaseRange* r = caseTable + i;
+        uint32_t upper = cp - r->delta;
+        if ( upper >= r->first && upper <= r->last )
+        {
+            if ( r->is_alternate && ((upper - r->first) & 1) )
+                continue;
+            else
+                return upper;
+        }
+    }
+
+    return 0;
+}
+
+static int FM_isPunct(uint32_t cp)
+{
+    return cp < 0xC0 || cp == 0xD7 || cp == 0xF7
+        || (cp >= 0x2000 && cp <= 0x2BFF)     /* punctuation, symbols, arrows, ... */
+        || (cp >= 0x3000 && cp <= 0x303F)     /* CJK symbols and punctuation */
+        || (cp >= 0xFE30 && cp <= 0xFE4F)     /* CJK compatibility forms */
+        || (cp >= 0xFF01 && cp <= 0xFF0F) || (cp >= 0xFF1A && cp <= 0xFF20)
+        || (cp >= 0xFF3B && cp <= 0xFF40) || (cp >= 0xFF5B && cp <= 0xFF65);
+}
+
+/**
+ * decode the UTF-8 character at the beginning of `text`,
+ * the length of the character in bytes is stored in `len`.
+ * an invalid byte is decoded as U+FFFD.
+ */
+static uint32_t decodeUtf8(const char* text, uint16_t text_len, uint16_t* len)
+{
+    const uint8_t* s = (const uint8_t*)text;
+    uint32_t cp;
+    uint16_t n;
+
+    if ( s[0] < 0x80 )
+    {
+        *len = 1;
+        return s[0];
+    }
+    else if ( s[0] >= 0xC2 && s[0] <= 0xDF )
+    {
+        cp = s[0] & 0x1F;
+        n = 2;
+    }
+    else if ( s[0] >= 0xE0 && s[0] <= 0xEF )
+    {
+        cp = s[0] & 0x0F;
+        n = 3;
+    }
+    else if ( s[0] >= 0xF0 && s[0] <= 0xF4 )
+    {
+        cp = s[0] & 0x07;
+        n = 4;
+    }
+    else
+    {
+        *len = 1;
+        return 0xFFFD;
+    }
+
+    if ( n > text_len )
+    {
+        *len = 1;
+        return 0xFFFD;
+    }
+
+    uint16_t i;
+    for ( i = 1; i < n; ++i )
+    {
+        if ( (s[i] & 0xC0) != 0x80 )
+        {
+            *len = 1;
+            return 0xFFFD;
+        }
+        cp = (cp << 6) | (s[i] & 0x3F);
+    }
+
+    *len = n;
+    return cp;
+}
+
+#define CODE_POINT_HASH(cp) (((cp) ^ ((cp) >> 8)) & 0xFF)
+
+/**
+ * return the symbol of the code point `cp`, which is not ASCII.
+ */
+static uint8_t getSymbol(PatternContext* pPattern_ctxt, uint32_t cp)
+{
+    uint32_t h = CODE_POINT_HASH(cp);
+    while ( pPattern_ctxt->code_points[h] != 0 )
+    {
+        if ( pPattern_ctxt->code_points[h] == cp )
+            return pPattern_ctxt->symbols[h];
+        h = (h + 1) & 0xFF;
+    }
+
+    if ( FM_toLower(cp) )
+        return SYMBOL_OTHER_UPPER;
+    else if ( FM_toUpper(cp) )
+        return SYMBOL_OTHER_LOWER;
+    else if ( FM_isPunct(cp) )
+        return SYMBOL_OTHER_PUNCT;
+    else
+        return SYMBOL_OTHER_ALNUM;
+}
+
+static void addSymbol(PatternContext* pPattern_ctxt, uint32_t cp, uint8_t symbol)
+{
+    uint32_t h = CODE_POINT_HASH(cp);
+    while ( pPattern_ctxt->code_points[h] != 0 )
+    {
+        h = (h + 1) & 0xFF;
+    }
+    pPattern_ctxt->code_points[h] = cp;
+    pPattern_ctxt->symbols[h] = symbol;
+}
+
+/**
+ * convert the non-ASCII pattern to symbols, the pattern is stored in `symbols`,
+ * return the length of the pattern in symbols.
+ * each distinct non-ASCII character of the pattern is assigned a symbol in
+ * [SYMBOL_FIRST_FREE, 0xFF], a letter which has case is assigned two symbols,
+ * one for the uppercase and one for the lowercase, so that the characters are
+ * classified and case folded by the same tables as the ASCII characters.
+ * If the symbols are used up, the remaining characters share the symbols of the
+ * characters not in the pattern, and the pattern is matched and highlighted wrongly.
+ * There are enough symbols for 62 distinct non-ASCII characters, the callers reject
+ * the longer patterns, see isCMatchable() in manager.py.
+ */
+static uint16_t patternToSymbols(PatternContext* pPattern_ctxt,
+                                 const char* pattern,
+                                 uint16_t pattern_len,
+                                 char* symbols)
+{
+    uint32_t next_symbol = SYMBOL_FIRST_FREE;
+    uint16_t symbol_len = 0;
+    uint16_t i = 0;
+    while ( i < pattern_len )
+    {
+        uint16_t len = 0;
+        uint32_t cp = decodeUtf8(pattern + i, pattern_len - i, &len);
+        i += len;
+        if ( cp < 0x80 )
+        {
+            symbols[symbol_len++] = (char)cp;
+            continue;
+        }
+
+        uint8_t symbol = getSymbol(pPattern_ctxt, cp);
+        if ( symbol < SYMBOL_FIRST_FREE )
+        {
+            uint32_t lower = FM_toLower(cp);
+            uint32_t upper = FM_toUpper(cp);
+            if ( lower || upper )
+            {
+                if ( next_symbol + 1 <= 0xFF )
+                {
+                    uint8_t upper_symbol = (uint8_t)next_symbol;
+                    uint8_t lower_symbol = (uint8_t)(next_symbol + 1);
+                    next_symbol += 2;
+                    if ( lower )
+                        upper = cp;
+                    else
+                        lower = cp;
+                    addSymbol(pPattern_ctxt, upper, upper_symbol);
+                    addSymbol(pPattern_ctxt, lower, lower_symbol);
+                    pPattern_ctxt->ctype[upper_symbol] = FM_UPPER | FM_ALNUM;
+                    pPattern_ctxt->ctype[lower_symbol] = FM_LOWER | FM_ALNUM;
+                    pPattern_ctxt->lower[upper_symbol] = (char)lower_symbol;
+                    pPattern_ctxt->upper[lower_symbol] = (char)upper_symbol;
+                    symbol = cp == upper ? upper_symbol : lower_symbol;
+                }
+            }
+            else if ( next_symbol <= 0xFF )
+            {
+                symbol = (uint8_t)next_symbol++;
+                addSymbol(pPattern_ctxt, cp, symbol);
+                pPattern_ctxt->ctype[symbol] = FM_isPunct(cp) ? 0 : FM_ALNUM;
+            }
+        }
+        symbols[symbol_len++] = (char)symbol;
+    }
+
+    return symbol_len;
+}
+
+/**
+ * convert `text` to symbols, return the length of the text in symbols.
+ * if `offsets` is not NULL, offsets[i] is the byte index of the i-th symbol,
+ * offsets[symbol_len] is `text_len`.
+ */
+static uint16_t textToSymbols(PatternContext* pPattern_ctxt,
+                              const char* text,
+                              uint16_t text_len,
+                              char* symbols,
+                              uint16_t* offsets)
+{
+    uint16_t symbol_len = 0;
+    uint16_t i = 0;
+    while ( i < text_len )
+    {
+        if ( offsets )
+            offsets[symbol_len] = i;
+
+        if ( (uint8_t)text[i] < 0x80 )
+        {
+            symbols[symbol_len++] = text[i++];
+        }
+        else
+        {
+            uint16_t len = 0;
+            uint32_t cp = decodeUtf8(text + i, text_len - i, &len);
+            i += len;
+            symbols[symbol_len++] = (char)getSymbol(pPattern_ctxt, cp);
+        }
+    }
+
+    if ( offsets )
+        offsets[symbol_len] = text_len;
+
+    return symbol_len;
+}
+
+/**
+ * findByte2(text, i, text_len, a, b)
+ * return the index of the first byte in text[i, text_len) that is `a` or `b`,
+ * or text_len if there is none.
+ */
+typedef uint16_t (*FindByte2Func)(const char* text, uint16_t i, uint16_t text_len, char a, char b);
+
+static uint16_t findByte2_scalar(const char* text, uint16_t i, uint16_t text_len, char a, char b)
+{
+    for ( ; i < text_len; ++i )
+    {
+        if ( text[i] == a || text[i] == b )
+            break;
+    }
+
+    return i;
+}
+
+#if defined(FM_SSE2)
+
+static uint16_t findByte2_sse2(const char* text, uint16_t i, uint16_t text_len, char a, char b)
+{
+    __m128i va = _mm_set1_epi8(a);
+    __m128i vb = _mm_set1_epi8(b);
+    /* only the bytes of the text are loaded, the tail is scanned one byte at a time */
+    for ( ; i + 16 <= text_len; i += 16 )
+    {
+        __m128i x = _mm_loadu_si128((const __m128i*)(text + i));
+        uint32_t mask = (uint32_t)_mm_movemask_epi8(_mm_or_si128(_mm_cmpeq_epi8(x, va), _mm_cmpeq_epi8(x, vb)));
+        if ( mask != 0 )
+            return i + (uint16_t)FM_CTZ32(mask);
+    }
+
+    return findByte2_scalar(text, i, text_len, a, b);
+}
+
+#endif
+
+#if defined(FM_AVX2)
+
+FM_TARGET_AVX2
+static uint16_t findByte2_avx2(const char* text, uint16_t i, uint16_t text_len, char a, char b)
+{
+    __m256i va = _mm256_set1_epi8(a);
+    __m256i vb = _mm256_set1_epi8(b);
+    for ( ; i + 32 <= text_len; i += 32 )
+    {
+        __m256i x = _mm256_loadu_si256((const __m256i*)(text + i));
+        uint32_t mask = (uint32_t)_mm256_movemask_epi8(_mm256_or_si256(_mm256_cmpeq_epi8(x, va),
+                                                                        _mm256_cmpeq_epi8(x, vb)));
+        if ( mask != 0 )
+            return i + (uint16_t)FM_CTZ32(mask);
+    }
+
+    return findByte2_sse2(text, i, text_len, a, b);
+}
+
+/**
+ * return TRUE if the cpu and the os support AVX2.
+ */
+static int hasAvx2(void)
+{
+#if defined(_MSC_VER)
+    int info[4];
+    __cpuid(info, 0);
+    if ( info[0] < 7 )
+        return 0;
+
+    __cpuid(info, 1);
+    /* OSXSAVE and AVX */
+    if ( (info[2] & (1 << 27)) == 0 || (info[2] & (1 << 28)) == 0 )
+        return 0;
+
+    /* the os saves the XMM and YMM registers */
+    if ( (_xgetbv(0) & 6) != 6 )
+        return 0;
+
+    __cpuidex(info, 7, 0);
+    return (info[1] & (1 << 5)) != 0;
+#else
+    __builtin_cpu_init();
+    return __builtin_cpu_supports("avx2");
+#endif
+}
+
+#endif
+
+static FindByte2Func findByte2 = NULL;
+
+/**
+ * select the implementation of findByte2() supported by the cpu.
+ */
+static void initFindByte2(void)
+{
+#if defined(FM_AVX2)
+    if ( hasAvx2() )
+    {
+        findByte2 = findByte2_avx2;
+        return;
+    }
+#endif
+
+#if defined(FM_SSE2)
+    findByte2 = findByte2_sse2;
+#else
+    findByte2 = findByte2_scalar;
+#endif
+}
+
+/**
+ * return TRUE if the pattern is a subsequence of the text, a lowercase character
+ * of the pattern matches both cases, the same as the matching of _getWeight().
+ * It rejects most of the texts that do not match before _getWeight() allocates
+ * and fills the text mask.
+ */
+static int isSubsequence(const char* text, uint16_t text_len, PatternContext* pPattern_ctxt)
+{
+    const char* pattern = pPattern_ctxt->pattern;
+    uint16_t pattern_len = pPattern_ctxt->pattern_len;
+    uint16_t i = 0;
+    uint16_t j;
+    for ( j = 0; j < pattern_len; ++j )
+    {
+        i = findByte2(text, i, text_len, pattern[j], FM_TOUPPER(pPattern_ctxt, pattern[j]));
+        if ( i >= text_len )
+            return 0;
+        ++i;
+    }
+
+    return 1;
+}
+
+/**
+ * return the bits [k, k + 63) of the mask of `c`, the bit 63 is always set,
+ * so that the pattern longer than 63 characters is matched 63 characters at a time.
+ */
+static int64_t getMaskWindow(PatternContext* pPattern_ctxt, uint8_t c, uint16_t k)
+{
+    uint16_t mask_words = pPattern_ctxt->mask_words;
+    const uint64_t* mask = pPattern_ctxt->long_pattern_mask + c * mask_words;
+    uint16_t w = k >> 6;
+    uint16_t b = k & 63;
+    uint64_t x = mask[w] >> b;
+    if ( b > 0 )
+        x |= (w + 1 < mask_words ? mask[w + 1] : ~0ULL) << (64 - b);
+
+    return (int64_t)(x | (1ULL << 63));
+}
+
 PatternContext* initPattern(const char* pattern, uint16_t pattern_len)
 {
-    PatternContext* pPattern_ctxt = (PatternContext*)malloc(sizeof(PatternContext));
+    /**
+     * the masks of the pattern longer than 63 characters and the pattern
+     * are stored in the memory right after the PatternContext
+     */
+    uint16_t mask_words = pattern_len >= 64 ? (pattern_len + 63) >> 6 : 0;
+    size_t mask_size = (size_t)mask_words * 256 * sizeof(uint64_t);
+    PatternContext* pPattern_ctxt = (PatternContext*)malloc(sizeof(PatternContext) + mask_size + pattern_len + 1);
     if ( !pPattern_ctxt )
     {
         fprintf(stderr, "Out of memory in initPattern()!\n");
         return NULL;
     }
-    pPattern_ctxt->actual_pattern_len = pattern_len;
-    if ( pattern_len >= 64 )
+
+    uint16_t i;
+    for ( i = 0; i < 256; ++i )
+    {
+        if ( i >= 'A' && i <= 'Z' )
+        {
+            pPattern_ctxt->ctype[i] = FM_UPPER | FM_ALNUM;
+            pPattern_ctxt->lower[i] = (char)(i + 32);
+            pPattern_ctxt->upper[i] = (char)i;
+        }
+        else if ( i >= 'a' && i <= 'z' )
+        {
+            pPattern_ctxt->ctype[i] = FM_LOWER | FM_ALNUM;
+            pPattern_ctxt->lower[i] = (char)i;
+            pPattern_ctxt->upper[i] = (char)(i - 32);
+        }
+        else
+        {
+            pPattern_ctxt->ctype[i] = i >= '0' && i <= '9' ? FM_ALNUM : 0;
+            pPattern_ctxt->lower[i] = (char)i;
+            pPattern_ctxt->upper[i] = (char)i;
+        }
+    }
+    memset(pPattern_ctxt->code_points, 0, sizeof(pPattern_ctxt->code_points));
+
+    char* symbols = (char*)(pPattern_ctxt + 1) + mask_size;
+    pPattern_ctxt->is_utf8 = 0;
+    for ( i = 0; i < pattern_len; ++i )
     {
-        pattern_len = 63;
+        if ( (uint8_t)pattern[i] >= 0x80 )
+        {
+            pPattern_ctxt->is_utf8 = 1;
+            break;
+        }
     }
+
+    if ( pPattern_ctxt->is_utf8 )
+    {
+        pPattern_ctxt->ctype[SYMBOL_OTHER_LOWER] = FM_LOWER | FM_ALNUM;
+        pPattern_ctxt->ctype[SYMBOL_OTHER_UPPER] = FM_UPPER | FM_ALNUM;
+        pPattern_ctxt->ctype[SYMBOL_OTHER_ALNUM] = FM_ALNUM;
+        pPattern_ctxt->lower[SYMBOL_OTHER_UPPER] = (char)SYMBOL_OTHER_LOWER;
+        pPattern_ctxt->upper[SYMBOL_OTHER_LOWER] = (char)SYMBOL_OTHER_UPPER;
+        pattern_len = patternToSymbols(pPattern_ctxt, pattern, pattern_len, symbols);
+    }
+    else
+    {
+        memcpy(symbols, pattern, pattern_len);
+    }
+    symbols[pattern_len] = '\0';
+    pattern = symbols;
+
     pPattern_ctxt->pattern = pattern;
     pPattern_ctxt->pattern_len = pattern_len;
     memset(pPattern_ctxt->pattern_mask, -1, sizeof(pPattern_ctxt->pattern_mask));
 
-    uint16_t i;
-    for ( i = 0; i < pattern_len; ++i )
+    if ( pattern_len < 64 )
+    {
+        pPattern_ctxt->long_pattern_mask = NULL;
+        pPattern_ctxt->mask_words = 0;
+
+        for ( i = 0; i < pattern_len; ++i )
+        {
+            pPattern_ctxt->pattern_mask[(uint8_t)pattern[i]] ^= (1LL << i);
+            if ( FM_ISLOWER(pPattern_ctxt, pattern[i])
+                 && pPattern_ctxt->pattern_mask[(uint8_t)FM_TOUPPER(pPattern_ctxt, pattern[i])] != -1 )
+            {
+                pPattern_ctxt->pattern_mask[(uint8_t)FM_TOUPPER(pPattern_ctxt, pattern[i])] ^= (1LL << i);
+            }
+        }
+    }
+    else
     {
-        pPattern_ctxt->pattern_mask[(uint8_t)pattern[i]] ^= (1LL << i);
-        if ( islower(pattern[i]) && pPattern_ctxt->pattern_mask[(uint8_t)toupper(pattern[i])] != -1 )
+        /* if the pattern is converted to symbols, `mask_words` may be more than needed */
+        uint64_t* mask = (uint64_t*)(pPattern_ctxt + 1);
+        memset(mask, -1, mask_size);
+        pPattern_ctxt->long_pattern_mask = mask;
+        pPattern_ctxt->mask_words = mask_words;
+
+        for ( i = 0; i < pattern_len; ++i )
         {
-            pPattern_ctxt->pattern_mask[(uint8_t)toupper(pattern[i])] ^= (1LL << i);
+            uint8_t c = (uint8_t)pattern[i];
+            mask[c * mask_words + (i >> 6)] ^= 1ULL << (i & 63);
+            pPattern_ctxt->pattern_mask[c] = 0;
+            if ( FM_ISLOWER(pPattern_ctxt, c) && pPattern_ctxt->pattern_mask[(uint8_t)FM_TOUPPER(pPattern_ctxt, c)] != -1 )
+            {
+                mask[(uint8_t)FM_TOUPPER(pPattern_ctxt, c) * mask_words + (i >> 6)] ^= 1ULL << (i & 63);
+            }
         }
     }
     pPattern_ctxt->is_lower = 1;
 
+    /* the patterns are initialized before the worker threads match with them */
+    if ( !findByte2 )
+        initFindByte2();
+
     for ( i = 0; i < pattern_len; ++i )
     {
-        if ( isupper(pattern[i]) )
+        if ( FM_ISUPPER(pPattern_ctxt, pattern[i]) )
         {
             pPattern_ctxt->is_lower = 0;
             break;
@@ -210,7 +812,7 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
     uint16_t j = pText_ctxt->offset;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -259,13 +861,13 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
     uint16_t special = 0;
     if ( i == 0 )
         special = 3;
-    else if ( isupper(text[i]) )
-        special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+    else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+        special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
     /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
     /*     special = 3;                                                     */
     /* else if ( text[i-1] == '.' )                                         */
     /*     special = 3;                                                     */
-    else if ( !isalnum(text[i-1]) )
+    else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
         special = 3;
     else
         special = 0;
@@ -278,16 +880,16 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
         char c = text[i];
         /* c in pattern */
         if ( pattern_mask[(uint8_t)c] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)c] >> k);
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, c, k);
         /**
          * text = 'xxABC', pattern = 'abc'; text[i] == 'B'
          * text = 'xxABC', pattern = 'abc'; text[i] == 'C'
          * NOT text = 'xxABCd', pattern = 'abc'; text[i] == 'C'
          * 'Cd' is considered as a word
          */
-        else if ( isupper(text[i-1]) && pattern_mask[(uint8_t)tolower(c)] != -1
-                  && (i+1 == text_len || !islower(text[i+1])) )
-            d = (d << 1) | (pattern_mask[(uint8_t)tolower(c)] >> k);
+        else if ( FM_ISUPPER(pPattern_ctxt, text[i-1]) && pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1
+                  && (i+1 == text_len || !FM_ISLOWER(pPattern_ctxt, text[i+1])) )
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, FM_TOLOWER(pPattern_ctxt, c), k);
         else
             d = ~0;
 
@@ -363,13 +965,13 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
                 i += FM_CTZ(x);
             }
 
-            if ( isupper(text[i]) )
-                special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+            if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+                special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
             /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
             /*     special = 3;                                                     */
             /* else if ( text[i-1] == '.' )                                         */
             /*     special = 3;                                                     */
-            else if ( !isalnum(text[i-1]) )
+            else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                 special = 3;
             else
                 special = 0;
@@ -383,7 +985,8 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
     /* e.g., text = '~~~~abcd', pattern = 'abcd' */
     if ( i == text_len )
     {
-        if ( ~d >> (pattern_len - 1) )
+        /* if more than 63 characters are left, the rest of the pattern can not be matched */
+        if ( pattern_len < 64 && (~d >> (pattern_len - 1)) )
         {
             float score = (float)(special > 0 ? (pattern_len > 1 ? valTable[pattern_len + 1] : valTable[pattern_len]) + special
                             : valTable[pattern_len]);
@@ -413,7 +1016,7 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     uint16_t j = pText_ctxt->offset;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -467,13 +1070,13 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     else if ( text[i-1] == '/' )
 #endif
         special = k == 0 ? 5 : 3;
-    else if ( isupper(text[i]) )
-        special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+    else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+        special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
     /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
     /*     special = 3;                                                     */
     /* else if ( text[i-1] == '.' )                                         */
     /*     special = 3;                                                     */
-    else if ( !isalnum(text[i-1]) )
+    else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
         special = 3;
     else
         special = 0;
@@ -486,17 +1089,17 @@ ValueElements* evaluate(TextContext* pText_ctxt,
         char c = text[i];
         /* c in pattern */
         if ( pattern_mask[(uint8_t)c] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)c] >> k);
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, c, k);
         /**
          * text = 'xxABC', pattern = 'abc'; text[i] == 'B'
          * text = 'xxABC', pattern = 'abc'; text[i] == 'C'
          * NOT text = 'xxABCd', pattern = 'abc'; text[i] == 'C'
          * 'Cd' is considered as a word
          */
-        /* else if ( isupper(text[i-1]) && pattern_mask[(uint8_t)tolower(c)] != -1 */
-        /*           && (i+1 == text_len || !islower(text[i+1])) )                 */
-        else if ( pattern_mask[(uint8_t)tolower(c)] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)tolower(c)] >> k);
+        /* else if ( FM_ISUPPER(pPattern_ctxt, text[i-1]) && pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 */
+        /*           && (i+1 == text_len || !FM_ISLOWER(pPattern_ctxt, text[i+1])) )                 */
+        else if ( pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 )
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, FM_TOLOWER(pPattern_ctxt, c), k);
         else
             d = ~0;
 
@@ -588,13 +1191,13 @@ ValueElements* evaluate(TextContext* pText_ctxt,
             if ( text[i-1] == '/' )
 #endif
                 special = k == 0 ? 5 : 3;
-            else if ( isupper(text[i]) )
-                special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+            else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+                special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
             /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
             /*     special = 3;                                                     */
             /* else if ( text[i-1] == '.' )                                         */
             /*     special = 3;                                                     */
-            else if ( !isalnum(text[i-1]) )
+            else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                 special = 3;
             else
                 special = 0;
@@ -608,7 +1211,8 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     /* e.g., text = '~~~~abcd', pattern = 'abcd' */
     if ( i == text_len )
     {
-        if ( ~d >> (pattern_len - 1) )
+        /* if more than 63 characters are left, the rest of the pattern can not be matched */
+        if ( pattern_len < 64 && (~d >> (pattern_len - 1)) )
         {
             float score = (float)(special > 0 ? (pattern_len > 1 ? valTable[pattern_len + 1] : valTable[pattern_len]) + special
                             : valTable[pattern_len]);
@@ -628,13 +1232,10 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     return val + k;
 }
 
-float getWeight(const char* text, uint16_t text_len,
-                PatternContext* pPattern_ctxt,
-                uint8_t is_name_only)
+static float _getWeight(const char* text, uint16_t text_len,
+                        PatternContext* pPattern_ctxt,
+                        uint8_t is_name_only)
 {
-    if ( !text || !pPattern_ctxt )
-        return MIN_WEIGHT;
-
     uint16_t j = 0;
     uint16_t col_num = 0;
     uint64_t* text_mask = NULL;
@@ -652,7 +1253,7 @@ float getWeight(const char* text, uint16_t text_len,
 
     if ( pattern_len == 1 )
     {
-        if ( isupper(first_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, first_char) )
         {
             int16_t first_char_pos = -1;
             int16_t i;
@@ -675,12 +1276,12 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
                 {
                     if ( first_char_pos == -1 )
                         first_char_pos = i;
 
-                    if ( isupper(text[i]) || i == 0 || !isalnum(text[i-1]) )
+                    if ( FM_ISUPPER(pPattern_ctxt, text[i]) || i == 0 || !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                         return 2 + 1.0f/(i + 1) + 1.0f/text_len;
                 }
             }
@@ -691,13 +1292,16 @@ float getWeight(const char* text, uint16_t text_len,
         }
     }
 
+    if ( !isSubsequence(text, text_len, pPattern_ctxt) )
+        return MIN_WEIGHT;
+
     int16_t first_char_pos = -1;
     if ( pPattern_ctxt->is_lower )
     {
         int16_t i;
         for ( i = 0; i < text_len; ++i )
         {
-            if ( tolower(text[i]) == first_char )
+            if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
             {
                 first_char_pos = i;
                 break;
@@ -709,7 +1313,7 @@ float getWeight(const char* text, uint16_t text_len,
         int16_t last_char_pos = -1;
         for ( i = text_len - 1; i >= first_char_pos; --i )
         {
-            if ( tolower(text[i]) == last_char )
+            if ( FM_TOLOWER(pPattern_ctxt, text[i]) == last_char )
             {
                 last_char_pos = i;
                 break;
@@ -729,7 +1333,7 @@ float getWeight(const char* text, uint16_t text_len,
         char c;
         for ( i = first_char_pos; i <= last_char_pos; ++i )
         {
-            c = tolower(text[i]);
+            c = FM_TOLOWER(pPattern_ctxt, text[i]);
             /* c in pattern */
             if ( pattern_mask[(uint8_t)c] != -1 )
             {
@@ -741,7 +1345,7 @@ float getWeight(const char* text, uint16_t text_len,
     }
     else
     {
-        if ( isupper(first_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, first_char) )
         {
             int16_t i;
             for ( i = 0; i < text_len; ++i )
@@ -758,7 +1362,7 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
                 {
                     first_char_pos = i;
                     break;
@@ -769,7 +1373,7 @@ float getWeight(const char* text, uint16_t text_len,
             return MIN_WEIGHT;
 
         int16_t last_char_pos = -1;
-        if ( isupper(last_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, last_char) )
         {
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
@@ -786,7 +1390,7 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
             {
-                if ( tolower(text[i]) == last_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == last_char )
                 {
                     last_char_pos = i;
                     break;
@@ -809,14 +1413,14 @@ float getWeight(const char* text, uint16_t text_len,
         for ( i = first_char_pos; i <= last_char_pos; ++i )
         {
             c = text[i];
-            if ( isupper(c) )
+            if ( FM_ISUPPER(pPattern_ctxt, c) )
             {
                 /* c in pattern */
                 if ( pattern_mask[(uint8_t)c] != -1 )
                     text_mask[(uint8_t)c * col_num + (i >> 6)] |= 1ULL << (i & 63);
-                if ( pattern_mask[(uint8_t)tolower(c)] != -1 )
-                    text_mask[(uint8_t)tolower(c) * col_num + (i >> 6)] |= 1ULL << (i & 63);
-                if ( j < pattern_len && c == toupper(pattern[j]) )
+                if ( pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 )
+                    text_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c) * col_num + (i >> 6)] |= 1ULL << (i & 63);
+                if ( j < pattern_len && c == FM_TOUPPER(pPattern_ctxt, pattern[j]) )
                     ++j;
             }
             else
@@ -838,31 +1442,6 @@ float getWeight(const char* text, uint16_t text_len,
         return MIN_WEIGHT;
     }
 
-    if ( pPattern_ctxt->actual_pattern_len >= 64 )
-    {
-        int16_t i;
-        j = 0;
-        for ( i = first_char_pos; i < text_len; ++i )
-        {
-            if ( j < pPattern_ctxt->actual_pattern_len )
-            {
-                if ( (pPattern_ctxt->is_lower && tolower(text[i]) == pattern[j])
-                     || text[i] == pattern[j] )
-                {
-                    ++j;
-                }
-            }
-            else
-                break;
-        }
-
-        if ( j < pPattern_ctxt->actual_pattern_len )
-        {
-            free(text_mask);
-            return MIN_WEIGHT;
-        }
-    }
-
     TextContext text_ctxt;
     text_ctxt.text = text;
     text_ctxt.text_len = text_len;
@@ -870,8 +1449,24 @@ float getWeight(const char* text, uint16_t text_len,
     text_ctxt.col_num = col_num;
     text_ctxt.offset = 0;
 
-    ValueElements val[64];
-    memset(val, 0, sizeof(val));
+    /* ValueElements val[pattern_len] */
+    ValueElements val_buffer[64];
+    ValueElements* val = val_buffer;
+    if ( pattern_len > 64 )
+    {
+        val = (ValueElements*)calloc(pattern_len, sizeof(ValueElements));
+        if ( !val )
+        {
+            fprintf(stderr, "Out of memory in getWeight()!\n");
+            free(text_mask);
+            return MIN_WEIGHT;
+        }
+    }
+    else
+    {
+        memset(val_buffer, 0, sizeof(val_buffer));
+    }
+
     if ( is_name_only )
     {
         ValueElements* pVal = evaluate_nameOnly(&text_ctxt, pPattern_ctxt, 0, val);
@@ -880,6 +1475,8 @@ float getWeight(const char* text, uint16_t text_len,
         uint16_t end = pVal->end;
 
         free(text_mask);
+        if ( val != val_buffer )
+            free(val);
 
         return score + (1 >> beg) + 1.0f/(beg + end) + 1.0f/text_len;
     }
@@ -890,12 +1487,64 @@ float getWeight(const char* text, uint16_t text_len,
         uint16_t beg = pVal->beg;
 
         free(text_mask);
+        if ( val != val_buffer )
+            free(val);
 
         return score + (float)pattern_len/text_len + (float)(pattern_len << 1)/(text_len - beg);
     }
 }
 
 
+/**
+ * return TRUE if the text contains non-ASCII characters
+ */
+static int hasNonAscii(const char* text, uint16_t text_len)
+{
+    uint16_t i;
+    for ( i = 0; i < text_len; ++i )
+    {
+        if ( (uint8_t)text[i] >= 0x80 )
+            return 1;
+    }
+
+    return 0;
+}
+
+float getWeight(const char* text, uint16_t text_len,
+                PatternContext* pPattern_ctxt,
+                uint8_t is_name_only)
+{
+    if ( !text || !pPattern_ctxt )
+        return MIN_WEIGHT;
+
+    if ( !pPattern_ctxt->is_utf8 )
+        return _getWeight(text, text_len, pPattern_ctxt, is_name_only);
+
+    /* the pattern contains non-ASCII characters, an ASCII text can not match */
+    if ( !hasNonAscii(text, text_len) )
+        return MIN_WEIGHT;
+
+    char buffer[SYMBOL_BUFFER_SIZE];
+    char* symbols = buffer;
+    if ( text_len > SYMBOL_BUFFER_SIZE )
+    {
+        symbols = (char*)malloc(text_len);
+        if ( !symbols )
+        {
+            fprintf(stderr, "Out of memory in getWeight()!\n");
+            return MIN_WEIGHT;
+        }
+    }
+
+    uint16_t symbol_len = textToSymbols(pPattern_ctxt, text, text_len, symbols, NULL);
+    float weight = _getWeight(symbols, symbol_len, pPattern_ctxt, is_name_only);
+
+    if ( symbols != buffer )
+        free(symbols);
+
+    return weight;
+}
+
 HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
                                             PatternContext* pPattern_ctxt,
                                             uint16_t k,
@@ -910,7 +1559,7 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
     uint16_t col_num = pText_ctxt->col_num;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -942,7 +1591,7 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
 
     if ( !groups[k] )
     {
-        groups[k] = (HighlightGroup*)calloc(1, sizeof(HighlightGroup));
+        groups[k] = (HighlightGroup*)calloc(1, HIGHLIGHT_GROUP_SIZE(pPattern_ctxt->pattern_len - k));
         if ( !groups[k] )
         {
             fprintf(stderr, "Out of memory in evaluateHighlights_nameOnly()!\n");
@@ -951,12 +1600,9 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
     }
     else
     {
-        memset(groups[k], 0, sizeof(HighlightGroup));
+        memset(groups[k], 0, HIGHLIGHT_GROUP_SIZE(pPattern_ctxt->pattern_len - k));
     }
 
-    HighlightGroup cur_highlights;
-    memset(&cur_highlights, 0, sizeof(HighlightGroup));
-
     const char* text = pText_ctxt->text;
     uint16_t text_len = pText_ctxt->text_len;
     uint16_t pattern_len = pPattern_ctxt->pattern_len - k;
@@ -965,13 +1611,13 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
     uint16_t special = 0;
     if ( i == 0 )
         special = 3;
-    else if ( isupper(text[i]) )
-        special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+    else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+        special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
     /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
     /*     special = 3;                                                     */
     /* else if ( text[i-1] == '.' )                                         */
     /*     special = 3;                                                     */
-    else if ( !isalnum(text[i-1]) )
+    else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
         special = 3;
     else
         special = 0;
@@ -984,16 +1630,16 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
         char c = text[i];
         /* c in pattern */
         if ( pattern_mask[(uint8_t)c] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)c] >> k);
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, c, k);
         /**
          * text = 'xxABC', pattern = 'abc'; text[i] == 'B'
          * text = 'xxABC', pattern = 'abc'; text[i] == 'C'
          * NOT text = 'xxABCd', pattern = 'abc'; text[i] == 'C'
          * 'Cd' is considered as a word
          */
-        else if ( isupper(text[i-1]) && pattern_mask[(uint8_t)tolower(c)] != -1
-                  && (i+1 == text_len || !islower(text[i+1])) )
-            d = (d << 1) | (pattern_mask[(uint8_t)tolower(c)] >> k);
+        else if ( FM_ISUPPER(pPattern_ctxt, text[i-1]) && pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1
+                  && (i+1 == text_len || !FM_ISLOWER(pPattern_ctxt, text[i+1])) )
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, FM_TOLOWER(pPattern_ctxt, c), k);
         else
             d = ~0;
 
@@ -1001,19 +1647,19 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
         {
             float score = MIN_WEIGHT;
             uint16_t n = FM_BIT_LENGTH(~last);
+            HighlightGroup* pGroup = NULL;
             /* e.g., text = '~~abcd~~~~', pattern = 'abcd' */
             if ( n == pattern_len )
             {
                 score = (float)(special > 0 ? (n > 1 ? valTable[n+1] : valTable[n]) + special : valTable[n]);
-                cur_highlights.score = score;
-                cur_highlights.beg = i - n;
-                cur_highlights.end = i;
-                cur_highlights.end_index = 1;
-                cur_highlights.positions[0].col = i - n + 1;
-                cur_highlights.positions[0].len = n;
                 if ( special > 0 )
                 {
-                    memcpy(groups[k], &cur_highlights, sizeof(HighlightGroup));
+                    groups[k]->score = score;
+                    groups[k]->beg = i - n;
+                    groups[k]->end = i;
+                    groups[k]->positions[0].col = i - n + 1;
+                    groups[k]->positions[0].len = n;
+                    groups[k]->end_index = 1;
                     return groups[k];
                 }
             }
@@ -1024,19 +1670,12 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
                 {
                     max_prefix_score = prefix_score;
                     pText_ctxt->offset = i;
-                    HighlightGroup* pGroup = evaluateHighlights_nameOnly(pText_ctxt, pPattern_ctxt, k + n, groups);
+                    pGroup = evaluateHighlights_nameOnly(pText_ctxt, pPattern_ctxt, k + n, groups);
                     if ( pGroup )
                     {
                         if ( pGroup->end )
                         {
                             score = prefix_score + pGroup->score - 0.2f * (pGroup->beg - i);
-                            cur_highlights.score = score;
-                            cur_highlights.beg = i - n;
-                            cur_highlights.end = pGroup->end;
-                            cur_highlights.positions[0].col = i - n + 1;
-                            cur_highlights.positions[0].len = n;
-                            memcpy(cur_highlights.positions + 1, pGroup->positions, pGroup->end_index * sizeof(HighlightPos));
-                            cur_highlights.end_index = pGroup->end_index + 1;
                         }
                     }
                 }
@@ -1044,7 +1683,22 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
             if ( score > max_score )
             {
                 max_score = score;
-                memcpy(groups[k], &cur_highlights, sizeof(HighlightGroup));
+                groups[k]->score = score;
+                groups[k]->beg = i - n;
+                groups[k]->positions[0].col = i - n + 1;
+                groups[k]->positions[0].len = n;
+                /* only the prefix of the pattern is matched here, the rest is in pGroup */
+                if ( pGroup && pGroup->end )
+                {
+                    groups[k]->end = pGroup->end;
+                    memcpy(groups[k]->positions + 1, pGroup->positions, pGroup->end_index * sizeof(HighlightPos));
+                    groups[k]->end_index = pGroup->end_index + 1;
+                }
+                else
+                {
+                    groups[k]->end = i;
+                    groups[k]->end_index = 1;
+                }
             }
             /* e.g., text = '~_ababc~~~~', pattern = 'abc' */
             special = 0;
@@ -1078,13 +1732,13 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
                 i += FM_CTZ(x);
             }
 
-            if ( isupper(text[i]) )
-                special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+            if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+                special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
             /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
             /*     special = 3;                                                     */
             /* else if ( text[i-1] == '.' )                                         */
             /*     special = 3;                                                     */
-            else if ( !isalnum(text[i-1]) )
+            else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                 special = 3;
             else
                 special = 0;
@@ -1098,7 +1752,8 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
     /* e.g., text = '~~~~abcd', pattern = 'abcd' */
     if ( i == text_len )
     {
-        if ( ~d >> (pattern_len - 1) )
+        /* if more than 63 characters are left, the rest of the pattern can not be matched */
+        if ( pattern_len < 64 && (~d >> (pattern_len - 1)) )
         {
             float score = (float)(special > 0 ? (pattern_len > 1 ? valTable[pattern_len + 1] : valTable[pattern_len]) + special
                             : valTable[pattern_len]);
@@ -1132,7 +1787,7 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
     uint16_t col_num = pText_ctxt->col_num;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -1164,7 +1819,7 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
 
     if ( !groups[k] )
     {
-        groups[k] = (HighlightGroup*)calloc(1, sizeof(HighlightGroup));
+        groups[k] = (HighlightGroup*)calloc(1, HIGHLIGHT_GROUP_SIZE(pPattern_ctxt->pattern_len - k));
         if ( !groups[k] )
         {
             fprintf(stderr, "Out of memory in evaluateHighlights()!\n");
@@ -1173,12 +1828,9 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
     }
     else
     {
-        memset(groups[k], 0, sizeof(HighlightGroup));
+        memset(groups[k], 0, HIGHLIGHT_GROUP_SIZE(pPattern_ctxt->pattern_len - k));
     }
 
-    HighlightGroup cur_highlights;
-    memset(&cur_highlights, 0, sizeof(HighlightGroup));
-
     const char* text = pText_ctxt->text;
     uint16_t text_len = pText_ctxt->text_len;
     uint16_t pattern_len = pPattern_ctxt->pattern_len - k;
@@ -1193,13 +1845,13 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
     else if ( text[i-1] == '/' )
 #endif
         special = k == 0 ? 5 : 3;
-    else if ( isupper(text[i]) )
-        special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+    else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+        special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
     /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
     /*     special = 3;                                                     */
     /* else if ( text[i-1] == '.' )                                         */
     /*     special = 3;                                                     */
-    else if ( !isalnum(text[i-1]) )
+    else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
         special = 3;
     else
         special = 0;
@@ -1212,17 +1864,17 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
         char c = text[i];
         /* c in pattern */
         if ( pattern_mask[(uint8_t)c] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)c] >> k);
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, c, k);
         /**
          * text = 'xxABC', pattern = 'abc'; text[i] == 'B'
          * text = 'xxABC', pattern = 'abc'; text[i] == 'C'
          * NOT text = 'xxABCd', pattern = 'abc'; text[i] == 'C'
          * 'Cd' is considered as a word
          */
-        /* else if ( isupper(text[i-1]) && pattern_mask[(uint8_t)tolower(c)] != -1 */
-        /*           && (i+1 == text_len || !islower(text[i+1])) )                 */
-        else if ( pattern_mask[(uint8_t)tolower(c)] != -1 )
-            d = (d << 1) | (pattern_mask[(uint8_t)tolower(c)] >> k);
+        /* else if ( FM_ISUPPER(pPattern_ctxt, text[i-1]) && pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 */
+        /*           && (i+1 == text_len || !FM_ISLOWER(pPattern_ctxt, text[i+1])) )                 */
+        else if ( pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 )
+            d = (d << 1) | FM_MASK_WINDOW(pPattern_ctxt, FM_TOLOWER(pPattern_ctxt, c), k);
         else
             d = ~0;
 
@@ -1230,19 +1882,19 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
         {
             float score = MIN_WEIGHT;
             uint16_t n = FM_BIT_LENGTH(~last);
+            HighlightGroup* pGroup = NULL;
             /* e.g., text = '~~abcd~~~~', pattern = 'abcd' */
             if ( n == pattern_len )
             {
                 score = (float)(special > 0 ? (n > 1 ? valTable[n+1] : valTable[n]) + special : valTable[n]);
-                cur_highlights.score = score;
-                cur_highlights.beg = i - n;
-                cur_highlights.end = i;
-                cur_highlights.end_index = 1;
-                cur_highlights.positions[0].col = i - n + 1;
-                cur_highlights.positions[0].len = n;
                 if ( (k == 0 && special == 5) || (k > 0 && special > 0) )
                 {
-                    memcpy(groups[k], &cur_highlights, sizeof(HighlightGroup));
+                    groups[k]->score = score;
+                    groups[k]->beg = i - n;
+                    groups[k]->end = i;
+                    groups[k]->positions[0].col = i - n + 1;
+                    groups[k]->positions[0].len = n;
+                    groups[k]->end_index = 1;
                     return groups[k];
                 }
             }
@@ -1258,17 +1910,10 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
                 {
                     max_prefix_score = prefix_score;
                     pText_ctxt->offset = i;
-                    HighlightGroup* pGroup = evaluateHighlights(pText_ctxt, pPattern_ctxt, k + n, groups);
+                    pGroup = evaluateHighlights(pText_ctxt, pPattern_ctxt, k + n, groups);
                     if ( pGroup && pGroup->end )
                     {
                         score = prefix_score + pGroup->score - 0.3f * (pGroup->beg - i);
-                        cur_highlights.score = score;
-                        cur_highlights.beg = i - n;
-                        cur_highlights.end = pGroup->end;
-                        cur_highlights.positions[0].col = i - n + 1;
-                        cur_highlights.positions[0].len = n;
-                        memcpy(cur_highlights.positions + 1, pGroup->positions, pGroup->end_index * sizeof(HighlightPos));
-                        cur_highlights.end_index = pGroup->end_index + 1;
                     }
                     else
                     {
@@ -1279,7 +1924,22 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
             if ( score > max_score )
             {
                 max_score = score;
-                memcpy(groups[k], &cur_highlights, sizeof(HighlightGroup));
+                groups[k]->score = score;
+                groups[k]->beg = i - n;
+                groups[k]->positions[0].col = i - n + 1;
+                groups[k]->positions[0].len = n;
+                /* only the prefix of the pattern is matched here, the rest is in pGroup */
+                if ( pGroup && pGroup->end )
+                {
+                    groups[k]->end = pGroup->end;
+                    memcpy(groups[k]->positions + 1, pGroup->positions, pGroup->end_index * sizeof(HighlightPos));
+                    groups[k]->end_index = pGroup->end_index + 1;
+                }
+                else
+                {
+                    groups[k]->end = i;
+                    groups[k]->end_index = 1;
+                }
             }
             /* e.g., text = '~_ababc~~~~', pattern = 'abc' */
             special = 0;
@@ -1319,13 +1979,13 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
             if ( text[i-1] == '/' )
 #endif
                 special = k == 0 ? 5 : 3;
-            else if ( isupper(text[i]) )
-                special = !isupper(text[i-1]) || (i+1 < text_len && islower(text[i+1])) ? 3 : 0;
+            else if ( FM_ISUPPER(pPattern_ctxt, text[i]) )
+                special = !FM_ISUPPER(pPattern_ctxt, text[i-1]) || (i+1 < text_len && FM_ISLOWER(pPattern_ctxt, text[i+1])) ? 3 : 0;
             /* else if ( text[i-1] == '_' || text[i-1] == '-' || text[i-1] == ' ' ) */
             /*     special = 3;                                                     */
             /* else if ( text[i-1] == '.' )                                         */
             /*     special = 3;                                                     */
-            else if ( !isalnum(text[i-1]) )
+            else if ( !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                 special = 3;
             else
                 special = 0;
@@ -1339,7 +1999,8 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
     /* e.g., text = '~~~~abcd', pattern = 'abcd' */
     if ( i == text_len )
     {
-        if ( ~d >> (pattern_len - 1) )
+        /* if more than 63 characters are left, the rest of the pattern can not be matched */
+        if ( pattern_len < 64 && (~d >> (pattern_len - 1)) )
         {
             float score = (float)(special > 0 ? (pattern_len > 1 ? valTable[pattern_len + 1] : valTable[pattern_len]) + special
                             : valTable[pattern_len]);
@@ -1364,14 +2025,11 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
  * is the length of the highlight in bytes.
  * e.g., [ [2,3], [6,2], [10,4], ... ]
  */
-HighlightGroup* getHighlights(const char* text,
-                              uint16_t text_len,
-                              PatternContext* pPattern_ctxt,
-                              uint8_t is_name_only)
+static HighlightGroup* _getHighlights(const char* text,
+                                      uint16_t text_len,
+                                      PatternContext* pPattern_ctxt,
+                                      uint8_t is_name_only)
 {
-    if ( !text || !pPattern_ctxt )
-        return NULL;
-
     uint16_t col_num = 0;
     uint64_t* text_mask = NULL;
     const char* pattern = pPattern_ctxt->pattern;
@@ -1388,7 +2046,7 @@ HighlightGroup* getHighlights(const char* text,
 
     if ( pattern_len == 1 )
     {
-        if ( isupper(first_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, first_char) )
         {
             int16_t first_char_pos = -1;
             int16_t i;
@@ -1423,12 +2081,12 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
                 {
                     if ( first_char_pos == -1 )
                         first_char_pos = i;
 
-                    if ( isupper(text[i]) || i == 0 || !isalnum(text[i-1]) )
+                    if ( FM_ISUPPER(pPattern_ctxt, text[i]) || i == 0 || !FM_ISALNUM(pPattern_ctxt, text[i-1]) )
                     {
                         first_char_pos = i;
                         break;
@@ -1460,7 +2118,7 @@ HighlightGroup* getHighlights(const char* text,
         int16_t i;
         for ( i = 0; i < text_len; ++i )
         {
-            if ( tolower(text[i]) == first_char )
+            if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
             {
                 first_char_pos = i;
                 break;
@@ -1470,7 +2128,7 @@ HighlightGroup* getHighlights(const char* text,
         int16_t last_char_pos = -1;
         for ( i = text_len - 1; i >= first_char_pos; --i )
         {
-            if ( tolower(text[i]) == last_char )
+            if ( FM_TOLOWER(pPattern_ctxt, text[i]) == last_char )
             {
                 last_char_pos = i;
                 break;
@@ -1488,7 +2146,7 @@ HighlightGroup* getHighlights(const char* text,
         char c;
         for ( i = first_char_pos; i <= last_char_pos; ++i )
         {
-            c = tolower(text[i]);
+            c = FM_TOLOWER(pPattern_ctxt, text[i]);
             /* c in pattern */
             if ( pattern_mask[(uint8_t)c] != -1 )
                 text_mask[(uint8_t)c * col_num + (i >> 6)] |= 1ULL << (i & 63);
@@ -1497,7 +2155,7 @@ HighlightGroup* getHighlights(const char* text,
     else
     {
         int16_t first_char_pos = -1;
-        if ( isupper(first_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, first_char) )
         {
             int16_t i;
             for ( i = 0; i < text_len; ++i )
@@ -1514,7 +2172,7 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == first_char )
                 {
                     first_char_pos = i;
                     break;
@@ -1523,7 +2181,7 @@ HighlightGroup* getHighlights(const char* text,
         }
 
         int16_t last_char_pos = -1;
-        if ( isupper(last_char) )
+        if ( FM_ISUPPER(pPattern_ctxt, last_char) )
         {
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
@@ -1540,7 +2198,7 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
             {
-                if ( tolower(text[i]) == last_char )
+                if ( FM_TOLOWER(pPattern_ctxt, text[i]) == last_char )
                 {
                     last_char_pos = i;
                     break;
@@ -1562,13 +2220,13 @@ HighlightGroup* getHighlights(const char* text,
         for ( i = first_char_pos; i <= last_char_pos; ++i )
         {
             c = text[i];
-            if ( isupper(c) )
+            if ( FM_ISUPPER(pPattern_ctxt, c) )
             {
                 /* c in pattern */
                 if ( pattern_mask[(uint8_t)c] != -1 )
                     text_mask[(uint8_t)c * col_num + (i >> 6)] |= 1ULL << (i & 63);
-                if ( pattern_mask[(uint8_t)tolower(c)] != -1 )
-                    text_mask[(uint8_t)tolower(c) * col_num + (i >> 6)] |= 1ULL << (i & 63);
+                if ( pattern_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c)] != -1 )
+                    text_mask[(uint8_t)FM_TOLOWER(pPattern_ctxt, c) * col_num + (i >> 6)] |= 1ULL << (i & 63);
             }
             else
             {
@@ -1613,6 +2271,97 @@ HighlightGroup* getHighlights(const char* text,
     return pGroup;
 }
 
+/**
+ * a pattern longer than 63 characters is matched 63 characters at a time,
+ * merge the adjacent positions split by this.
+ */
+static void mergeHighlights(HighlightGroup* pGroup)
+{
+    uint16_t i;
+    uint16_t j = 0;
+    for ( i = 1; i < pGroup->end_index; ++i )
+    {
+        if ( pGroup->positions[j].col + pGroup->positions[j].len == pGroup->positions[i].col )
+        {
+            pGroup->positions[j].len += pGroup->positions[i].len;
+        }
+        else
+        {
+            pGroup->positions[++j] = pGroup->positions[i];
+        }
+    }
+    pGroup->end_index = j + 1;
+}
+
+HighlightGroup* getHighlights(const char* text,
+                              uint16_t text_len,
+                              PatternContext* pPattern_ctxt,
+                              uint8_t is_name_only)
+{
+    if ( !text || !pPattern_ctxt )
+        return NULL;
+
+    if ( !pPattern_ctxt->is_utf8 )
+    {
+        HighlightGroup* pGroup = _getHighlights(text, text_len, pPattern_ctxt, is_name_only);
+        if ( pGroup && pPattern_ctxt->long_pattern_mask )
+            mergeHighlights(pGroup);
+
+        return pGroup;
+    }
+
+    if ( !hasNonAscii(text, text_len) )
+        return NULL;
+
+    char buffer[SYMBOL_BUFFER_SIZE];
+    uint16_t offset_buffer[SYMBOL_BUFFER_SIZE + 1];
+    char* symbols = buffer;
+    uint16_t* offsets = offset_buffer;
+    if ( text_len > SYMBOL_BUFFER_SIZE )
+    {
+        symbols = (char*)malloc(text_len);
+        if ( !symbols )
+        {
+            fprintf(stderr, "Out of memory in getHighlights()!\n");
+            return NULL;
+        }
+        offsets = (uint16_t*)malloc((text_len + 1) * sizeof(uint16_t));
+        if ( !offsets )
+        {
+            free(symbols);
+            fprintf(stderr, "Out of memory in getHighlights()!\n");
+            return NULL;
+        }
+    }
+
+    uint16_t symbol_len = textToSymbols(pPattern_ctxt, text, text_len, symbols, offsets);
+    HighlightGroup* pGroup = _getHighlights(symbols, symbol_len, pPattern_ctxt, is_name_only);
+
+    /* convert the positions of the symbols to the byte positions */
+    if ( pGroup )
+    {
+        if ( pPattern_ctxt->long_pattern_mask )
+            mergeHighlights(pGroup);
+
+        uint16_t i;
+        for ( i = 0; i < pGroup->end_index; ++i )
+        {
+            uint16_t beg = offsets[pGroup->positions[i].col - 1];
+            uint16_t end = offsets[pGroup->positions[i].col - 1 + pGroup->positions[i].len];
+            pGroup->positions[i].col = beg + 1;
+            pGroup->positions[i].len = end - beg;
+        }
+    }
+
+    if ( symbols != buffer )
+    {
+        free(symbols);
+        free(offsets);
+    }
+
+    return pGroup;
+}
+
 /**
  * e.g., /usr/src/example.tar.gz
  * `dirname` is "/usr/src"
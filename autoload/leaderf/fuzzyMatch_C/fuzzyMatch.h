@@ -24,10 +24,27 @@
 typedef struct PatternContext
 {
     const char* pattern;
+    /**
+     * if the pattern is longer than 63 characters, the masks are in long_pattern_mask,
+     * and pattern_mask[c] is 0 if c is in the pattern, otherwise -1.
+     */
     int64_t pattern_mask[256];
+    /* uint64_t long_pattern_mask[256][mask_words], NULL if the pattern is shorter than 64 characters */
+    uint64_t* long_pattern_mask;
+    uint16_t mask_words;
     uint16_t pattern_len;
-    uint16_t actual_pattern_len;
     uint8_t is_lower;
+    /**
+     * if the pattern contains non-ASCII characters, each character of the pattern
+     * and the text is converted to a one-byte symbol, see initPattern()
+     */
+    uint8_t is_utf8;
+    uint8_t ctype[256];
+    char lower[256];
+    char upper[256];
+    /* hash table that maps the code points in the pattern to symbols */
+    uint32_t code_points[256];
+    uint8_t symbols[256];
 }PatternContext;
 
 typedef struct HighlightPos
@@ -41,10 +58,14 @@ typedef struct HighlightGroup
     float score;
     uint16_t beg;
     uint16_t end;
-    HighlightPos positions[64];
     uint16_t end_index;
+    /* the actual size is the length of the pattern, see HIGHLIGHT_GROUP_SIZE() */
+    HighlightPos positions[1];
 }HighlightGroup;
 
+/* the size of a HighlightGroup that can hold `n` positions */
+#define HIGHLIGHT_GROUP_SIZE(n) (sizeof(HighlightGroup) + ((n) - 1) * sizeof(HighlightPos))
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -249,6 +249,18 @@ class AnyExplManager(Manager):
         else:
             return 0
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        if self._config.get("get_digest"):
+            return None
+        else:
+            return {}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -201,6 +201,19 @@ class BufExplManager(Manager):
                         - int(lfEval("strdisplaywidth('%s')" % escQuote(basename)))
             return prefix_len + lfBytesLen(basename) + space_num + 2
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        if mode == 0:
+            return {"skip": self._getExplorer().getPrefixLength()}
+        else:
+            # the name is got from vim.buffers
+            return None
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -276,7 +289,7 @@ class BufExplManager(Manager):
         else:
             lfCmd("setlocal modifiable")
         if len(self._content) > 0:
-            self._content.remove(line)
+            self._removeContentLine(line)
             self._getInstance().setStlTotal(len(self._content)//self._getUnit())
             self._getInstance().setStlResultsCount(len(self._content)//self._getUnit())
         buf_number = int(re.sub(r"^.*?(\d+).*$", r"\1", line))
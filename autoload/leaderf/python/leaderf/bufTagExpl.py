@@ -400,6 +400,15 @@ class BufTagExplManager(Manager):
             try:
                 if ('-2' == lfEval("g:LfNoErrMsgMatch('', '%s')" % escQuote(self._cli.pattern))):
                     return iter([])
+
+                regex = self._getNativeRegex()
+                if regex is not None:
+                    result = []
+                    for i, line in enumerate(iterable[::2]):
+                        if regex.search(self._getDigest(line, 1).strip()):
+                            result.append(line)
+                            result.append(iterable[2*i+1])
+                    return result
                 else:
                     result = []
                     for i, line in enumerate(iterable[::2]):
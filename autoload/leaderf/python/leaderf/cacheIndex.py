@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from .utils import *
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+if sys.version_info >= (3, 0):
+    def _bytes(str):
+        return str.encode('utf-8', 'surrogateescape')
+
+    def _text(str):
+        return str
+else:
+    def _bytes(str):
+        return str
+
+    def _text(str):
+        return str.decode('utf-8', 'replace') if isinstance(str, bytes) else str
+
+
+def _ancestors(dir):
+    """
+    yield `dir` and its ancestors, from the nearest to the root, all ending with os.sep.
+    """
+    while True:
+        yield dir
+        parent = os.path.dirname(dir.rstrip(os.sep))
+        parent = parent if parent.endswith(os.sep) else parent + os.sep
+        if parent == dir:
+            break
+        dir = parent
+
+
+class CacheIndex(object):
+    """
+    The index of the caches of the file lists in `cache_dir`.
+    An entry is keyed by the hash of its directory, the cache file of the entry is named
+    after the key, and the entries are kept in the least recently used order.
+    Every operation reads, updates and writes the index with the lock file held,
+    the index file is replaced atomically, so that it is shared by the instances of vim.
+    An entry is a dict of:
+        dir:        the cached directory, ending with os.sep
+        time:       the time of the last access
+        cmd:        the command that listed the files, '' if the files are listed by the built-in walker
+        count:      the number of the files
+        duration:   the seconds it took to list the files
+    the copies of the entries returned have 'file' too, the path of the cache file.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._index_file = os.path.join(cache_dir, 'cacheIndex.json')
+        self._lock_file = os.path.join(cache_dir, 'cacheIndex.lock')
+        if not os.path.exists(self._index_file):
+            self._removeLegacyIndex()
+
+    def _removeLegacyIndex(self):
+        """
+        remove the text index of the old versions and its cache files, which can not be read any more.
+        """
+        legacy_index = os.path.join(self._cache_dir, 'cacheIndex')
+        if not os.path.exists(legacy_index):
+            return
+
+        try:
+            with lfOpen(legacy_index, 'r', errors='ignore') as f:
+                for line in f:
+                    fields = line.split(None, 2)
+                    if len(fields) == 3:
+                        path = os.path.join(self._cache_dir, fields[1])
+                        if os.path.exists(path):
+                            os.remove(path)
+            os.remove(legacy_index)
+        except (IOError, OSError):
+            pass
+
+    @staticmethod
+    def _key(dir):
+        return hashlib.md5(_bytes(dir)).hexdigest()
+
+    def cacheFile(self, dir):
+        """
+        return the path of the cache file of `dir`, which is written before the entry is added,
+        so that the entry is never seen without its cache file.
+        """
+        dir = dir if dir.endswith(os.sep) else dir + os.sep
+        return os.path.join(self._cache_dir, 'cache_' + self._key(dir))
+
+    def _copy(self, entry):
+        """
+        return a copy of `entry` with the path of its cache file as 'file'.
+        """
+        entry = dict(entry)
+        entry['file'] = os.path.join(self._cache_dir, 'cache_' + entry['key'])
+        return entry
+
+    @contextmanager
+    def _lock(self):
+        with open(self._lock_file, 'ab') as f:
+            locked = True
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            except (IOError, OSError):
+                # e.g., the file system does not support locking, go on without the lock
+                locked = False
+
+            try:
+                yield
+            finally:
+                if locked:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load(self):
+        """
+        return an OrderedDict of {key: entry}, from the least recently used to the most recently used.
+        """
+        entries = OrderedDict()
+        try:
+            with lfOpen(self._index_file, 'r', errors='ignore') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                for entry in data['entries']:
+                    entries[entry['key']] = entry
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        return entries
+
+    def _save(self, entries):
+        tmp_file = '%s.%d.tmp' % (self._index_file, os.getpid())
+        with lfOpen(tmp_file, 'w', errors='ignore') as f:
+            json.dump({'version': self.VERSION, 'entries': list(entries.values())}, f)
+
+        if os.name == 'nt' and os.path.exists(self._index_file):
+            os.remove(self._index_file)
+        os.rename(tmp_file, self._index_file)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock():
+            entries = self._load()
+            yield entries
+            self._save(entries)
+
+    def _touch(self, entries, key):
+        entry = entries.pop(key)
+        entry['time'] = time.time()
+        entries[key] = entry
+        return self._copy(entry)
+
+    def find(self, dir, nearest=False, touch=True):
+        """
+        return a copy of the entry of `dir`, or the entry of its nearest ancestor if `nearest` is True,
+        or None if there is no such entry. The entry becomes the most recently used if `touch` is True.
+        """
+        dir = dir if dir.endswith(os.sep) else dir + os.sep
+        entries = self._load()
+        for d in (_ancestors(dir) if nearest else (dir,)):
+            key = self._key(d)
+            if key in entries:
+                break
+        else:
+            return None
+
+        if not touch:
+            return self._copy(entries[key])
+
+        with self._transaction() as entries:
+            # the entry may have been evicted by another instance of vim
+            return self._touch(entries, key) if key in entries else None
+
+    def add(self, dir, capacity, cmd='', count=0, duration=0.0):
+        """
+        add or update the entry of `dir` as the most recently used and return a copy of it.
+        If there are more than `capacity` entries, the entries of the sub-directories of `dir`,
+        which are covered by `dir`, are evicted first, then the least recently used ones.
+        """
+        dir = dir if dir.endswith(os.sep) else dir + os.sep
+        key = self._key(dir)
+        with self._transaction() as entries:
+            entries.pop(key, None)
+            entries[key] = {
+                    'key': key,
+                    'dir': _text(dir),
+                    'time': time.time(),
+                    'cmd': _text(cmd or ''),
+                    'count': count,
+                    'duration': round(duration, 3),
+                    }
+
+            if len(entries) > capacity:
+                prefix = _text(dir)
+                evicted = [k for k, e in entries.items() if k != key and e['dir'].startswith(prefix)]
+                evicted += [k for k in entries if k != key and k not in evicted]
+                for k in evicted[:len(entries) - max(capacity, 1)]:
+                    self._removeCacheFile(entries.pop(k))
+
+            return self._copy(entries[key])
+
+    def remove(self, dir):
+        """
+        remove the entry of `dir` and its cache file.
+        """
+        dir = dir if dir.endswith(os.sep) else dir + os.sep
+        key = self._key(dir)
+        if key not in self._load():
+            return
+
+        with self._transaction() as entries:
+            entry = entries.pop(key, None)
+            if entry is not None:
+                self._removeCacheFile(entry)
+
+    def _removeCacheFile(self, entry):
+        try:
+            os.remove(self._copy(entry)['file'])
+        except OSError:
+            pass
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from .utils import *
+
+
+class ChunkScheduler(object):
+    """
+    A class to decide how many lines are filtered one time, so that
+    filtering a chunk takes about `latency` seconds and the UI keeps responsive.
+    The speed of each kind of filter is measured, because it varies with
+    the filter method, the length of the lines and the load of the machine.
+    The first chunk of each kind is not measured, it is filtered with the default
+    step, because it includes the work done only once, e.g., registering the corpus.
+    """
+    # a chunk smaller than this is neither scheduled nor measured
+    MIN_STEP = 1000
+
+    def __init__(self, latency=0.012):
+        self._latency = latency
+        self._speeds = {}   # lines per second of each kind of filter
+        self._warmed_up = set()  # the kinds of filter whose first chunk is filtered
+
+    def setLatency(self, latency):
+        self._latency = latency
+
+    def getStep(self, kind, default):
+        """
+        return the number of lines to be filtered in a chunk,
+        the fixed `default` is returned if the speed of `kind` is not measured yet.
+        """
+        speed = self._speeds.get(kind)
+        if speed is None:
+            return default
+
+        return max(int(speed * self._latency), self.MIN_STEP)
+
+    def record(self, kind, line_count, elapsed):
+        """
+        record that it takes `elapsed` seconds to filter `line_count` lines.
+        """
+        if line_count < self.MIN_STEP or elapsed <= 0:
+            return
+
+        if kind not in self._warmed_up:
+            self._warmed_up.add(kind)
+            return
+
+        speed = line_count / elapsed
+        if kind in self._speeds:
+            # smooth out the noise of a single measurement
+            speed = (self._speeds[kind] + speed) / 2
+
+        self._speeds[kind] = speed
+
+    def exportSpeeds(self):
+        """
+        export the observed speeds to g:Lf_FilterSpeed, it is called when the explorer quits,
+        instead of every time a chunk is filtered.
+        """
+        if self._speeds:
+            lfCmd("let g:Lf_FilterSpeed = %s" % json.dumps(dict((k, int(v)) for k, v in self._speeds.items())))
+
+    def getSpeeds(self):
+        """
+        return a dict of the observed speeds, in lines per second.
+        """
+        return dict(self._speeds)
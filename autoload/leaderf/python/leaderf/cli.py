@@ -57,6 +57,7 @@ class LfCli(object):
         self._cursor_pos = 0
         self._start_time = datetime.now()
         self._idle = False
+        self._is_inputting = False
         self._blinkon = True
         self._key_dict = lfEval("g:Lf_KeyDict")
         self._refine = False
@@ -655,9 +656,20 @@ class LfCli(object):
     def isFuzzy(self):
         return self._is_fuzzy
 
+    def isKeyPending(self):
+        """
+        return True if a key is typed but not read by input() yet,
+        e.g., a key typed while the result of the previous key is being filtered.
+        """
+        if not self._is_inputting:
+            return False
+
+        return lfEval("getchar(1)") != '0'
+
     @cursorController
     def input(self, callback):
         try:
+            self._is_inputting = True
             self._history_index = 0
             self._blinkon = True
             start = time.time()
@@ -842,3 +854,5 @@ class LfCli(object):
         except vim.error: # for neovim
             lfCmd("call getchar(0)")
             yield '<Quit>'
+        finally:
+            self._is_inputting = False
@@ -94,6 +94,9 @@ class CommandExplManager(Manager):
     def _getDegestStartPos(self, line, mode):
         return 0
 
+    def _getDigestSpec(self, mode):
+        return {}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/o : execute command under cursor')
@@ -5,16 +5,24 @@ import vim
 import re
 import os
 import os.path
-import fnmatch
 import time
 import locale
+import itertools
 from functools import wraps
+from array import array
 from .utils import *
 from .explorer import *
 from .manager import *
 from .asyncExecutor import AsyncExecutor
+from .fileWalker import FileWalker
+from .ignoreFile import findGitRoot
+from .gitIndex import getTrackedFiles
+from .fileListCache import writeFileList, readFileList
+from .cacheIndex import CacheIndex
+from .mru import *
 from .devicons import (
     webDevIconsGetFileTypeSymbol,
+    webDevIconsStrLen,
     removeDevIcons,
     matchaddDevIconsDefault,
     matchaddDevIconsExact,
@@ -61,108 +69,114 @@ class FileExplorer(Explorer):
                                        'LeaderF',
                                        'python' + lfEval("g:Lf_PythonVersion"),
                                        'file')
-        self._cache_index = os.path.join(self._cache_dir, 'cacheIndex')
         self._external_cmd = None
         self._initCache()
+        self._cache_index = CacheIndex(self._cache_dir)
         self._executor = []
         self._no_ignore = None
         self._cmd_work_dir = ""
+        self._walk_info = None
+        # the command to list the untracked files if the tracked files can be read from the git index
+        self._git_others_cmd = None
 
     def _initCache(self):
         if not os.path.exists(self._cache_dir):
             os.makedirs(self._cache_dir)
-        if not os.path.exists(self._cache_index):
-            with lfOpen(self._cache_index, 'w', errors='ignore'):
-                pass
+
+    def _walkFiles(self, walker, dir, format_line=None):
+        """
+        return an AsyncExecutor.Result of the files in `dir` found by `walker`.
+        """
+        self._executor.append(walker)
+        return walker.walk(dir, lfEval("g:Lf_WildIgnore"),
+                           lfEval("g:Lf_FollowLinks") == '1',
+                           float(lfEval("g:Lf_IndexTimeLimit")),
+                           format_line,
+                           self._no_ignore is None)
 
     def _getFiles(self, dir):
-        start_time = time.time()
-        wildignore = lfEval("g:Lf_WildIgnore")
-        file_list = []
-        for dir_path, dirs, files in os.walk(dir, followlinks = False
-                if lfEval("g:Lf_FollowLinks") == '0' else True):
-            dirs[:] = [i for i in dirs if True not in (fnmatch.fnmatch(i,j)
-                       for j in wildignore.get('dir', []))]
-            for name in files:
-                if True not in (fnmatch.fnmatch(name, j)
-                                for j in wildignore.get('file', [])):
-                    file_list.append(lfEncode(os.path.join(dir_path,name)))
-                if time.time() - start_time > float(
-                        lfEval("g:Lf_IndexTimeLimit")):
-                    return file_list
-        return file_list
+        return list(self._walkFiles(FileWalker(), dir))
+
+    def _getCachedDir(self, dir):
+        """
+        return the cached directory which is `dir` or its nearest ancestor, or None if there is none.
+        """
+        entry = self._cache_index.find(dir, nearest=True, touch=False)
+        return entry['dir'] if entry else None
+
+    def _streamFileList(self, dir):
+        """
+        return the files in `dir` as they are found, the same lines as _getFileList(),
+        the files are cached by setContent() if it takes long to find them.
+        """
+        if lfEval("g:Lf_ShowRelativePath") == '1':
+            # os.path.relpath() is too slow!
+            cwd_length = len(lfEncode(dir))
+            if not dir.endswith(os.sep):
+                cwd_length += 1
+        else:
+            cwd_length = 0
+
+        if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1":
+            format = lambda line: format_line(line[cwd_length:])
+        else:
+            format = lambda line: line[cwd_length:]
+
+        walker = FileWalker()
+        self._walk_info = (walker, dir, cwd_length)
+        self._cmd_start_time = time.time()
+        return self._walkFiles(walker, dir, format)
+
+    @removeDevIcons
+    def _cacheFileList(self, content):
+        """
+        cache the files found by _streamFileList() in the same way as _getFileList().
+        """
+        walker, dir, cwd_length = self._walk_info
+        self._walk_info = None
+        # the cached files are used regardless of --no-ignore
+        if walker.isKilled() or self._no_ignore is not None:
+            return
+
+        delta_seconds = time.time() - self._cmd_start_time
+        if delta_seconds <= float(lfEval("g:Lf_NeedCacheTime")):
+            return
+
+        if cwd_length > 0:
+            prefix = lfEncode(dir if dir.endswith(os.sep) else dir + os.sep)
+            file_list = [prefix + line for line in content]
+        else:
+            file_list = content
+        self._addFileListCache(dir, file_list, delta_seconds)
 
     @showDevIcons
     @showRelativePath
     def _getFileList(self, dir):
         dir = dir if dir.endswith(os.sep) else dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            path_length = 0
-            target = -1
-            for i, line in enumerate(lines):
-                path = line.split(None, 2)[2].strip()
-                if dir.startswith(path) and len(path) > path_length:
-                    path_length = len(path)
-                    target = i
-
-            if target != -1:
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'r', errors='ignore') as cache_file:
-                    if lines[target].split(None, 2)[2].strip() == dir:
-                        return cache_file.readlines()
-                    else:
-                        file_list = [line for line in cache_file.readlines()
-                                     if line.startswith(dir)]
-                        if file_list == []:
-                            file_list = self._getFiles(dir)
-                        return file_list
-            else:
-                start_time = time.time()
-                file_list = self._getFiles(dir)
-                delta_seconds = time.time() - start_time
-                if delta_seconds > float(lfEval("g:Lf_NeedCacheTime")):
-                    cache_file_name = ''
-                    if len(lines) < int(lfEval("g:Lf_NumberOfCache")):
-                        f.seek(0, 2)
-                        ts = time.time()
-                        line = '%.3f cache_%.3f %s\n' % (ts, ts, dir)
-                        f.write(line)
-                        cache_file_name = 'cache_%.3f' % ts
-                    else:
-                        for i, line in enumerate(lines):
-                            path = line.split(None, 2)[2].strip()
-                            if path.startswith(dir):
-                                cache_file_name = line.split(None, 2)[1].strip()
-                                line = '%.3f %s %s\n' % (time.time(),
-                                        cache_file_name, dir)
-                                break
-                        if cache_file_name == '':
-                            timestamp = lines[0].split(None, 2)[0]
-                            oldest = 0
-                            for i, line in enumerate(lines):
-                                if line.split(None, 2)[0] < timestamp:
-                                    timestamp = line.split(None, 2)[0]
-                                    oldest = i
-                            cache_file_name = lines[oldest].split(None, 2)[1].strip()
-                            lines[oldest] = '%.3f %s %s\n' % (time.time(),
-                                            cache_file_name, dir)
-                        f.seek(0)
-                        f.truncate(0)
-                        f.writelines(lines)
-                    with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                                'w', errors='ignore') as cache_file:
-                        for line in file_list:
-                            cache_file.write(line + '\n')
+        entry = self._cache_index.find(dir, nearest=True)
+        if entry is not None:
+            if entry['file'] == self._cache_index.cacheFile(dir):
+                file_list = readFileList(entry['file'])
+            else:
+                file_list = readFileList(entry['file'], lfEncode(dir)) or None
+            # None if the cache file is removed by another instance of vim
+            if file_list is not None:
                 return file_list
 
+        start_time = time.time()
+        file_list = self._getFiles(dir)
+        delta_seconds = time.time() - start_time
+        if delta_seconds > float(lfEval("g:Lf_NeedCacheTime")):
+            self._addFileListCache(dir, file_list, delta_seconds)
+        return file_list
+
+    def _addFileListCache(self, dir, file_list, duration):
+        """
+        cache the files in `dir` found by _getFiles() or _streamFileList() in `duration` seconds.
+        """
+        writeFileList(self._cache_index.cacheFile(dir), file_list)
+        self._cache_index.add(dir, int(lfEval("g:Lf_NumberOfCache")), '', len(file_list), duration)
+
     @showDevIcons
     def _readFromFileList(self, files):
         result = []
@@ -173,28 +187,10 @@ class FileExplorer(Explorer):
 
     def _refresh(self):
         dir = os.path.abspath(self._cur_dir)
-        dir = dir if dir.endswith(os.sep) else dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            path_length = 0
-            target = -1
-            for i, line in enumerate(lines):
-                path = line.split(None, 2)[2].strip()
-                if dir.startswith(path) and len(path) > path_length:
-                    path_length = len(path)
-                    target = i
-
-            if target != -1:
-                lines[target] = re.sub(r'^\S*', '%.3f' % time.time(), lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                cache_file_name = lines[target].split(None, 2)[1]
-                file_list = self._getFiles(dir)
-                with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                            'w', errors='ignore') as cache_file:
-                    for line in file_list:
-                        cache_file.write(line + '\n')
+        if self._cache_index.find(dir, nearest=True) is not None:
+            start_time = time.time()
+            file_list = self._getFiles(dir)
+            self._addFileListCache(dir, file_list, time.time() - start_time)
 
     def _exists(self, path, dir):
         """
@@ -236,7 +232,35 @@ class FileExplorer(Explorer):
             else:
                 return glob
 
+    def _getTrackedFiles(self, dir):
+        """
+        return the tracked files in `dir` read from the git index, the same lines as
+        the output of `git ls-files`, or None if they can not be read from the index.
+        """
+        if self._git_others_cmd is None:
+            return None
+
+        git_root = findGitRoot(dir)
+        if git_root is None:
+            return None
+
+        files = getTrackedFiles(git_root)
+        if files is None:
+            return None
+
+        rel_dir = os.path.relpath(os.path.abspath(dir), git_root).replace(os.sep, '/')
+        if rel_dir != '.':
+            prefix = rel_dir + '/'
+            prefix_len = len(prefix)
+            files = [f[prefix_len:] for f in files if f.startswith(prefix)]
+
+        if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1":
+            files = [format_line(f) for f in files]
+
+        return files
+
     def _buildCmd(self, dir, **kwargs):
+        self._git_others_cmd = None
         if self._cmd_work_dir:
             if os.name == 'nt':
                 cd_cmd = 'cd /d "{}" && '.format(dir)
@@ -256,6 +280,11 @@ class FileExplorer(Explorer):
             self._external_cmd = cmd
             return cmd
 
+        # the files are indexed by FileWalker
+        if lfEval("g:Lf_UseBuiltinIndexer") == '1':
+            self._external_cmd = None
+            return None
+
         if lfEval("g:Lf_UseVersionControlTool") == '1':
             if self._exists(dir, ".git") and lfEval("executable('git')") == '1':
                 wildignore = lfEval("g:Lf_WildIgnore")
@@ -281,8 +310,14 @@ class FileExplorer(Explorer):
 
                 if cd_cmd:
                     cmd = cd_cmd + 'git ls-files %s && git ls-files --others %s %s' % (recurse_submodules, no_ignore, ignore)
+                    others_cmd = cd_cmd + 'git ls-files --others %s %s' % (no_ignore, ignore)
                 else:
                     cmd = 'git ls-files %s "%s" && git ls-files --others %s %s "%s"' % (recurse_submodules, dir, no_ignore, ignore, dir)
+                    others_cmd = 'git ls-files --others %s %s "%s"' % (no_ignore, ignore, dir)
+
+                # the files of the submodules are not in the index
+                if not recurse_submodules:
+                    self._git_others_cmd = others_cmd
                 self._external_cmd = cmd
                 return cmd
             elif self._exists(dir, ".hg") and lfEval("executable('hg')") == '1':
@@ -472,112 +507,46 @@ class FileExplorer(Explorer):
     @removeDevIcons
     def _writeCache(self, content):
         dir = self._cur_dir if self._cur_dir.endswith(os.sep) else self._cur_dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            target = -1
-            for i, line in enumerate(lines):
-                if dir == line.split(None, 2)[2].strip():
-                    target = i
-                    break
-
-            if target != -1:    # already cached
-                if time.time() - self._cmd_start_time <= float(lfEval("g:Lf_NeedCacheTime")):
-                    os.remove(os.path.join(self._cache_dir, lines[target].split(None, 2)[1]))
-                    del lines[target]
-                    f.seek(0)
-                    f.truncate(0)
-                    f.writelines(lines)
-                    return
-
-                # update the time
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'w', errors='ignore') as cache_file:
-                    for line in content:
-                        cache_file.write(line + '\n')
-            else:
-                if time.time() - self._cmd_start_time <= float(lfEval("g:Lf_NeedCacheTime")):
-                    return
-
-                cache_file_name = ''
-                if len(lines) < int(lfEval("g:Lf_NumberOfCache")):
-                    f.seek(0, 2)
-                    ts = time.time()
-                    # e.g., line = "1496669495.329 cache_1496669495.329 /foo/bar"
-                    line = '%.3f cache_%.3f %s\n' % (ts, ts, dir)
-                    f.write(line)
-                    cache_file_name = 'cache_%.3f' % ts
-                else:
-                    timestamp = lines[0].split(None, 2)[0]
-                    oldest = 0
-                    for i, line in enumerate(lines):
-                        if line.split(None, 2)[0] < timestamp:
-                            timestamp = line.split(None, 2)[0]
-                            oldest = i
-                    cache_file_name = lines[oldest].split(None, 2)[1].strip()
-                    lines[oldest] = '%.3f %s %s\n' % (time.time(), cache_file_name, dir)
-
-                    f.seek(0)
-                    f.truncate(0)
-                    f.writelines(lines)
-
-                with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                            'w', errors='ignore') as cache_file:
-                    for line in content:
-                        cache_file.write(line + '\n')
+        delta_seconds = time.time() - self._cmd_start_time
+        if delta_seconds <= float(lfEval("g:Lf_NeedCacheTime")):
+            self._cache_index.remove(dir)
+            return
+
+        writeFileList(self._cache_index.cacheFile(dir), content)
+        self._cache_index.add(dir, int(lfEval("g:Lf_NumberOfCache")),
+                              self._external_cmd, len(content), delta_seconds)
 
     @showDevIcons
     def _getFilesFromCache(self):
         dir = self._cur_dir if self._cur_dir.endswith(os.sep) else self._cur_dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            target = -1
-            for i, line in enumerate(lines):
-                if dir == line.split(None, 2)[2].strip():
-                    target = i
-                    break
-
-            if target != -1:    # already cached
-                # update the time
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'r', errors='ignore') as cache_file:
-                    file_list = cache_file.readlines()
-                    if not file_list: # empty
-                        return None
-
-                    if lfEval("g:Lf_ShowRelativePath") == '1':
-                        if os.path.isabs(file_list[0]):
-                            # os.path.relpath() is too slow!
-                            cwd_length = len(lfEncode(dir))
-                            if not dir.endswith(os.sep):
-                                cwd_length += 1
-                            return [line[cwd_length:] for line in file_list]
-                        else:
-                            return file_list
-                    else:
-                        if os.path.isabs(file_list[0]):
-                            return file_list
-                        else:
-                            return [os.path.join(lfEncode(dir), file) for file in file_list]
+        entry = self._cache_index.find(dir)
+        if entry is None:
+            return None
+
+        file_list = readFileList(entry['file'])
+        if not file_list: # empty, or the cache file is removed by another instance of vim
+            return None
+
+        if lfEval("g:Lf_ShowRelativePath") == '1':
+            if os.path.isabs(file_list[0]):
+                # os.path.relpath() is too slow!
+                cwd_length = len(lfEncode(dir))
+                if not dir.endswith(os.sep):
+                    cwd_length += 1
+                return [line[cwd_length:] for line in file_list]
             else:
-                return None
+                return file_list
+        else:
+            if os.path.isabs(file_list[0]):
+                return file_list
+            else:
+                return [os.path.join(lfEncode(dir), file) for file in file_list]
 
     def setContent(self, content):
         self._content = content
-        if lfEval("g:Lf_UseCache") == '1':
+        if self._walk_info is not None:
+            self._cacheFileList(content)
+        elif lfEval("g:Lf_UseCache") == '1':
             self._writeCache(content)
 
     def getContentFromMultiDirs(self, dirs, **kwargs):
@@ -630,6 +599,7 @@ class FileExplorer(Explorer):
         dir = lfGetCwd()
 
         self._cmd_work_dir = ""
+        self._walk_info = None
         directory = kwargs.get("arguments", {}).get("directory")
         if directory and len(directory) > 1:
             return self.getContentFromMultiDirs(directory, **kwargs)
@@ -671,6 +641,11 @@ class FileExplorer(Explorer):
             if cmd:
                 executor = AsyncExecutor()
                 self._executor.append(executor)
+                # only the untracked files are listed by git if the index can be read
+                tracked_files = self._getTrackedFiles(dir)
+                if tracked_files is not None:
+                    cmd = self._git_others_cmd
+
                 if cmd.split(None, 1)[0] == "dir":
                     content = executor.execute(cmd, format_line)
                 else:
@@ -678,8 +653,13 @@ class FileExplorer(Explorer):
                         content = executor.execute(cmd, encoding=lfEval("&encoding"), format_line=format_line)
                     else:
                         content = executor.execute(cmd, encoding=lfEval("&encoding"))
+
+                if tracked_files is not None:
+                    content.join_left(tracked_files)
                 self._cmd_start_time = time.time()
                 return content
+            elif self._no_ignore is not None or self._getCachedDir(dir) is None:
+                return self._streamFileList(dir)
             else:
                 self._content = self._getFileList(dir)
 
@@ -720,6 +700,10 @@ class FileExplorer(Explorer):
 # FileExplManager
 #*****************************************************
 class FileExplManager(Manager):
+    def __init__(self):
+        super(FileExplManager, self).__init__()
+        self._prior_levels = {}
+
     def _getExplClass(self):
         return FileExplorer
 
@@ -773,6 +757,50 @@ class FileExplManager(Manager):
         if self._read_finished < 2:
             self._timer_id = lfEval("timer_start(1, 'leaderf#File#TimerCallback', {'repeat': -1})")
 
+    def _getPriorLevels(self):
+        """
+        return a dict, the key is a line of the content without the icon, the value is the
+        prior of the file, the more frecent a file in the mru cache is, the greater its prior is.
+        """
+        frecencies = mru.getFrecencies()
+        if not frecencies:
+            return {}
+
+        if self._getExplorer()._cmd_work_dir:
+            work_dir = self._getExplorer()._cmd_work_dir
+        else:
+            work_dir = self._getInstance().getCwd()
+        work_dir = mru.normalize(work_dir).rstrip(os.sep) + os.sep
+
+        names = sorted(frecencies, key=frecencies.get, reverse=True)
+        max_level = 15
+        levels = {}
+        for i, name in enumerate(names):
+            level = max_level - i * max_level // len(names)
+            levels[name] = level
+            if name.startswith(work_dir):
+                levels[name[len(work_dir):]] = level
+
+        return levels
+
+    def _getPriors(self, content, start, end):
+        if lfEval("g:Lf_FrecencyBoost") != '1':
+            return None
+
+        # the mru files change between two launches
+        if start == 0:
+            self._prior_levels = self._getPriorLevels()
+
+        if not self._prior_levels:
+            return None
+
+        if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == '1':
+            icon_len = webDevIconsStrLen()
+        else:
+            icon_len = 0
+        levels = self._prior_levels
+        return array('B', [levels.get(line[icon_len:].rstrip(), 0) for line in itertools.islice(content, start, end)])
+
     def startExplorer(self, win_pos, *args, **kwargs):
         directory = kwargs.get("arguments", {}).get("directory")
         if directory and directory[0] not in ['""', "''"]: # behavior no change for `LeaderfFile <directory>`
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import struct
+from .utils import *
+
+# The binary format of the cache of a file list:
+#
+#     header:  magic "LFFL", version, count       3 little-endian uint32
+#     blob:    the lines in the order they are listed, each one ends with '\n'
+#
+# the blob is decoded and split in one go, which is faster than reading the lines one by one,
+# and the names that are not valid utf-8 survive a round trip.
+
+MAGIC = b'LFFL'
+VERSION = 3
+HEADER = struct.Struct('<4sII')
+
+if sys.version_info >= (3, 0):
+    def _encode(line):
+        # the names that are not valid utf-8 are kept as they are, see os.fsdecode()
+        return line.encode('utf-8', 'surrogateescape')
+
+    def _decode(data):
+        return data.decode('utf-8', 'surrogateescape')
+else:
+    def _encode(line):
+        return line
+
+    def _decode(data):
+        return data
+
+
+def writeFileList(path, lines):
+    """
+    write `lines` to the cache file `path`, the file is replaced atomically.
+    """
+    data = [_encode(line) for line in lines]
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        if data:
+            f.write(b'\n'.join(data))
+            f.write(b'\n')
+
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def readFileList(path, prefix=None):
+    """
+    return the list of the lines of the cache file `path` in the order they were written,
+    only the lines starting with `prefix` if `prefix` is not None, or None if the file
+    can not be read, e.g., it is a cache file of an old format.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, count = HEADER.unpack_from(data, 0)
+    except (IOError, OSError, struct.error):
+        return None
+
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    if count == 0:
+        return []
+
+    lines = _decode(data[HEADER.size:-1]).split('\n')
+    if len(lines) != count:
+        return None
+
+    if prefix is not None:
+        return [line for line in lines if line.startswith(prefix)]
+
+    return lines
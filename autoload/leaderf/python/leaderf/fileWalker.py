@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import time
+import fnmatch
+import threading
+import multiprocessing
+from .utils import *
+from .asyncExecutor import AsyncExecutor
+from .ignoreFile import IgnoreFile, findGitRoot, getGlobalIgnoreFile
+
+if sys.version_info >= (3, 0):
+    import queue as Queue
+else:
+    import Queue
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+def compileGlobs(globs):
+    """
+    return a regex that matches a name if the name matches one of `globs`,
+    or None if `globs` is empty, so that a name is matched only once.
+    """
+    if not globs:
+        return None
+
+    # the same as fnmatch.fnmatch(), which is case insensitive if the file system is
+    flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+    return re.compile("|".join("(?:%s)" % fnmatch.translate(glob) for glob in globs), flags)
+
+
+class FileWalker(object):
+    """
+    A multi-threaded directory walker built on os.scandir().
+    Each directory is a task of a work queue shared by the threads,
+    the files of a directory are yielded as soon as it is scanned.
+    If `use_ignore_files` is True, the files ignored by .gitignore and .ignore
+    are skipped, the same as `git ls-files --cached --others --exclude-standard`
+    except that the tracked files that are ignored are skipped too.
+    """
+    def __init__(self, thread_count=0):
+        self._thread_count = thread_count or min(multiprocessing.cpu_count(), 8)
+        self._stopped = False
+        self._killed = False
+        self._dir_re = None
+        self._file_re = None
+        self._followlinks = False
+        self._ignore_names = ()
+        self._errors = []
+
+    def walk(self, dir, wildignore, followlinks=False, time_limit=0, format_line=None, use_ignore_files=False):
+        """
+        return an AsyncExecutor.Result of the files in `dir`, the same as os.walk(),
+        the files and directories whose names match `wildignore` are skipped.
+        The walk stops after `time_limit` seconds if `time_limit` > 0.
+        The threads do not call vim, so the result can be read in any thread.
+        """
+        self._dir_re = compileGlobs(wildignore.get('dir', []))
+        self._file_re = compileGlobs(wildignore.get('file', []))
+        self._followlinks = followlinks
+        self._errors = []
+
+        # a directory is walked with (its path relative to the root of the rules, the rules),
+        # the rules are a tuple of (the path of the directory of an ignore file relative to
+        # the root of the rules, the IgnoreFile), from the outermost to the innermost.
+        rules = ()
+        rel = ''
+        if use_ignore_files:
+            git_root = findGitRoot(dir)
+            if git_root is None:
+                self._ignore_names = ('.ignore',)
+            else:
+                self._ignore_names = ('.gitignore', '.ignore')
+                global_ignore = getGlobalIgnoreFile(git_root)
+                if global_ignore:
+                    rules += (('', global_ignore),)
+                info_exclude = IgnoreFile.read(os.path.join(git_root, '.git', 'info', 'exclude'))
+                if info_exclude:
+                    rules += (('', info_exclude),)
+
+                # the ignore files of the ancestors of `dir` inside the repository
+                rel_dir = os.path.relpath(os.path.abspath(dir), git_root).replace(os.sep, '/')
+                parts = [] if rel_dir == '.' else rel_dir.split('/')
+                for i in range(len(parts)):
+                    rules = self._readIgnoreFiles(os.path.join(git_root, *parts[:i]),
+                                                  '/'.join(parts[:i]), self._ignore_names, rules)
+                rel = '/'.join(parts)
+
+        if scandir is None:
+            files = self._walkSerially(dir, rel, rules, time_limit)
+        else:
+            files = self._walk(dir, rel, rules, time_limit)
+
+        if format_line:
+            files = (format_line(file) for file in files)
+
+        return AsyncExecutor.Result(files)
+
+    @staticmethod
+    def _readIgnoreFiles(path, rel, names, rules):
+        """
+        return `rules` appended with the ignore files named `names` in `path`.
+        """
+        for name in names:
+            ignore_file = IgnoreFile.read(os.path.join(path, name))
+            if ignore_file:
+                rules += ((rel + '/' if rel else '', ignore_file),)
+        return rules
+
+    @staticmethod
+    def _isIgnored(rel, is_dir, rules):
+        # the innermost ignore file takes precedence
+        for prefix, ignore_file in reversed(rules):
+            ignored = ignore_file.match(rel[len(prefix):], is_dir)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def _filter(self, path, rel, rules, entries):
+        """
+        `entries` is a list of (name, is_dir) in `path`.
+        return a tuple (files, dirs), files is a list of the paths of the files that are
+        not ignored, dirs is a list of (path, rel, rules) of the directories to walk.
+        """
+        if self._ignore_names:
+            names = [name for name, is_dir in entries if not is_dir and name in self._ignore_names]
+            if names:
+                rules = self._readIgnoreFiles(path, rel, [n for n in self._ignore_names if n in names], rules)
+
+        dir_re = self._dir_re
+        file_re = self._file_re
+        files = []
+        dirs = []
+        for name, is_dir in entries:
+            if is_dir:
+                if dir_re is not None and dir_re.match(name):
+                    continue
+                if self._ignore_names and name == '.git':
+                    continue
+            elif file_re is not None and file_re.match(name):
+                continue
+
+            child_rel = rel + '/' + name if rel else name
+            if rules and self._isIgnored(child_rel, is_dir, rules):
+                continue
+
+            if is_dir:
+                dirs.append((os.path.join(path, name), child_rel, rules))
+            else:
+                files.append(lfEncode(os.path.join(path, name)))
+
+        return (files, dirs)
+
+    def _scan(self, path):
+        """
+        return a list of (name, is_dir) of the entries in `path`.
+        """
+        entries = []
+        try:
+            it = scandir(path)
+        except OSError:
+            return entries
+
+        try:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    # the same as os.walk(), a link to a directory is neither walked nor listed
+                    if is_dir and not self._followlinks and entry.is_symlink():
+                        continue
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+        except OSError:
+            pass
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+
+        return entries
+
+    def _worker(self, tasks, results):
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            if self._stopped:
+                continue
+
+            path, rel, rules = task
+            try:
+                files, dirs = self._filter(path, rel, rules, self._scan(path))
+            except Exception as e:
+                # the result is posted anyway, otherwise the reader waits for it forever
+                self._errors.append("%s: %s" % (path, e))
+                files, dirs = [], []
+
+            for d in dirs:
+                tasks.put(d)
+            # the number of the directories queued is sent back, so that
+            # the reader knows when all the directories are scanned
+            results.put((files, len(dirs)))
+
+    def _walk(self, dir, rel, rules, time_limit):
+        start_time = time.time()
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        tasks.put((dir, rel, rules))
+        for _ in range(self._thread_count):
+            t = threading.Thread(target=self._worker, args=(tasks, results))
+            t.daemon = True
+            t.start()
+
+        try:
+            pending = 1
+            while pending > 0 and not self._stopped:
+                files, dir_count = results.get()
+                pending += dir_count - 1
+                for file in files:
+                    yield file
+
+                if time_limit > 0 and time.time() - start_time > time_limit:
+                    break
+
+            # the same as AsyncExecutor, the errors are raised after the files are read
+            if self._errors and not self._stopped:
+                raise Exception("\n".join(self._errors))
+        finally:
+            self._stopped = True
+            for _ in range(self._thread_count):
+                tasks.put(None)
+
+    def _walkSerially(self, dir, rel, rules, time_limit):
+        """
+        the fallback of _walk() if os.scandir() is not available.
+        """
+        start_time = time.time()
+        # the (rel, rules) of the directories to walk
+        walking = {dir: (rel, rules)}
+        for dir_path, dirs, files in os.walk(dir, followlinks=self._followlinks):
+            if self._stopped:
+                break
+
+            rel, rules = walking.pop(dir_path)
+            entries = [(name, True) for name in dirs] + [(name, False) for name in files]
+            files, subdirs = self._filter(dir_path, rel, rules, entries)
+            dirs[:] = [os.path.basename(path) for path, _, _ in subdirs]
+            for path, rel, rules in subdirs:
+                walking[path] = (rel, rules)
+
+            for file in files:
+                yield file
+
+            if time_limit > 0 and time.time() - start_time > time_limit:
+                break
+
+    def killProcess(self):
+        """
+        stop walking, the same interface as AsyncExecutor.
+        """
+        self._stopped = True
+        self._killed = True
+
+    def isKilled(self):
+        """
+        return True if the walk is stopped by killProcess(), i.e., the result is incomplete.
+        """
+        return self._killed
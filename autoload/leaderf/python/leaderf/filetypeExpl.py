@@ -63,6 +63,9 @@ class FiletypeExplManager(Manager):
     def _getDegestStartPos(self, line, mode):
         return 0
 
+    def _getDigestSpec(self, mode):
+        return {}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/o : set filetype under cursor')
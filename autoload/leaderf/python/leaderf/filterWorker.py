@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+
+if sys.version_info >= (3, 0):
+    import queue as Queue
+else:
+    import Queue
+
+
+class FilterJob(object):
+    def __init__(self, generation, func, kwargs):
+        self.generation = generation
+        self.func = func
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+        self.done = threading.Event()
+
+
+class FilterWorker(object):
+    """
+    A class to run the filter on a dedicated thread, so that the main thread
+    keeps reading the keys while a large chunk of lines is being filtered,
+    and a new keystroke can cancel the filtering in flight.
+    Only a filter that releases the GIL and does not call vim's functions,
+    e.g., the functions of fuzzyEngine, can be run by this class.
+    """
+    def __init__(self, poll_interval=0.005):
+        self._poll_interval = poll_interval
+        self._queue = Queue.Queue()
+        self._thread = None
+        # increased by each run() and each cancellation, a job whose generation
+        # is not the current one is stale and is skipped by the worker thread
+        self._generation = 0
+
+    def _worker(self):
+        while 1:
+            job = self._queue.get()
+            if job.generation == self._generation:
+                try:
+                    job.result = job.func(**job.kwargs)
+                except Exception as e:
+                    job.exception = e
+            job.done.set()
+
+    def run(self, func, is_cancelled, cancel, **kwargs):
+        """
+        call func(**kwargs) on the worker thread and wait for the result.
+        is_cancelled() is polled while waiting, if it returns True, cancel(True)
+        is called to stop func as soon as possible, and cancel(False) is called
+        after func returns.
+        return the result of func(**kwargs), or None if it is cancelled.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker)
+            self._thread.daemon = True
+            self._thread.start()
+
+        self._generation += 1
+        job = FilterJob(self._generation, func, kwargs)
+        self._queue.put(job)
+
+        while not job.done.wait(self._poll_interval):
+            if is_cancelled():
+                self._generation += 1
+                cancel(True)
+                try:
+                    # func returns very soon after it is cancelled
+                    job.done.wait()
+                finally:
+                    cancel(False)
+                return None
+
+        if job.exception is not None:
+            raise job.exception
+
+        return job.result
@@ -267,6 +267,18 @@ class FunctionExplManager(Manager):
         else:
             return len(line.rsplit("\t", 1)[0]) + 2
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the whole line
+                  1, the code
+        """
+        if mode == 0:
+            return {"skip": 2}
+        else:
+            return {"skip": 2, "separator": "\t", "maxsplit": 1, "reverse": True}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import mmap
+import struct
+from .utils import *
+
+
+# the cached paths of the index files, {index path: (mtime, size, paths)}
+_index_cache = {}
+
+
+def getGitDir(git_root):
+    """
+    return the git directory of the work tree `git_root`,
+    .git is either a directory or a file of "gitdir: <path>", e.g., in a worktree or a submodule.
+    """
+    git_dir = os.path.join(git_root, '.git')
+    if os.path.isfile(git_dir):
+        try:
+            with lfOpen(git_dir, 'r', errors='ignore') as f:
+                line = f.readline().strip()
+        except (IOError, OSError):
+            return None
+        if not line.startswith('gitdir:'):
+            return None
+        git_dir = os.path.join(git_root, line[len('gitdir:'):].strip())
+
+    return os.path.normpath(git_dir)
+
+
+def _getHashSize(git_dir):
+    """
+    return the size of the object names in the repository, 32 if sha256 is used, otherwise 20.
+    """
+    # in a worktree, the config is in the common directory
+    common_dir = git_dir
+    try:
+        with lfOpen(os.path.join(git_dir, 'commondir'), 'r', errors='ignore') as f:
+            common_dir = os.path.join(git_dir, f.readline().strip())
+    except (IOError, OSError):
+        pass
+
+    try:
+        with lfOpen(os.path.join(common_dir, 'config'), 'r', errors='ignore') as f:
+            if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', f.read(), re.I | re.M):
+                return 32
+    except (IOError, OSError):
+        pass
+
+    return 20
+
+
+def _parseIndex(data, hash_size):
+    """
+    return the list of the paths of the entries of the index `data`,
+    or None if the index is not supported, e.g., a split index or a sparse index.
+    """
+    if len(data) < 12 or data[:4] != b'DIRC':
+        return None
+
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in (2, 3, 4):
+        return None
+
+    paths = []
+    offset = 12
+    # ctime, mtime, dev, ino, mode, uid, gid, size, the object name and the flags
+    flags_offset = 40 + hash_size
+    path = b''
+    for _ in range(count):
+        flags = struct.unpack_from('>H', data, offset + flags_offset)[0]
+        name_offset = offset + flags_offset + 2
+        if version >= 3 and flags & 0x4000:     # extended flags
+            name_offset += 2
+
+        if version == 4:
+            # the path is prefix compressed, strip N bytes from the previous path and append the suffix
+            c = ord(data[name_offset:name_offset + 1])
+            n = c & 127
+            i = name_offset + 1
+            while c & 128:
+                c = ord(data[i:i + 1])
+                n = ((n + 1) << 7) | (c & 127)
+                i += 1
+            end = data.find(b'\0', i)
+            if end < 0:
+                return None
+            path = path[:len(path) - n] + data[i:end]
+            offset = end + 1
+        else:
+            end = data.find(b'\0', name_offset)
+            if end < 0:
+                return None
+            path = data[name_offset:end]
+            # the entry is padded with 1-8 nul bytes to a multiple of 8 bytes
+            offset += (end - offset + 8) & ~7
+
+        # the unmerged entries of a path are adjacent
+        if not paths or paths[-1] != path:
+            paths.append(path)
+
+    # the entries of a split index or the directories of a sparse index are not the paths
+    while offset + 8 <= len(data) - hash_size:
+        signature = data[offset:offset + 4]
+        size = struct.unpack_from('>I', data, offset + 4)[0]
+        if signature in (b'link', b'sdir'):
+            return None
+        offset += 8 + size
+
+    return paths
+
+
+def getTrackedFiles(git_root):
+    """
+    return the list of the tracked files of the work tree `git_root`, relative to `git_root`
+    and separated by '/', the same as `git ls-files`, or None if the index can not be read.
+    The result is cached until the index file is changed.
+    """
+    git_dir = getGitDir(git_root)
+    if git_dir is None:
+        return None
+
+    index = os.path.join(git_dir, 'index')
+    try:
+        st = os.stat(index)
+    except OSError:
+        return None
+
+    cached = _index_cache.get(index)
+    if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+        return cached[2]
+
+    try:
+        with open(index, 'rb') as f:
+            if st.st_size == 0:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                paths = _parseIndex(data, _getHashSize(git_dir))
+            finally:
+                data.close()
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+    if paths is None:
+        return None
+
+    paths = [lfBytes2Str(path, 'utf-8') for path in paths]
+    _index_cache[index] = (st.st_mtime, st.st_size, paths)
+    return paths
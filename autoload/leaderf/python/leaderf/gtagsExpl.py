@@ -1154,7 +1154,7 @@ class GtagsExplManager(Manager):
             lfCmd("setlocal modifiable")
         line = instance._buffer_object[instance.window.cursor[0] - 1]
         if len(self._content) > 0:
-            self._content.remove(line)
+            self._removeContentLine(line)
             self._getInstance().setStlTotal(len(self._content)//self._getUnit())
             self._getInstance().setStlResultsCount(len(self._content)//self._getUnit())
         # `del vim.current.line` does not work in neovim
@@ -104,6 +104,15 @@ class HistoryExplManager(Manager):
         """
         return 0
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the whole line
+                  1, the whole line
+        """
+        return {}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+from .utils import *
+
+
+def _translate(pattern):
+    """
+    translate the glob of a gitignore pattern to a regex, `pattern` has neither
+    the leading '!' nor the trailing '/', see https://git-scm.com/docs/gitignore
+    """
+    i = 0
+    n = len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i+2] == '**' and (i == 0 or pattern[i-1] == '/') \
+                    and (i + 2 == n or pattern[i+2] == '/'):
+                if i + 2 == n:      # "foo/**" matches everything inside foo
+                    res.append('.*')
+                    i += 2
+                else:               # "**/foo" and "a/**/b" match zero or more directories
+                    res.append('(?:.*/)?')
+                    i += 3
+                continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            res.append('[^/]*')
+            continue
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                stuff = pattern[i+1:j].replace('\\', '\\\\')
+                if stuff[0] in '!^':
+                    stuff = '^' + stuff[1:]
+                res.append('[%s]' % stuff)
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            res.append(re.escape(pattern[i]))
+        else:
+            res.append(re.escape(c))
+        i += 1
+
+    return ''.join(res)
+
+
+class IgnoreFile(object):
+    """
+    The patterns of an ignore file, e.g., .gitignore or .ignore,
+    a path is matched relative to the directory of the ignore file.
+    """
+    def __init__(self, lines):
+        # a list of (regex, is_negative, is_dir_only), the last matching pattern decides
+        self._patterns = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            # trailing spaces are ignored unless they are quoted with backslash
+            stripped = line.rstrip(' ')
+            if stripped.endswith('\\') and len(stripped) < len(line):
+                stripped += ' '
+            line = stripped
+            if not line or line.startswith('#'):
+                continue
+
+            is_negative = line.startswith('!')
+            if is_negative:
+                line = line[1:]
+            elif line.startswith('\\!') or line.startswith('\\#'):
+                line = line[1:]
+
+            is_dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            # a pattern with a separator at the beginning or middle is relative to the directory,
+            # otherwise it matches at any level below the directory
+            if '/' in line:
+                regex = '^' + _translate(line.lstrip('/')) + '$'
+            else:
+                regex = '(?:^|/)' + _translate(line) + '$'
+            try:
+                self._patterns.append((re.compile(regex), is_negative, is_dir_only))
+            except re.error:
+                pass
+
+        # if there is no negative pattern, all the patterns are matched at once
+        if self._patterns and not any(p[1] for p in self._patterns):
+            self._file_re = self._combine([p for p in self._patterns if not p[2]])
+            self._dir_re = self._combine(self._patterns)
+        else:
+            self._file_re = None
+            self._dir_re = None
+
+    @staticmethod
+    def _combine(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:%s)' % p[0].pattern for p in patterns))
+
+    @staticmethod
+    def read(path):
+        """
+        return the IgnoreFile of `path`, or None if it can not be read or has no patterns.
+        """
+        try:
+            with lfOpen(path, 'r', errors='ignore', encoding='utf-8') as f:
+                ignore_file = IgnoreFile(f.readlines())
+        except (IOError, OSError):
+            return None
+
+        return ignore_file if ignore_file._patterns else None
+
+    def match(self, path, is_dir):
+        """
+        return True if `path` is ignored, False if it is re-included by a negative pattern,
+        or None if no pattern matches it. `path` is relative to the directory of
+        the ignore file and separated by '/'.
+        """
+        if not self._patterns:
+            return None
+
+        if self._dir_re is not None:
+            regex = self._dir_re if is_dir else self._file_re
+            if regex is not None and regex.search(path):
+                return True
+            return None
+
+        for regex, is_negative, is_dir_only in reversed(self._patterns):
+            if is_dir_only and not is_dir:
+                continue
+            if regex.search(path):
+                return not is_negative
+
+        return None
+
+
+def findGitRoot(dir):
+    """
+    return the nearest ancestor of `dir`, including `dir`, that contains .git,
+    or None if `dir` is not in a git repository.
+    """
+    dir = os.path.abspath(dir)
+    while True:
+        if os.path.exists(os.path.join(dir, '.git')):
+            return dir
+        parent = os.path.dirname(dir)
+        if parent == dir:
+            return None
+        dir = parent
+
+
+def _parseConfigValue(value):
+    """
+    return the value of a line of a git config file, the quotes, the escapes
+    and the trailing comment are removed.
+    """
+    result = []
+    in_quote = False
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == '"':
+            in_quote = not in_quote
+        elif c == '\\' and i + 1 < len(value):
+            i += 1
+            result.append({'n': '\n', 't': '\t', 'b': '\b'}.get(value[i], value[i]))
+        elif c in '#;' and not in_quote:
+            break
+        else:
+            result.append(c)
+        i += 1
+    return ''.join(result).strip()
+
+
+def _getGitConfig(path, section, name):
+    """
+    return the last value of `name` in `section` of the git config file `path`,
+    or None if it is not set, `section` and `name` are in lowercase.
+    the files included by [include] are not read.
+    """
+    try:
+        with lfOpen(path, 'r', errors='ignore') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+
+    value = None
+    cur_section = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            end = line.find(']')
+            if end < 0:
+                cur_section = None
+                continue
+            cur_section = line[1:end].strip().lower()
+            # e.g., [core] excludesFile = ~/.gitignore_global
+            line = line[end+1:].strip()
+
+        if not line or line[0] in '#;' or cur_section != section:
+            continue
+
+        key, _, val = line.partition('=')
+        if key.strip().lower() == name:
+            value = _parseConfigValue(val.strip())
+
+    return value
+
+
+def getGlobalIgnoreFile(git_root=None):
+    """
+    return the IgnoreFile of the global excludes file of git, or None if it does not exist.
+    the file is `core.excludesFile` of the git config files, the same as git,
+    the one in the repository `git_root` takes precedence over the global ones,
+    $XDG_CONFIG_HOME/git/ignore if it is not set.
+    """
+    home = os.path.expanduser('~')
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+    configs = [os.path.join(config_home, 'git', 'config'), os.path.join(home, '.gitconfig')]
+    if git_root:
+        configs.append(os.path.join(git_root, '.git', 'config'))
+
+    excludes_file = None
+    for config in configs:
+        value = _getGitConfig(config, 'core', 'excludesfile')
+        if value is not None:
+            excludes_file = value
+
+    if excludes_file is None:
+        excludes_file = os.path.join(config_home, 'git', 'ignore')
+    elif not excludes_file:
+        return None
+
+    return IgnoreFile.read(os.path.expanduser(excludes_file))
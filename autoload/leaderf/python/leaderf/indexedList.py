@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import operator
+import itertools
+from array import array
+
+try:
+    import fuzzyEngine
+except ImportError:
+    pass
+
+
+class IndexedList(object):
+    """
+    A read-only list of lines, the i-th line is content[indices[i]].
+    `indices` is an array('I') or a memoryview of it, so a large result takes
+    4 bytes per line, and a line is not materialized until it is accessed,
+    e.g., only the lines shown in the window are materialized.
+    Slicing returns a list of lines, use sublist() to get an IndexedList.
+    It is only used with python3.5+, see Manager._canFilterByIndex(), python2 keeps using
+    lists of lines, e.g., memoryview(array) and array.frombytes() are not available there.
+    """
+    def __init__(self, content, indices):
+        self._content = content
+        self._indices = indices
+
+    @property
+    def indices(self):
+        return self._indices
+
+    def sublist(self, start, stop=None):
+        """
+        return an IndexedList of self[start:stop], the indices are not copied.
+        """
+        return IndexedList(self._content, memoryview(self.indices)[start:stop])
+
+    def withoutIndex(self, index):
+        """
+        return an IndexedList of the lines except content[index], the indices greater
+        than `index` are decremented, it is called after content[index] is deleted.
+        """
+        return IndexedList(self._content, array('I', (i - (i > index) for i in self.indices if i != index)))
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def __getitem__(self, key):
+        content = self._content
+        if isinstance(key, slice):
+            return [content[i] for i in self.indices[key]]
+        else:
+            return content[self.indices[key]]
+
+    def __iter__(self):
+        content = self._content
+        return (content[i] for i in self.indices)
+
+
+class RankedList(IndexedList):
+    """
+    An IndexedList of the lines of several runs, a run is a tuple (array('f') of weight,
+    array('I') of index) sorted in descending order of weight, e.g., the result of a chunk.
+    The runs are merged lazily, if only the first lines are accessed, e.g., the lines
+    shown in the window, they are picked out by a k-way merge of the runs, otherwise
+    the runs are merged into one by fuzzyEngine.mergeArray().
+    If `is_sorted` is False, e.g., --no-sort is given, the runs are not sorted
+    and they are concatenated in order instead.
+    Like IndexedList, it is only used with python3.5+, heapq.merge() takes `key` and `reverse`
+    since python3.5 and fuzzyEngine.mergeArray() needs the buffer interface of array.
+    """
+    # the max number of the first lines picked out by a k-way merge
+    MAX_LAZY_COUNT = 1000
+
+    def __init__(self, content, runs, is_sorted=True):
+        super(RankedList, self).__init__(content, None)
+        self._runs = runs
+        self._is_sorted = is_sorted
+        self._length = sum(len(run[1]) for run in runs)
+        self._head = []     # the indices of the first lines picked out by a k-way merge
+
+    @staticmethod
+    def _merge(run_a, run_b, is_sorted):
+        if is_sorted:
+            return fuzzyEngine.mergeArray(run_a, run_b)
+        else:
+            return (run_a[0] + run_b[0], run_a[1] + run_b[1])
+
+    @staticmethod
+    def addRun(runs, run, is_sorted=True):
+        """
+        return a new list of runs with `run` appended to `runs`.
+        the runs are kept in descending order of length by merging the last two runs,
+        so that there are at most log2(n) runs and each line is merged at most log2(n) times.
+        """
+        runs = runs + [run]
+        while len(runs) > 1 and len(runs[-2][1]) <= len(runs[-1][1]):
+            runs[-2:] = [RankedList._merge(runs[-2], runs[-1], is_sorted)]
+        return runs
+
+    @property
+    def runs(self):
+        return self._runs
+
+    @property
+    def is_sorted(self):
+        return self._is_sorted
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            while len(self._runs) > 1:
+                runs = self._runs
+                self._runs = [self._merge(runs[i], runs[i + 1], self._is_sorted) if i + 1 < len(runs) else runs[i]
+                              for i in range(0, len(runs), 2)]
+            self._indices = self._runs[0][1] if self._runs else array('I')
+        return self._indices
+
+    def withoutIndex(self, index):
+        """
+        the same as IndexedList.withoutIndex(), but return a RankedList of the remapped runs.
+        """
+        runs = []
+        for weights, indices in self._runs:
+            kept = [k for k, i in enumerate(indices) if i != index]
+            runs.append((array('f', (weights[k] for k in kept)),
+                         array('I', (indices[k] - (indices[k] > index) for k in kept))))
+        return RankedList(self._content, runs, self._is_sorted)
+
+    def _getHead(self, count):
+        """
+        return the indices of the first `count` lines.
+        """
+        if self._indices is not None or len(self._runs) < 2 or count > self.MAX_LAZY_COUNT:
+            return self.indices[:count]
+
+        if len(self._head) < min(count, self._length):
+            if self._is_sorted:
+                # the later run comes first if the weights are equal, the same as fuzzyEngine.mergeArray()
+                merged = heapq.merge(*[zip(*run) for run in reversed(self._runs)],
+                                     key=operator.itemgetter(0), reverse=True)
+                self._head = [i for _, i in itertools.islice(merged, count)]
+            else:
+                merged = itertools.chain.from_iterable(run[1] for run in self._runs)
+                self._head = list(itertools.islice(merged, count))
+
+        return self._head[:count]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and not key.start and key.step is None \
+                and key.stop is not None and key.stop >= 0:
+            content = self._content
+            return [content[i] for i in self._getHead(key.stop)]
+        else:
+            return super(RankedList, self).__getitem__(key)
@@ -119,6 +119,15 @@ class JumpsExplManager(Manager):
         """
         return 0
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        return {"trim": 1}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -12,11 +12,16 @@ import threading
 import multiprocessing
 from functools import partial
 from functools import wraps
+from array import array
 from .instance import LfInstance
 from .cli import LfCli
 from .utils import *
 from .fuzzyMatch import FuzzyMatch
 from .asyncExecutor import AsyncExecutor
+from .chunkScheduler import ChunkScheduler
+from .filterWorker import FilterWorker
+from .indexedList import IndexedList, RankedList
+from .queryCache import QueryCache
 from .devicons import (
     webDevIconsGetFileTypeSymbol,
     removeDevIcons
@@ -54,6 +59,28 @@ else:
         except UnicodeDecodeError:
             return False
 
+# each distinct non-ascii character of a pattern takes at most two of the 124 symbols
+# that fuzzyMatchC and fuzzyEngine assign to them, see patternToSymbols() in fuzzyMatch.c
+MAX_NON_ASCII_COUNT = 62
+
+def isCMatchable(pattern, encoding):
+    """
+    return True if `pattern` can be handled by fuzzyMatchC and fuzzyEngine,
+    they support ascii patterns, and non-ascii patterns if `encoding`, the value of 'encoding', is utf-8
+    and the pattern has at most MAX_NON_ASCII_COUNT distinct non-ascii characters,
+    otherwise the characters would share symbols and be matched and highlighted wrongly.
+    """
+    if isAscii(pattern):
+        return True
+
+    if encoding != "utf-8":
+        return False
+
+    if isinstance(pattern, bytes):
+        pattern = pattern.decode("utf-8", "ignore")
+
+    return len(set(c for c in pattern if ord(c) >= 0x80)) <= MAX_NON_ASCII_COUNT
+
 
 def modifiableController(func):
     @wraps(func)
@@ -111,11 +138,33 @@ class Manager(object):
         self._selections = {}
         self._highlight_pos = []
         self._highlight_pos_list = []
+        self._and_mode_highlights = (None, None)
         self._highlight_refine_pos = []
         self._highlight_ids = []
         self._orig_line = None
         self._fuzzy_engine = None
+        self._corpus = None
+        self._corpus_content = None
+        self._corpus_priors = None
+        self._corpus_prior_count = 0
+        self._digest_content = None
+        self._digest_offsets = {}
         self._result_content = []
+        # if not 0, only the first self._result_top_k lines of self._result_content are sorted
+        self._result_top_k = 0
+        self._result_stack = []
+        # the vim regex translated to a python one, see _getNativeRegex()
+        self._native_regex = (None, None)
+        self._chunk_scheduler = ChunkScheduler()
+        self._chunk_size = 0    # the number of lines filtered by the last call of _filter()
+        self._filter_worker = FilterWorker()
+        self._search_cancelled = False  # True if a new search is cancelled before any result of it is shown
+        self._search_key = None
+        self._guess_key = None  # the key of the ranking made by _guessSearch() if it is being shown
+        self._query_cache = QueryCache()
+        # increased when self._content is changed, the results in self._query_cache are of this generation
+        self._content_generation = 0
+        self._generation_content = None
         self._reader_thread = None
         self._timer_id = None
         self._highlight_method = lambda : None
@@ -239,6 +288,29 @@ class Manager(object):
         else:
             return lfBytesLen(getDirname(line))
 
+    def _getDigestSpec(self, mode):
+        """
+        this function can be overridden
+        describe the digest returned by _getDigest() declaratively, so that
+        the digest can be extracted by fuzzyEngine instead of _getDigest().
+        return a dict of the keyword arguments of fuzzyEngine.createDigestParameter(),
+        i.e., separator, maxsplit, field, reverse, skip, trim and rstrip,
+        or None if the digest can not be described.
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        return None
+
+    def _getPriors(self, content, start, end):
+        """
+        this function can be overridden
+        return an array('B') of the priors of content[start:end], a prior is from 0 to 15,
+        the lines with a greater prior come first if their weights are equal,
+        see fuzzyEngine.setCorpusPriors(), or None if the lines have no priors.
+        """
+        return None
+
     def _createHelp(self):
         return []
 
@@ -334,9 +406,16 @@ class Manager(object):
         self._getInstance().helpLength = self._help_length
         self.clearSelections()
         self._getExplorer().cleanup()
+        self._chunk_scheduler.exportSpeeds()
         if self._fuzzy_engine:
             fuzzyEngine.closeFuzzyEngine(self._fuzzy_engine)
             self._fuzzy_engine = None
+        self._corpus = None
+        self._corpus_content = None
+        self._corpus_priors = None
+        self._corpus_prior_count = 0
+        self._digest_content = None
+        self._digest_offsets = {}
 
         if self._reader_thread and self._reader_thread.is_alive():
             self._stop_reader_thread = True
@@ -370,6 +449,7 @@ class Manager(object):
         if self._cli.pattern and self._index == 0:
             self._search(self._content)
             if len(self._getInstance().buffer) < len(self._result_content):
+                self._sortResultContent()
                 self._getInstance().appendBuffer(self._result_content[self._initial_count:])
 
     def _bangReadFinished(self):
@@ -1518,11 +1598,20 @@ class Manager(object):
                 return False
 
     def _search(self, content, is_continue=False, step=0):
+        if self._search_cancelled:
+            # the result of the cancelled search is not shown, so search from the beginning
+            self._search_cancelled = False
+            is_continue = False
+
         if not is_continue:
             self.clearSelections()
             self._clearHighlights()
             self._clearHighlightsPos()
             self._cli.highlightMatches()
+            self._search_key = None
+            self._guess_key = None
+
+        self._result_top_k = 0
 
         if not self._cli.pattern:   # e.g., when <BS> or <Del> is typed
             if self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
@@ -1534,15 +1623,109 @@ class Manager(object):
             self._previewResult(False)
             return
 
+        if not is_continue and self._restoreCachedResult():
+            self._previewResult(False)
+            return
+
         if self._cli.isFuzzy:
             self._fuzzySearch(content, is_continue, step)
         else:
             self._regexSearch(content, is_continue, step)
 
+        self._cacheResult()
         self._previewResult(False)
 
+    def _updateContentGeneration(self, force=False):
+        """
+        increase self._content_generation if self._content is replaced or `force` is True,
+        e.g., the content is refreshed, the results of the old content are discarded.
+        """
+        if force or self._content is not self._generation_content:
+            self._content_generation += 1
+            self._generation_content = self._content
+            self._query_cache.clear()
+
+    def _removeContentLine(self, line):
+        """
+        remove `line` from self._content in place, e.g., when a buffer is deleted,
+        the results that keep the indices of self._content are remapped.
+        """
+        try:
+            index = self._content.index(line)
+        except ValueError:
+            return
+
+        del self._content[index]
+        if isinstance(self._result_content, IndexedList):
+            self._result_content = self._result_content.withoutIndex(index)
+            if isinstance(self._result_content, RankedList):
+                self._previous_result = self._result_content.runs
+        if isinstance(self._cb_content, IndexedList):
+            self._cb_content = self._cb_content.withoutIndex(index)
+        if self._index > index:
+            self._index -= 1
+
+        # the corpus and the digest offsets are got again from the changed self._content
+        self._corpus_content = None
+        self._digest_content = None
+        # the saved results and the cached results keep the old indices
+        self._result_stack = []
+        self._updateContentGeneration(True)
+
+    def _getQueryKey(self):
+        """
+        return the key of the current query in self._query_cache,
+        or None if the result of the current query should not be cached.
+        """
+        if not self._cli.isFuzzy or not self._cli.pattern or "--live" in self._arguments \
+                or self._read_finished != 2:    # the content is being read
+            return None
+
+        self._updateContentGeneration()
+        return (self._getExplorer().getStlCategory(), self._content_generation, len(self._content),
+                self._cli.pattern, self._cli.isFullPath, self._cli.isAndMode, self._cli.isRefinement,
+                "--no-sort" in self._arguments, "--match-path" in self._arguments)
+
+    def _cacheResult(self):
+        """
+        save the result of the current query in self._query_cache if it is complete
+        """
+        if self._search_cancelled or self._cb_content or self._index < len(self._content):
+            return
+
+        key = self._getQueryKey()
+        if key is None:
+            return
+
+        # roughly the bytes per line, the lines themselves are shared with self._content
+        if isinstance(self._result_content, IndexedList):
+            size = len(self._result_content) * 8     # a weight and an index
+        elif isinstance(self._previous_result, tuple):
+            size = len(self._result_content) * 16    # a weight and the pointers in two lists
+        else:
+            size = len(self._result_content) * 80    # a (weight, line) pair
+
+        self._query_cache.put(key, (self._index, self._result_content, self._result_top_k,
+                                    self._previous_result, self._highlight_method), size)
+
+    def _restoreCachedResult(self):
+        """
+        restore the result of the current query if it is in self._query_cache
+        return True if the result is restored, False otherwise
+        """
+        key = self._getQueryKey()
+        entry = None if key is None else self._query_cache.get(key)
+        if entry is None:
+            return False
+
+        (self._index, self._result_content, self._result_top_k,
+                self._previous_result, self._highlight_method) = entry
+        self._search_key = (self._cli.pattern, self._cli.isFullPath)
+        self._showRestoredResult()
+        return True
+
     def _filter(self, step, filter_method, content, is_continue,
-                use_fuzzy_engine=False, return_index=False):
+                use_fuzzy_engine=False, return_index=False, top_k=0, cancellable=False, by_index=False):
         """ Construct a list from result of filter_method(content).
 
         Args:
@@ -1550,19 +1733,41 @@ class Manager(object):
             filter_method: A function to apply `content` as parameter and
                 return an iterable.
             content: The list to be filtered.
+            top_k: If not 0, only the first `top_k` items of the result of
+                filter_method are sorted.
+            cancellable: If True, filter_method of fuzzyEngine is run on
+                self._filter_worker, and None is returned if a key is typed
+                before it finishes, the lines of this chunk are left unfiltered.
+            by_index: If True, filter_method is fuzzyEngine.fuzzyMatch() or
+                fuzzyEngine.fuzzyMatchPart(), which accept `indices` and `return_array`,
+                so that the lines can be filtered by _filterByIndex().
         """
+        if use_fuzzy_engine and return_index and self._canFilterByIndex(content):
+            return self._filterByIndex(step, filter_method, content, is_continue, cancellable)
+        elif use_fuzzy_engine and by_index and self._canFilterByIndex(content, False):
+            return self._filterByIndex(step, filter_method, content, is_continue, cancellable, False)
+
+        if isinstance(self._cb_content, IndexedList):
+            self._cb_content = list(self._cb_content)
+
         unit = self._getUnit()
         step = step // unit * unit
         length = len(content)
+        # restored if the filtering is cancelled
+        saved_state = (self._index, self._cb_content, len(self._cb_content))
+        cur_range = None    # cur_content is content[cur_range[0]:cur_range[1]]
         if self._index == 0:
             self._cb_content = []
             self._result_content = []
             self._index = min(step, length)
             cur_content = content[:self._index]
+            cur_range = (0, self._index)
         else:
             if not is_continue and self._result_content:
                 if self._cb_content:
                     self._cb_content += self._result_content
+                elif isinstance(self._result_content, IndexedList):
+                    self._cb_content = list(self._result_content)
                 else:
                     self._cb_content = self._result_content
 
@@ -1575,11 +1780,16 @@ class Manager(object):
                 self._cb_content = []
                 if self._index < length:
                     end = min(self._index + left, length)
-                    cur_content += content[self._index:end]
+                    if not cur_content:
+                        cur_range = (self._index, end)
+                    # do not extend in place, cur_content may be a result saved in self._result_stack
+                    cur_content = cur_content + content[self._index:end]
                     self._index = end
 
+        self._chunk_size = len(cur_content)
+
         if self._cli.isAndMode:
-            result, highlight_methods = filter_method(cur_content)
+            result, highlight_methods = filter_method(cur_content, content, cur_range)
             if is_continue:
                 self._previous_result = (self._previous_result[0] + result[0],
                                          self._previous_result[1] + result[1])
@@ -1588,16 +1798,60 @@ class Manager(object):
                 self._previous_result = result
             return (result, highlight_methods)
         elif use_fuzzy_engine:
-            if return_index:
+            if cancellable:
+                filter_method = partial(self._filter_worker.run, filter_method, self._cli.isKeyPending,
+                                        partial(fuzzyEngine.cancel, self._fuzzy_engine))
+
+            if return_index and self._cli.isRefinement and self._cli.pattern[0] and self._cli.pattern[1]:
+                # e.g. abc;def, the name and the path are matched by fuzzyEngine.refineMatch()
+                corpus = self._getCorpus(content, cur_range)
+                if corpus is None:
+                    digest, refine_digest = None, None
+                else:
+                    digest = self._getDigestOffsets(1, cur_range[1])
+                    refine_digest = self._getDigestOffsets(2, cur_range[1])
+
+                if digest is None or refine_digest is None:
+                    result = filter_method(source=[self._getDigest(line, 1) for line in cur_content[::unit]],
+                                           refine_source=[self._getDigest(line, 2) for line in cur_content[::unit]])
+                else:
+                    result = filter_method(source=corpus, begin=cur_range[0], end=cur_range[1],
+                                           digest=digest, refine_digest=refine_digest, unit=unit)
+            elif return_index:
                 mode = 0 if self._cli.isFullPath else 1
-                tmp_content = [self._getDigest(line, mode) for line in cur_content]
-                result = filter_method(source=tmp_content)
-                result = (result[0], [cur_content[i] for i in result[1]])
+                corpus = self._getCorpus(content, cur_range)
+                digest = None if corpus is None else self._getDigestOffsets(mode, cur_range[1])
+                if digest is None:
+                    # only the first line of a unit is matched
+                    tmp_content = [self._getDigest(line, mode) for line in cur_content[::unit]]
+                    result = filter_method(source=tmp_content)
+                else:
+                    result = filter_method(source=corpus, begin=cur_range[0], end=cur_range[1],
+                                           digest=digest, unit=unit)
             else:
-                result = filter_method(source=cur_content)
+                corpus = self._getCorpus(content, cur_range)
+                if corpus is None:
+                    result = filter_method(source=cur_content)
+                else:
+                    result = filter_method(source=corpus, begin=cur_range[0], end=cur_range[1])
+
+            if result is None:  # cancelled
+                self._index, self._cb_content, cb_length = saved_state
+                # self._result_content may have been appended to self._cb_content in place
+                del self._cb_content[cb_length:]
+                if not is_continue:
+                    self._search_cancelled = True
+                return None
+
+            if return_index:
+                if unit > 1:
+                    # the result is a list of units, they are flattened by the caller
+                    result = (result[0], [cur_content[i*unit:i*unit + unit] for i in result[1]])
+                else:
+                    result = (result[0], [cur_content[i] for i in result[1]])
 
             if is_continue:
-                result = fuzzyEngine.merge(self._previous_result, result)
+                result = fuzzyEngine.merge(self._previous_result, result, top_k)
 
             self._previous_result = result
         else:
@@ -1610,6 +1864,226 @@ class Manager(object):
 
         return result
 
+    def _canFilterByIndex(self, content, use_digest=True):
+        """
+        return True if `content` can be filtered by _filterByIndex()
+        """
+        # IndexedList and RankedList use the array, memoryview and heapq APIs of python3.5+
+        if sys.version_info < (3, 5):
+            return False
+
+        if self._getUnit() > 1 or not content \
+                or self._cli.isRefinement and self._cli.pattern[0] and self._cli.pattern[1]:
+            return False
+
+        if self._getCorpus(content, (0, len(content))) is None:
+            return False
+
+        if not use_digest:
+            return True
+
+        # None if a digest is not a substring of the line
+        return self._getDigestOffsets(0 if self._cli.isFullPath else 1, 0) is not None
+
+    def _filterByIndex(self, step, filter_method, content, is_continue, cancellable=False, use_digest=True):
+        """
+        the same as _filter() with return_index=True, except that the lines are
+        represented by their indices in self._content, so that neither the lines to
+        be filtered nor the result are copied.
+        self._result_content is a RankedList and self._previous_result is its runs,
+        self._cb_content is an IndexedList.
+        if `use_digest` is False, the digests are extracted by filter_method itself,
+        e.g., fuzzyEngine.fuzzyMatchPart(), instead of being passed by their offsets.
+        """
+        corpus = self._getCorpus(content, (0, len(content)))
+        mode = 0 if self._cli.isFullPath else 1
+        length = len(content)
+        # restored if the filtering is cancelled
+        saved_state = (self._index, self._cb_content)
+
+        if is_continue and not isinstance(self._result_content, RankedList):
+            # the result so far is not indexed, search from the beginning
+            self._index = 0
+            is_continue = False
+        elif not is_continue and self._index > 0:
+            if (not self._result_content or isinstance(self._result_content, IndexedList)) \
+                    and (not self._cb_content or isinstance(self._cb_content, IndexedList)):
+                # only the result of the previous pattern needs to be filtered
+                indices = array('I')
+                if self._cb_content:
+                    indices.frombytes(memoryview(self._cb_content.indices).cast('B'))
+                if self._result_content:
+                    indices.frombytes(memoryview(self._result_content.indices).cast('B'))
+                self._cb_content = IndexedList(self._content, indices)
+            else:
+                self._index = 0
+
+        if self._index == 0:
+            self._cb_content = []
+            self._result_content = []
+
+        if self._cb_content:
+            indices = self._cb_content.indices[:step]
+            self._cb_content = self._cb_content.sublist(step) if len(self._cb_content) > step else []
+            kwargs = {"indices": indices, "end": self._index}
+            self._chunk_size = len(indices)
+        else:
+            end = min(self._index + step, length)
+            kwargs = {"begin": self._index, "end": end}
+            self._chunk_size = end - self._index
+            self._index = end
+
+        if use_digest:
+            kwargs["digest"] = self._getDigestOffsets(mode, self._index)
+            if kwargs["digest"] is None:
+                # a digest is not a substring of its line, filter the lines as usual from the beginning
+                self._index = 0
+                self._cb_content = []
+                return self._filter(step, filter_method, content, False, True, True, 0, cancellable)
+
+        if cancellable:
+            filter_method = partial(self._filter_worker.run, filter_method, self._cli.isKeyPending,
+                                    partial(fuzzyEngine.cancel, self._fuzzy_engine))
+
+        result = filter_method(source=corpus, return_array=True, **kwargs)
+        if result is None:  # cancelled
+            self._index, self._cb_content = saved_state
+            if not is_continue:
+                self._search_cancelled = True
+            return None
+
+        # the results of the chunks are merged lazily by RankedList
+        is_sorted = "--no-sort" not in self._arguments
+        if not is_continue:
+            runs = [result]
+        elif len(result[1]) > 0:
+            runs = RankedList.addRun(self._result_content.runs, result, is_sorted)
+        else:
+            runs = self._result_content.runs
+
+        self._previous_result = runs
+        return (result[0], RankedList(self._content, runs, is_sorted))
+
+    def _getCorpus(self, content, cur_range):
+        """
+        return the corpus of self._content if content[cur_range[0]:cur_range[1]]
+        can be got from it, otherwise return None.
+        `content` is either self._content or a copy of its first len(content) lines,
+        the lines of self._content are converted to C strings only once by the corpus.
+        """
+        if cur_range is None or cur_range[0] == cur_range[1] \
+                or not isinstance(self._content, list) or len(content) > len(self._content) \
+                or content[cur_range[0]] is not self._content[cur_range[0]]:
+            return None
+
+        if self._corpus_content is not self._content:
+            self._corpus = fuzzyEngine.registerCorpus(self._content)
+            self._corpus_content = self._content
+            self._corpus_priors = None
+            self._corpus_prior_count = 0
+
+        self._updateCorpusPriors()
+        return self._corpus
+
+    def _updateCorpusPriors(self):
+        """
+        set the priors of the lines of self._content that are added after the last call to the corpus.
+        """
+        start = self._corpus_prior_count
+        end = len(self._content)
+        if start >= end:
+            return
+
+        self._corpus_prior_count = end
+        priors = self._getPriors(self._content, start, end)
+        # the lines that have no priors have a prior 0
+        if priors is None or not any(priors):
+            return
+
+        if self._corpus_priors is None:
+            self._corpus_priors = array('B')
+        self._corpus_priors.extend(array('B', [0]) * (start - len(self._corpus_priors)))
+        self._corpus_priors.extend(priors)
+        fuzzyEngine.setCorpusPriors(self._corpus, self._corpus_priors)
+
+    def _resetCorpusPriors(self, content):
+        """
+        get the priors of the corpus again if `content` is the content of the corpus,
+        e.g., the priors depend on the mru files, which change between two launches.
+        the cached results are discarded only if the priors are changed.
+        """
+        if content is not self._corpus_content or self._corpus_prior_count == 0:
+            # the priors of a new corpus are got by _updateCorpusPriors()
+            return
+
+        count = self._corpus_prior_count
+        priors = self._getPriors(content, 0, count)
+        if priors is None or not any(priors):
+            priors = None
+
+        old_priors = self._corpus_priors
+        if old_priors is not None:
+            # the trailing lines that have no priors are not in self._corpus_priors
+            old_priors = old_priors + array('B', [0]) * (count - len(old_priors))
+        if priors == old_priors:
+            return
+
+        self._corpus_priors = priors
+        fuzzyEngine.setCorpusPriors(self._corpus, priors if priors is not None else b"")
+        # the cached results are ranked by the old priors
+        self._updateContentGeneration(True)
+
+    def _getDigestOffsets(self, mode, end):
+        """
+        return a tuple (starts, lengths) of array('I'), starts[i] and lengths[i]
+        are the byte offset and the byte length of self._getDigest(self._content[i], mode),
+        the offsets of the first `end` lines are guaranteed to be computed.
+        they are computed only once for each line, so that the digests need not be
+        extracted every time the pattern changes.
+        if _getUnit() > 1, only the first line of each unit has a digest.
+        return None if the digests are not substrings of the lines.
+        """
+        if sys.version_info < (3, 0):
+            return None
+
+        if self._digest_content is not self._content:
+            self._digest_content = self._content
+            self._digest_offsets = {}
+
+        if mode not in self._digest_offsets:
+            self._digest_offsets[mode] = (array('I'), array('I'))
+
+        offsets = self._digest_offsets[mode]
+        if offsets is None:
+            return None
+
+        starts, lengths = offsets
+        if len(starts) > len(self._content):
+            # self._content has been replaced in place with fewer lines
+            del starts[:]
+            del lengths[:]
+
+        unit = self._getUnit()
+        try:
+            for i, line in enumerate(self._content[len(starts):end], len(starts)):
+                if i % unit != 0:
+                    starts.append(0)
+                    lengths.append(0)
+                    continue
+                line_bytes = line.encode('utf-8')
+                digest = self._getDigest(line, mode).encode('utf-8')
+                start = line_bytes.find(digest)
+                if start < 0:
+                    self._digest_offsets[mode] = None
+                    return None
+                starts.append(start)
+                lengths.append(len(digest))
+        except UnicodeEncodeError:
+            self._digest_offsets[mode] = None
+            return None
+
+        return offsets
+
     def _fuzzyFilter(self, is_full_path, get_weight, iterable):
         """
         return a list, each item is a pair (weight, line)
@@ -1643,14 +2117,60 @@ class Manager(object):
         MIN_WEIGHT = fuzzyMatchC.MIN_WEIGHT if is_fuzzyMatch_C else FuzzyMatch.MIN_WEIGHT
         return ((i[0] + i[1], i[2]) for i in triples if i[0] > MIN_WEIGHT and i[1] > MIN_WEIGHT)
 
-    def _andModeFilter(self, iterable):
-        encoding = lfEval("&encoding")
+    def _andModeFilter(self, encoding, iterable, content=None, cur_range=None):
+        """
+        `encoding` is the value of 'encoding', it is read once for a search.
+        `iterable` is content[cur_range[0]:cur_range[1]] if cur_range is not None,
+        then the lines are matched in the corpus of self._content if possible.
+        """
         cur_content = iterable
         weight_lists = []
         highlight_methods = []
+        if self._fuzzy_engine and all(isCMatchable(p, encoding) for p in self._cli.pattern):
+            # all the patterns are matched in one pass
+            patterns = [fuzzyEngine.initPattern(p) for p in self._cli.pattern]
+            if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
+                is_name_only = False
+            elif self._getExplorer().getStlCategory() in ["Self", "Buffer", "Mru", "BufTag",
+                    "Function", "History", "Cmd_History", "Search_History", "Tag", "Rg", "Filetype",
+                    "Command", "Window", "QuickFix", "LocList"]:
+                is_name_only = True
+            else:
+                is_name_only = not self._cli.isFullPath
+
+            mode = 0 if self._cli.isFullPath else 1
+            unit = self._getUnit()
+            corpus = None if content is None else self._getCorpus(content, cur_range)
+            digest = None if corpus is None else self._getDigestOffsets(mode, cur_range[1])
+            if digest is None:
+                # only the first line of a unit is matched
+                tmp_content = [self._getDigest(line, mode) for line in cur_content[::unit]]
+                weights, indices = fuzzyEngine.fuzzyMatchEx(engine=self._fuzzy_engine, source=tmp_content,
+                                                            pattern=patterns, is_name_only=is_name_only,
+                                                            sort_results=False, is_and_mode=True)
+            else:
+                weights, indices = fuzzyEngine.fuzzyMatchEx(engine=self._fuzzy_engine, source=corpus,
+                                                            begin=cur_range[0], end=cur_range[1],
+                                                            digest=digest, unit=unit,
+                                                            pattern=patterns, is_name_only=is_name_only,
+                                                            sort_results=False, is_and_mode=True)
+            if unit > 1:
+                result_content = [cur_content[i*unit:i*unit + unit] for i in indices]
+            else:
+                result_content = [cur_content[i] for i in indices]
+
+            getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
+                                    pattern=patterns, is_name_only=not self._cli.isFullPath)
+            for i in range(len(patterns)):
+                highlight_method = partial(self._highlight, self._cli.isFullPath,
+                                           partial(self._getAndModeHighlights, getHighlights, i), True, clear=False)
+                highlight_methods.append(highlight_method)
+
+            return ((weights, result_content), highlight_methods)
+
         for p in self._cli.pattern:
             use_fuzzy_engine = False
-            if self._fuzzy_engine and isAscii(p) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
+            if self._fuzzy_engine and isCMatchable(p, encoding):
                 use_fuzzy_engine = True
                 pattern = fuzzyEngine.initPattern(p)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
@@ -1668,7 +2188,7 @@ class Manager(object):
                 getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                         pattern=pattern, is_name_only=not self._cli.isFullPath)
                 highlight_method = partial(self._highlight, self._cli.isFullPath, getHighlights, True, clear=False)
-            elif is_fuzzyMatch_C and isAscii(p):
+            elif is_fuzzyMatch_C and isCMatchable(p, encoding):
                 pattern = fuzzyMatchC.initPattern(p)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=False)
@@ -1703,7 +2223,8 @@ class Manager(object):
 
             if use_fuzzy_engine:
                 mode = 0 if self._cli.isFullPath else 1
-                tmp_content = [self._getDigest(line, mode) for line in cur_content]
+                # only the first line of a unit is matched
+                tmp_content = [self._getDigest(line, mode) for line in cur_content[::self._getUnit()]]
                 result = filter_method(source=tmp_content)
             else:
                 result = filter_method(cur_content)
@@ -1726,16 +2247,27 @@ class Manager(object):
 
         return ((weights, result_content), highlight_methods)
 
+    def _getAndModeHighlights(self, get_highlights, index, source):
+        """
+        return the highlights of the `index`-th pattern of AND mode,
+        get_highlights() returns the highlights of all the patterns in one call,
+        the result is reused by the calls for the other patterns.
+        """
+        if index == 0 or self._and_mode_highlights[0] != source:
+            self._and_mode_highlights = (source, get_highlights(source=source))
+        return self._and_mode_highlights[1][index]
+
     def _fuzzySearch(self, content, is_continue, step):
         encoding = lfEval("&encoding")
         use_fuzzy_engine = False
         use_fuzzy_match_c = False
         do_sort = "--no-sort" not in self._arguments
+        top_k = 0
         if self._cli.isAndMode:
-            filter_method = self._andModeFilter
+            filter_method = partial(self._andModeFilter, encoding)
         elif self._cli.isRefinement:
             if self._cli.pattern[1] == '':      # e.g. abc;
-                if self._fuzzy_engine and isAscii(self._cli.pattern[0]):
+                if self._fuzzy_engine and isCMatchable(self._cli.pattern[0], encoding):
                     use_fuzzy_engine = True
                     return_index = True
                     pattern = fuzzyEngine.initPattern(self._cli.pattern[0])
@@ -1744,7 +2276,7 @@ class Manager(object):
                     getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                             pattern=pattern, is_name_only=True)
                     highlight_method = partial(self._highlight, True, getHighlights, True)
-                elif is_fuzzyMatch_C and isAscii(self._cli.pattern[0]):
+                elif is_fuzzyMatch_C and isCMatchable(self._cli.pattern[0], encoding):
                     use_fuzzy_match_c = True
                     pattern = fuzzyMatchC.initPattern(self._cli.pattern[0])
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=True)
@@ -1761,7 +2293,7 @@ class Manager(object):
                     filter_method = partial(self._fuzzyFilter, False, getWeight)
                     highlight_method = partial(self._highlight, False, getHighlights)
             elif self._cli.pattern[0] == '':    # e.g. ;abc
-                if self._fuzzy_engine and isAscii(self._cli.pattern[1]):
+                if self._fuzzy_engine and isCMatchable(self._cli.pattern[1], encoding):
                     use_fuzzy_engine = True
                     return_index = True
                     pattern = fuzzyEngine.initPattern(self._cli.pattern[1])
@@ -1770,7 +2302,7 @@ class Manager(object):
                     getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                             pattern=pattern, is_name_only=False)
                     highlight_method = partial(self._highlight, True, getHighlights, True)
-                elif is_fuzzyMatch_C and isAscii(self._cli.pattern[1]):
+                elif is_fuzzyMatch_C and isCMatchable(self._cli.pattern[1], encoding):
                     use_fuzzy_match_c = True
                     pattern = fuzzyMatchC.initPattern(self._cli.pattern[1])
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=False)
@@ -1786,8 +2318,21 @@ class Manager(object):
                     getHighlights = fuzzy_match.getHighlights
                     filter_method = partial(self._fuzzyFilter, True, getWeight)
                     highlight_method = partial(self._highlight, True, getHighlights)
+            elif self._fuzzy_engine and isCMatchable(self._cli.pattern[0], encoding) \
+                    and isCMatchable(self._cli.pattern[1], encoding):  # e.g. abc;def
+                use_fuzzy_engine = True
+                return_index = True
+                pattern_0 = fuzzyEngine.initPattern(self._cli.pattern[0])
+                pattern_1 = fuzzyEngine.initPattern(self._cli.pattern[1])
+                filter_method = partial(fuzzyEngine.refineMatch, engine=self._fuzzy_engine, pattern=pattern_0,
+                                        refine_pattern=pattern_1, sort_results=do_sort)
+                getHighlights_0 = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
+                                          pattern=pattern_0, is_name_only=True)
+                getHighlights_1 = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
+                                          pattern=pattern_1, is_name_only=False)
+                highlight_method = partial(self._highlightRefine, getHighlights_0, getHighlights_1, True)
             else:   # e.g. abc;def
-                if is_fuzzyMatch_C and isAscii(self._cli.pattern[0]):
+                if is_fuzzyMatch_C and isCMatchable(self._cli.pattern[0], encoding):
                     is_ascii_0 = True
                     pattern_0 = fuzzyMatchC.initPattern(self._cli.pattern[0])
                     getWeight_0 = partial(fuzzyMatchC.getWeight, pattern=pattern_0, is_name_only=True)
@@ -1801,7 +2346,7 @@ class Manager(object):
                         getWeight_0 = fuzzy_match_0.getWeight
                     getHighlights_0 = fuzzy_match_0.getHighlights
 
-                if is_fuzzyMatch_C and isAscii(self._cli.pattern[1]):
+                if is_fuzzyMatch_C and isCMatchable(self._cli.pattern[1], encoding):
                     is_ascii_1 = True
                     pattern_1 = fuzzyMatchC.initPattern(self._cli.pattern[1])
                     getWeight_1 = partial(fuzzyMatchC.getWeight, pattern=pattern_1, is_name_only=False)
@@ -1820,36 +2365,39 @@ class Manager(object):
                 filter_method = partial(self._refineFilter, getWeight_0, getWeight_1)
                 highlight_method = partial(self._highlightRefine, getHighlights_0, getHighlights_1)
         else:
-            if self._fuzzy_engine and isAscii(self._cli.pattern) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
+            if self._fuzzy_engine and isCMatchable(self._cli.pattern, encoding):
                 use_fuzzy_engine = True
                 pattern = fuzzyEngine.initPattern(self._cli.pattern)
+                # only the lines that can be seen are sorted, the rest are sorted by _sortResultContent()
+                top_k = self._initial_count if do_sort else 0
                 if self._getExplorer().getStlCategory() == "File":
                     return_index = False
                     if self._cli.isFullPath:
                         filter_method = partial(fuzzyEngine.fuzzyMatch, engine=self._fuzzy_engine, pattern=pattern,
-                                                is_name_only=False, sort_results=do_sort)
+                                                is_name_only=False, sort_results=do_sort, top_k=top_k)
                     else:
                         filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                                 pattern=pattern, category=fuzzyEngine.Category_File,
                                                 param=fuzzyEngine.createParameter(1),
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, sort_results=do_sort, top_k=top_k)
                 elif self._getExplorer().getStlCategory() == "Rg":
                     return_index = False
                     if "--match-path" in self._arguments:
                         filter_method = partial(fuzzyEngine.fuzzyMatch, engine=self._fuzzy_engine, pattern=pattern,
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, sort_results=do_sort, top_k=top_k)
                     else:
                         filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                                 pattern=pattern, category=fuzzyEngine.Category_Rg,
                                                 param=fuzzyEngine.createRgParameter(self._getExplorer().displayMulti(),
                                                     self._getExplorer().getContextSeparator(), self._has_column),
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, sort_results=do_sort, top_k=top_k)
                 elif self._getExplorer().getStlCategory() == "Tag":
                     return_index = False
                     mode = 0 if self._cli.isFullPath else 1
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Tag,
-                                            param=fuzzyEngine.createParameter(mode), is_name_only=True, sort_results=do_sort)
+                                            param=fuzzyEngine.createParameter(mode), is_name_only=True, sort_results=do_sort,
+                                            top_k=top_k)
                 elif self._getExplorer().getStlCategory() == "Gtags":
                     return_index = False
                     result_format = 1
@@ -1860,27 +2408,44 @@ class Manager(object):
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Gtags,
                                             param=fuzzyEngine.createGtagsParameter(0, result_format, self._match_path),
-                                            is_name_only=True, sort_results=do_sort)
+                                            is_name_only=True, sort_results=do_sort, top_k=top_k)
                 elif self._getExplorer().getStlCategory() == "Line":
                     return_index = False
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Line,
-                                            param=fuzzyEngine.createParameter(1), is_name_only=True, sort_results=do_sort)
-                elif self._getExplorer().getStlCategory() in ["Self", "Buffer", "Mru", "BufTag",
-                        "Function", "History", "Cmd_History", "Search_History", "Filetype",
-                        "Command", "Window", "QuickFix", "LocList"]:
-                    return_index = True
-                    filter_method = partial(fuzzyEngine.fuzzyMatchEx, engine=self._fuzzy_engine, pattern=pattern,
-                                            is_name_only=True, sort_results=do_sort)
+                                            param=fuzzyEngine.createParameter(1), is_name_only=True, sort_results=do_sort,
+                                            top_k=top_k)
                 else:
-                    return_index = True
-                    filter_method = partial(fuzzyEngine.fuzzyMatchEx, engine=self._fuzzy_engine, pattern=pattern,
-                                            is_name_only=not self._cli.isFullPath, sort_results=do_sort)
+                    if self._getExplorer().getStlCategory() in ["Self", "Buffer", "Mru", "BufTag",
+                            "Function", "History", "Cmd_History", "Search_History", "Filetype",
+                            "Command", "Window", "QuickFix", "LocList"]:
+                        is_name_only = True
+                    else:
+                        is_name_only = not self._cli.isFullPath
+
+                    if self._getUnit() == 1:
+                        digest_spec = self._getDigestSpec(0 if self._cli.isFullPath else 1)
+                    else:
+                        digest_spec = None
+
+                    if digest_spec is None:
+                        return_index = True
+                        filter_method = partial(fuzzyEngine.fuzzyMatchEx, engine=self._fuzzy_engine, pattern=pattern,
+                                                is_name_only=is_name_only, sort_results=do_sort)
+                    else:
+                        return_index = False
+                        filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
+                                                pattern=pattern, category=fuzzyEngine.Category_Digest,
+                                                param=fuzzyEngine.createDigestParameter(**digest_spec),
+                                                is_name_only=is_name_only, sort_results=do_sort, top_k=top_k)
+
+                if return_index:
+                    top_k = 0
 
                 getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                         pattern=pattern, is_name_only=not self._cli.isFullPath)
                 highlight_method = partial(self._highlight, self._cli.isFullPath, getHighlights, True)
-            elif is_fuzzyMatch_C and isAscii(self._cli.pattern):
+            elif is_fuzzyMatch_C and isCMatchable(self._cli.pattern, encoding):
                 use_fuzzy_match_c = True
                 pattern = fuzzyMatchC.initPattern(self._cli.pattern)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
@@ -1917,11 +2482,18 @@ class Manager(object):
                                            self._cli.isFullPath,
                                            fuzzy_match.getHighlights)
 
+        # the step is sized by self._chunk_scheduler according to the measured speed of each kind of filter
+        start_time = time.time()
         if self._cli.isAndMode:
-            if self._fuzzy_engine and isAscii(''.join(self._cli.pattern)):
-                step = 20000 * cpu_count
+            if self._fuzzy_engine and isCMatchable(''.join(self._cli.pattern), encoding):
+                kind = "and_engine"
+                default_step = 20000 * cpu_count
             else:
-                step = 10000
+                kind = "and"
+                default_step = 10000
+
+            if step == 0:
+                step = self._chunk_scheduler.getStep(kind, default_step)
             pair, highlight_methods = self._filter(step, filter_method, content, is_continue)
 
             if do_sort:
@@ -1930,27 +2502,47 @@ class Manager(object):
             else:
                 self._result_content = pair[1]
         elif use_fuzzy_engine:
-            if step == 0:
-                if return_index == True:
-                    step = 30000 * cpu_count
-                else:
-                    step = 60000 * cpu_count
+            if return_index == True:
+                kind = "engine_index"
+                default_step = 30000 * cpu_count
+            else:
+                kind = "engine"
+                default_step = 60000 * cpu_count
 
-            _, self._result_content = self._filter(step, filter_method, content, is_continue, True, return_index)
-        else:
             if step == 0:
-                if use_fuzzy_match_c:
-                    step = 60000
-                elif self._getExplorer().supportsNameOnly() and self._cli.isFullPath:
-                    step = 6000
-                else:
-                    step = 12000
+                step = self._chunk_scheduler.getStep(kind, default_step)
+            result = self._filter(step, filter_method, content, is_continue, True, return_index, top_k,
+                                  cancellable=True, by_index=not return_index)
+            if result is None:  # cancelled by a keystroke, keep the result shown
+                return
+            _, self._result_content = result
+            if self._getUnit() > 1: # currently, only BufTag's _getUnit() is 2
+                self._result_content = list(itertools.chain.from_iterable(self._result_content))
+            # the runs of a RankedList are sorted completely
+            if isinstance(self._result_content, IndexedList):
+                self._result_top_k = 0
+            elif len(self._result_content) > top_k:
+                self._result_top_k = top_k
+        else:
+            if use_fuzzy_match_c:
+                kind = "fuzzy_match_c"
+                default_step = 60000
+            elif self._getExplorer().supportsNameOnly() and self._cli.isFullPath:
+                kind = "python_full_path"
+                default_step = 6000
+            else:
+                kind = "python"
+                default_step = 12000
 
+            if step == 0:
+                step = self._chunk_scheduler.getStep(kind, default_step)
             pairs = self._filter(step, filter_method, content, is_continue)
             if "--no-sort" not in self._arguments:
                 pairs.sort(key=operator.itemgetter(0), reverse=True)
             self._result_content = self._getList(pairs)
 
+        self._chunk_scheduler.record(kind, self._chunk_size, time.time() - start_time)
+
         self._getInstance().setBuffer(self._result_content[:self._initial_count])
         self._getInstance().setStlResultsCount(len(self._result_content), True)
 
@@ -1961,9 +2553,59 @@ class Manager(object):
             self._highlight_method = highlight_method
             self._highlight_method()
 
+        if not is_continue:
+            self._search_key = (self._cli.pattern, self._cli.isFullPath)
+
         if len(self._cli.pattern) > 1 and not is_continue:
             lfCmd("silent! redraw")
 
+    def _pushResult(self):
+        """
+        save the result of the current pattern before it is narrowed,
+        so that it can be restored by _popResult() when <BS> is typed
+        """
+        # the result is incomplete if there are lines in self._cb_content that are not filtered
+        if self._search_key is None or self._cb_content or "--live" in self._arguments:
+            return
+
+        self._result_stack.append((self._search_key, self._index, self._result_content,
+                                   self._result_top_k, self._previous_result, self._highlight_method))
+
+    def _popResult(self):
+        """
+        restore the result saved by _pushResult() if the current pattern is
+        one of the patterns typed before, e.g., when <BS> is typed
+        return True if the result is restored, False otherwise
+        """
+        if not self._cli.isFuzzy or not self._cli.pattern:
+            self._result_stack = []
+            return False
+
+        key = (self._cli.pattern, self._cli.isFullPath)
+        while self._result_stack:
+            entry = self._result_stack.pop()
+            if entry[0] == key:
+                break
+        else:
+            return False
+
+        self.clearSelections()
+        self._clearHighlights()
+        self._clearHighlightsPos()
+        self._cli.highlightMatches()
+
+        (self._search_key, self._index, self._result_content, self._result_top_k,
+                self._previous_result, self._highlight_method) = entry
+        self._showRestoredResult()
+        self._previewResult(False)
+        return True
+
+    def _showRestoredResult(self):
+        self._cb_content = []
+        self._getInstance().setBuffer(self._result_content[:self._initial_count])
+        self._getInstance().setStlResultsCount(len(self._result_content), True)
+        self._highlight_method()
+
     def _guessFilter(self, filename, suffix, dirname, icon, iterable):
         """
         return a list, each item is a pair (weight, line)
@@ -1972,10 +2614,17 @@ class Manager(object):
         return ((FuzzyMatch.getPathWeight(filename, suffix, dirname, line[icon_len:]), line) for line in iterable)
 
     def _guessSearch(self, content, is_continue=False, step=0):
+        """
+        rank the lines by their similarity to the path of the current buffer.
+        if is_continue is True, only the lines after self._index are ranked and merged
+        into the result, e.g., the lines read after the last call.
+        """
+        self._result_top_k = 0
         if self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] not in [b'', '']:
             self._getInstance().setBuffer(content[:self._initial_count])
             self._getInstance().setStlResultsCount(len(content), True)
             self._result_content = []
+            self._guess_key = None
             return
 
         buffer_name = os.path.normpath(lfDecode(self._cur_buffer.name))
@@ -1992,22 +2641,46 @@ class Manager(object):
             icon = webDevIconsGetFileTypeSymbol(basename)
         else:
             icon = ''
+        # the ranking depends only on the current buffer and the content
+        self._updateContentGeneration()
+        key = (self._getExplorer().getStlCategory(), self._content_generation, buffer_name, icon)
+        if not is_continue or key != self._guess_key:
+            is_continue = False
+            self._index = 0
+            self._guess_key = key
+            entry = self._query_cache.get(key + (len(content),))
+            if entry is not None:
+                (self._index, self._result_content, self._result_top_k, self._previous_result) = entry
+                self._cb_content = []
+                self._getInstance().setBuffer(self._result_content[:self._initial_count])
+                self._getInstance().setStlResultsCount(len(self._result_content), True)
+                return
+
+        step = len(content)
         if self._fuzzy_engine:
+            # only the lines that can be seen are sorted, the rest are sorted by _sortResultContent()
+            top_k = self._initial_count
             filter_method = partial(fuzzyEngine.guessMatch, engine=self._fuzzy_engine, filename=filename,
-                                    suffix=suffix, dirname=dirname, icon=icon, sort_results=True)
-            step = len(content)
-
-            _, self._result_content = self._filter(step, filter_method, content, is_continue, True)
+                                    suffix=suffix, dirname=dirname, icon=icon, sort_results=True, top_k=top_k)
+            _, self._result_content = self._filter(step, filter_method, content, is_continue, True, False, top_k)
+            if len(self._result_content) > top_k:
+                self._result_top_k = top_k
         else:
-            step = len(content)
             filter_method = partial(self._guessFilter, filename, suffix, dirname, icon)
             pairs = self._filter(step, filter_method, content, is_continue)
+            # the pairs ranked before are sorted, list.sort() merges the new pairs into them in linear time
             pairs.sort(key=operator.itemgetter(0), reverse=True)
             self._result_content = self._getList(pairs)
 
         self._getInstance().setBuffer(self._result_content[:self._initial_count])
         self._getInstance().setStlResultsCount(len(self._result_content), True)
 
+        if self._read_finished == 2 and self._index >= len(self._content):
+            # roughly the bytes per line, see _cacheResult()
+            size = len(self._result_content) * (16 if self._fuzzy_engine else 80)
+            self._query_cache.put(key + (len(content),), (self._index, self._result_content,
+                                  self._result_top_k, self._previous_result), size)
+
     def _highlight_and_mode(self, highlight_methods):
         self._clearHighlights()
         for i, highlight_method in enumerate(highlight_methods):
@@ -2126,7 +2799,7 @@ class Manager(object):
                     id = int(lfEval("matchaddpos('%s', %s)" % (hl_group, str(pos[j:j+8]))))
                 self._highlight_ids.append(id)
 
-    def _highlightRefine(self, first_get_highlights, get_highlights):
+    def _highlightRefine(self, first_get_highlights, get_highlights, use_fuzzy_engine=False):
         # matchaddpos() is introduced by Patch 7.4.330
         if (lfEval("exists('*matchaddpos')") == '0' or
                 lfEval("g:Lf_HighlightIndividual") == '0'):
@@ -2151,8 +2824,12 @@ class Manager(object):
 
         bottom = len(content)
 
-        self._highlight_pos = [first_get_highlights(getDigest(line, 1))
-                               for line in content[:highlight_number:unit]]
+        if use_fuzzy_engine:
+            self._highlight_pos = first_get_highlights(source=[getDigest(line, 1)
+                                                               for line in content[:highlight_number:unit]])
+        else:
+            self._highlight_pos = [first_get_highlights(getDigest(line, 1))
+                                   for line in content[:highlight_number:unit]]
         for i, pos in enumerate(self._highlight_pos):
             start_pos = self._getDigestStartPos(content[unit*i], 1)
             if start_pos > 0:
@@ -2172,8 +2849,12 @@ class Manager(object):
                     id = int(lfEval("matchaddpos('Lf_hl_match', %s)" % str(pos[j:j+8])))
                 self._highlight_ids.append(id)
 
-        self._highlight_refine_pos = [get_highlights(getDigest(line, 2))
-                                      for line in content[:highlight_number:unit]]
+        if use_fuzzy_engine:
+            self._highlight_refine_pos = get_highlights(source=[getDigest(line, 2)
+                                                                for line in content[:highlight_number:unit]])
+        else:
+            self._highlight_refine_pos = [get_highlights(getDigest(line, 2))
+                                          for line in content[:highlight_number:unit]]
         for i, pos in enumerate(self._highlight_refine_pos):
             start_pos = self._getDigestStartPos(content[unit*i], 2)
             if start_pos > 0:
@@ -2193,6 +2874,21 @@ class Manager(object):
                     id = int(lfEval("matchaddpos('Lf_hl_matchRefine', %s)" % str(pos[j:j+8])))
                 self._highlight_ids.append(id)
 
+    def _getNativeRegex(self):
+        """
+        return the python regular expression translated from self._cli.pattern,
+        None if it can not be translated, in which case vim is used to match.
+        """
+        key = (self._cli.pattern, lfEval("&ignorecase"), lfEval("&magic"))
+        if self._native_regex[0] != key:
+            try:
+                regex = translateVimRegex(self._cli.pattern, key[1] == '1', key[2] == '1')
+            except ValueError:
+                regex = None
+            self._native_regex = (key, regex)
+
+        return self._native_regex[1]
+
     def _regexFilter(self, iterable):
         def noErrMatch(text, pattern):
             try:
@@ -2207,6 +2903,11 @@ class Manager(object):
         try:
             if ('-2' == lfEval("g:LfNoErrMsgMatch('', '%s')" % escQuote(self._cli.pattern))):
                 return iter([])
+
+            regex = self._getNativeRegex()
+            if regex is not None:
+                search = regex.search
+                return (line for line in iterable if search(self._getDigest(line, 0)))
             else:
                 return (line for line in iterable
                         if noErrMatch(escQuote(self._getDigest(line, 0)), escQuote(self._cli.pattern)))
@@ -2216,7 +2917,19 @@ class Manager(object):
     def _regexSearch(self, content, is_continue, step):
         if not is_continue and not self._cli.isPrefix:
             self._index = 0
-        self._result_content = self._filter(8000, self._regexFilter, content, is_continue)
+        # matching in python is much faster than calling vim's match() for each line
+        if self._getNativeRegex() is not None:
+            kind = "regex"
+            default_step = 100000
+        else:
+            kind = "regex_vim"
+            default_step = 8000
+
+        if step == 0:
+            step = self._chunk_scheduler.getStep(kind, default_step)
+        start_time = time.time()
+        self._result_content = self._filter(step, self._regexFilter, content, is_continue)
+        self._chunk_scheduler.record(kind, self._chunk_size, time.time() - start_time)
         self._getInstance().setBuffer(self._result_content[:self._initial_count])
         self._getInstance().setStlResultsCount(len(self._result_content), True)
 
@@ -2527,6 +3240,8 @@ class Manager(object):
 
         self._content = self._getInstance().initBuffer(content, self._getUnit(), self._getExplorer().setContent)
         self._iteration_end = True
+        self._result_stack = []
+        self._updateContentGeneration(True)
 
         if self._cli.pattern:
             self._index = 0
@@ -2684,7 +3399,10 @@ class Manager(object):
                 pattern = pattern[1:-1]
             self._cli.setPattern(pattern)
             self._result_content = []
+            self._result_stack = []
             self._cb_content = []
+            self._search_cancelled = False
+            self._guess_key = None
 
         if not content:
             lfCmd("echohl Error | redraw | echo ' No content!' | echohl NONE")
@@ -2693,6 +3411,9 @@ class Manager(object):
         # clear the buffer only when the content is not a list
         self._getInstance().enterBuffer(win_pos, not isinstance(content, list))
         self._initial_count = self._getInstance().getInitialWinHeight()
+        self._chunk_scheduler.setLatency(float(lfEval("g:Lf_FilterLatency")) / 1000)
+        self._query_cache.setCapacity(int(lfEval("g:Lf_QueryCacheSize")) * 1024 * 1024)
+        self._resetCorpusPriors(content)
 
         self._getInstance().setStlCategory(self._getExplorer().getStlCategory())
         self._setStlMode(**kwargs)
@@ -2745,6 +3466,7 @@ class Manager(object):
                 if not remember_last_status and not empty_query:
                     self._getInstance().appendBuffer(self._content[self._initial_count:])
                 elif remember_last_status and len(self._getInstance().buffer) < len(self._result_content):
+                    self._sortResultContent()
                     self._getInstance().appendBuffer(self._result_content[self._initial_count:])
 
                 lfCmd("echo")
@@ -2759,6 +3481,7 @@ class Manager(object):
                     self._guessSearch(self._content)
                     if self._result_content: # self._result_content is [] only if
                                              #  self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] not in [b'', '']:
+                        self._sortResultContent()
                         self._getInstance().appendBuffer(self._result_content[self._initial_count:])
                     else:
                         self._getInstance().appendBuffer(self._content[self._initial_count:])
@@ -2841,9 +3564,26 @@ class Manager(object):
             self._read_finished = 1
             self._read_content_exception = sys.exc_info()
 
+    def _sortResultContent(self):
+        """
+        sort the lines of self._result_content that are not sorted yet,
+        i.e., the lines after the first self._result_top_k lines
+        """
+        if self._result_top_k == 0:
+            return
+
+        if self._previous_result[1] is self._result_content:
+            self._previous_result = fuzzyEngine.sortResult(self._previous_result, self._result_top_k)
+            self._result_content = self._previous_result[1]
+        self._result_top_k = 0
+
     def _setResultContent(self):
+        self._sortResultContent()
         if len(self._result_content) > len(self._getInstance().buffer):
-            self._getInstance().setBuffer(self._result_content)
+            if isinstance(self._result_content, IndexedList):
+                self._getInstance().setBuffer(self._result_content[:])
+            else:
+                self._getInstance().setBuffer(self._result_content)
         elif self._index == 0:
             self._getInstance().setBuffer(self._content, need_copy=True)
 
@@ -2861,14 +3601,10 @@ class Manager(object):
                 raise self._read_content_exception[1]
 
         if self._is_content_list:
-            if self._cli.pattern and (self._index < len(self._content) or len(self._cb_content) > 0):
-                if self._fuzzy_engine:
-                    step = 60000 * cpu_count
-                elif is_fuzzyMatch_C:
-                    step = 10000
-                else:
-                    step = 2000
-                self._search(self._content, True, step)
+            if self._cli.pattern and (self._search_cancelled or self._index < len(self._content)
+                    or len(self._cb_content) > 0):
+                # the step is decided by self._chunk_scheduler
+                self._search(self._content, True)
             return
 
         if content:
@@ -2889,10 +3625,12 @@ class Manager(object):
                 if self._cli.pattern:
                     self._getInstance().setStlResultsCount(len(self._result_content))
                 elif self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
-                    self._guessSearch(self._content)
+                    # rank the lines read after the last call of _guessSearch()
+                    self._guessSearch(self._content, True)
                     if bang:
                         if self._result_content: # self._result_content is [] only if
                                                  #  self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] != b'':
+                            self._sortResultContent()
                             self._getInstance().appendBuffer(self._result_content[self._initial_count:])
                         else:
                             self._getInstance().appendBuffer(self._content[self._initial_count:])
@@ -2935,16 +3673,11 @@ class Manager(object):
                     lfCmd("redrawstatus")
 
             if self._cli.pattern:
-                if self._index < len(self._content) or len(self._cb_content) > 0:
-                    if self._fuzzy_engine:
-                        step = 60000 * cpu_count
-                    elif is_fuzzyMatch_C:
-                        step = 10000
-                    else:
-                        step = 2000
-                    self._search(self._content, True, step)
+                if self._search_cancelled or self._index < len(self._content) or len(self._cb_content) > 0:
+                    self._search(self._content, True)
 
                     if bang:
+                        self._sortResultContent()
                         self._getInstance().appendBuffer(self._result_content[self._initial_count:])
         else:
             cur_len = len(self._content)
@@ -2962,14 +3695,8 @@ class Manager(object):
                     lfCmd("redrawstatus")
 
             if self._cli.pattern:
-                if self._index < cur_len or len(self._cb_content) > 0:
-                    if self._fuzzy_engine:
-                        step = 60000 * cpu_count
-                    elif is_fuzzyMatch_C:
-                        step = 10000
-                    else:
-                        step = 2000
-                    self._search(self._content[:cur_len], True, step)
+                if self._search_cancelled or self._index < cur_len or len(self._cb_content) > 0:
+                    self._search(self._content[:cur_len], True)
             else:
                 if bang:
                     if self._getInstance().empty():
@@ -2987,6 +3714,10 @@ class Manager(object):
                         self._bang_start_time = time.time()
                         lfCmd("echohl WarningMsg | redraw | echo ' searching %s' | echohl NONE" % ('.' * self._bang_count))
                         self._bang_count = (self._bang_count + 1) % 9
+                elif self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
+                    # rank the lines as they are read instead of after all of them are read
+                    if self._index < cur_len:
+                        self._guessSearch(self._content[:cur_len], True)
                 elif len(self._getInstance().buffer) < min(cur_len, self._initial_count):
                     self._getInstance().setBuffer(self._content[:self._initial_count])
 
@@ -3032,15 +3763,18 @@ class Manager(object):
                 if self._getInstance().getWinPos() == 'popup':
                     if self._getInstance()._window_object.cursor[0] > 1:
                         lfCmd("call win_execute({}, 'norm! gg')".format(self._getInstance().getPopupWinId()))
+                self._pushResult()
                 self._search(cur_content)
             elif equal(cmd, '<Shorten>'):
                 if self._getInstance().isReverseOrder():
                     lfCmd("normal! G")
                 else:
                     self._gotoFirstLine()
-                self._index = 0 # search from beginning
-                self._search(cur_content)
+                if not self._popResult():
+                    self._index = 0 # search from beginning
+                    self._search(cur_content)
             elif equal(cmd, '<Mode>'):
+                self._result_stack = []
                 self._setStlMode()
                 if self._getInstance().getWinPos() in ('popup', 'floatwin'):
                     self._getInstance().setPopupStl(self._current_mode)
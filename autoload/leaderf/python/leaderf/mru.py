@@ -4,6 +4,7 @@
 import vim
 import os
 import sys
+import time
 import os.path
 import fnmatch
 from .utils import *
@@ -90,6 +91,42 @@ class Mru(object):
             f.truncate(0)
             f.writelines(lines)
 
+    def getFrecency(self, current_time, item):
+        """
+        item is [time, rank, filename]
+        """
+        rank = int(item[1])
+        delta_time = int(current_time) - int(item[0])
+        frecency = 0
+        if delta_time < 3600:
+            frecency = rank * 4
+        elif delta_time < 86400:
+            frecency = rank * 2
+        elif delta_time < 604800:
+            frecency = rank * 0.5
+        else:
+            frecency = rank * 0.25
+
+        return frecency
+
+    def getFrecencies(self):
+        """
+        return a dict, the key is the normalized name of a file in the cache,
+        the value is its frecency.
+        """
+        self.saveToCache(lfEval("readfile(lfMru#CacheFileName())"))
+        lfCmd("call writefile([], lfMru#CacheFileName())")
+
+        current_time = time.time()
+        frecencies = {}
+        with lfOpen(self._cache_file, 'r', errors='ignore', encoding='utf8') as f:
+            for line in f:
+                item = line.split(None, 2)
+                if len(item) == 3:
+                    frecencies[self.normalize(item[2].rstrip())] = self.getFrecency(current_time, item)
+
+        return frecencies
+
     def setBufferTimestamp(self, buf_number):
         self._mru_bufnrs[buf_number] = self._timestamp
         self._timestamp += 1
@@ -35,19 +35,7 @@ class MruExplorer(Explorer):
         """
         item is [time, rank, filename]
         """
-        rank = int(item[1])
-        delta_time = int(current_time) - int(item[0])
-        frecency = 0
-        if delta_time < 3600:
-            frecency = rank * 4
-        elif delta_time < 86400:
-            frecency = rank * 2
-        elif delta_time < 604800:
-            frecency = rank * 0.5
-        else:
-            frecency = rank * 0.25
-
-        return frecency
+        return mru.getFrecency(current_time, item)
 
     def getContent(self, *args, **kwargs):
         mru.saveToCache(lfEval("readfile(lfMru#CacheFileName())"))
@@ -301,6 +289,27 @@ class MruExplManager(Manager):
                 start_pos = line.find(' "') # what if there is " in file name?
                 return lfBytesLen(line[:start_pos+2])
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        prefix_len = self._getExplorer().getPrefixLength()
+        if "--no-split-path" in self._arguments:
+            if mode == 0:
+                return {"skip": prefix_len}
+            elif os.name == 'nt':   # getBasename() accepts both '/' and '\\'
+                return None
+            else:
+                return {"skip": prefix_len, "separator": os.sep, "maxsplit": 1, "field": -1, "reverse": True}
+        else:
+            if mode == 0:
+                return {"skip": prefix_len}
+            else:
+                return {"skip": prefix_len, "separator": ' "', "maxsplit": 1, "rstrip": True}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -358,7 +367,7 @@ class MruExplManager(Manager):
         basename = self._getDigest(line, 1)
         self._explorer.delFromCache(dirname + basename)
         if len(self._content) > 0:
-            self._content.remove(line)
+            self._removeContentLine(line)
             self._getInstance().setStlTotal(len(self._content)//self._getUnit())
             self._getInstance().setStlResultsCount(len(self._content)//self._getUnit())
         # `del vim.current.line` does not work in neovim
@@ -174,6 +174,18 @@ class QfLocListExplManager(Manager):
             )
             self._match_ids.append(id)
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path (line)
+                  1, the name only (text)
+        """
+        if mode == 0:
+            return {}
+        else:
+            return {"separator": ":", "maxsplit": 3, "field": 3}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : open file under cursor')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+
+class QueryCache(object):
+    """
+    A LRU cache of the results of the queries, so that a query typed recently,
+    e.g., a query typed again or a query whose mode is toggled back,
+    is not filtered again.
+    The size of an entry is estimated by the caller, the least recently used
+    entries are evicted when the total size exceeds `capacity` bytes.
+    """
+    def __init__(self, capacity=0):
+        self._capacity = capacity
+        self._size = 0
+        self._entries = OrderedDict()   # key: (size, value)
+
+    def setCapacity(self, capacity):
+        self._capacity = capacity
+        self._evict()
+
+    def _evict(self):
+        while self._entries and self._size > self._capacity:
+            _, (size, _) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def get(self, key):
+        """
+        return the value of `key`, or None if it is not cached.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        # the most recently used entry is the last one
+        self._entries[key] = entry
+        return entry[1]
+
+    def put(self, key, value, size):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[0]
+
+        if size > self._capacity:
+            return
+
+        self._entries[key] = (size, value)
+        self._size += size
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
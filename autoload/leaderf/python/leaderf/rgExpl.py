@@ -1162,7 +1162,7 @@ class RgExplManager(Manager):
         if "--heading" in self._arguments and not re.match(r'^\d+[:-]', line):
             return
         if len(self._content) > 0:
-            self._content.remove(line)
+            self._removeContentLine(line)
             self._getInstance().setStlTotal(len(self._content)//self._getUnit())
             self._getInstance().setStlResultsCount(len(self._content)//self._getUnit())
         # `del vim.current.line` does not work in neovim
@@ -117,6 +117,18 @@ class SelfExplManager(Manager):
             start_pos = line.find(' "') # what if there is " in file name?
             return lfBytesLen(line[:start_pos+2])
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        if mode == 0:
+            return {}
+        else:
+            return {"separator": ' "', "maxsplit": 1, "rstrip": True}
+
     def _createHelp(self):
         help = []
         help.append('" <CR>/<double-click>/o : execute command under cursor')
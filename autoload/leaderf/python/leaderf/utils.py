@@ -1432,3 +1432,270 @@ def printTime(func):
             print(func.__name__, time.time() - start)
 
     return deco
+
+# the character classes of vim, they only match ASCII characters
+vim_char_classes = {
+    's': r'[ \t]',
+    'S': r'[^ \t]',
+    'd': r'[0-9]',
+    'D': r'[^0-9]',
+    'w': r'[0-9A-Za-z_]',
+    'W': r'[^0-9A-Za-z_]',
+    'a': r'[A-Za-z]',
+    'A': r'[^A-Za-z]',
+    'l': r'[a-z]',
+    'L': r'[^a-z]',
+    'u': r'[A-Z]',
+    'U': r'[^A-Z]',
+    'x': r'[0-9A-Fa-f]',
+    'X': r'[^0-9A-Fa-f]',
+    'o': r'[0-7]',
+    'O': r'[^0-7]',
+    'h': r'[A-Za-z_]',
+    'H': r'[^A-Za-z_]',
+}
+
+vim_posix_classes = {
+    'alnum': r'0-9A-Za-z',
+    'alpha': r'A-Za-z',
+    'blank': r' \t',
+    'cntrl': r'\x00-\x1f\x7f',
+    'digit': r'0-9',
+    'graph': r'!-~',
+    'lower': r'a-z',
+    'print': r' -~',
+    'punct': r'!-/:-@\[-`{-~',
+    'space': r' \t\n\r\f\v',
+    'upper': r'A-Z',
+    'xdigit': r'0-9A-Fa-f',
+    'return': r'\r',
+    'tab': r'\t',
+    'escape': r'\x1b',
+    'backspace': r'\x08',
+}
+
+vim_escaped_chars = {
+    'e': r'\x1b',
+    't': r'\t',
+    'r': r'\r',
+    'b': r'\x08',
+    'n': r'\n',
+}
+
+def _translateCollection(pattern, i):
+    """
+    translate the vim collection that starts at pattern[i], pattern[i-1] is '['.
+    return a tuple (python collection, the index after ']'), or None if there is no ']'.
+    """
+    n = len(pattern)
+    items = []
+    if i < n and pattern[i] == '^':
+        items.append('^')
+        i += 1
+    if i < n and pattern[i] == ']':
+        items.append(r'\]')
+        i += 1
+
+    while i < n and pattern[i] != ']':
+        c = pattern[i]
+        if c == '[' and pattern.startswith('[:', i):
+            end = pattern.find(':]', i + 2)
+            name = pattern[i+2:end]
+            if end == -1 or name not in vim_posix_classes:
+                raise ValueError("unsupported character class: %s" % pattern[i:])
+            items.append(vim_posix_classes[name])
+            i = end + 2
+        elif c == '[' and pattern.startswith(('[=', '[.'), i):
+            raise ValueError("unsupported collection item: %s" % pattern[i:])
+        elif c == '\\' and i + 1 < n and pattern[i+1] in vim_escaped_chars:
+            items.append(vim_escaped_chars[pattern[i+1]])
+            i += 2
+        elif c == '\\' and i + 1 < n and pattern[i+1] in '\\]^-':
+            items.append(pattern[i:i+2])
+            i += 2
+        elif c == '\\' and i + 1 < n and pattern[i+1] in 'doxuU':
+            raise ValueError("unsupported collection item: %s" % pattern[i:])
+        elif c in '\\[&~|':
+            items.append('\\' + c)
+            i += 1
+        else:
+            items.append(c)
+            i += 1
+
+    if i >= n:
+        return None
+
+    return ('[' + ''.join(items) + ']', i + 1)
+
+def _tokenizeVimRegex(pattern, magic):
+    """
+    split a vim regular expression into tokens, a token is a tuple (kind, value).
+    """
+    # the characters that have special meaning without a backslash
+    special_chars = {
+            'v': '^$.*[~()|+?={@%<>&',
+            'm': '^$.*[~',
+            'M': '^$',
+            'V': '',
+            }
+    operators = '^$.*[~()|+?={@%<>&'
+    mode = 'm' if magic else 'M'
+    tokens = []
+    n = len(pattern)
+    i = 0
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c != '\\':
+            if c in special_chars[mode]:
+                tokens.append(('op', c))
+            else:
+                tokens.append(('lit', c))
+        else:
+            if i >= n:
+                raise ValueError("trailing backslash")
+
+            c = pattern[i]
+            i += 1
+            if c in special_chars[mode]:
+                tokens.append(('lit', c))
+            elif c in operators:
+                tokens.append(('op', c))
+            elif c in 'vmMV':
+                mode = c
+                continue
+            elif c in 'cC':
+                tokens.append(('case', c))
+            elif c in vim_char_classes:
+                tokens.append(('re', vim_char_classes[c]))
+            elif c in vim_escaped_chars:
+                tokens.append(('re', vim_escaped_chars[c]))
+            elif c in '123456789':
+                tokens.append(('re', '\\' + c))
+            elif c == 'z' and i < n and pattern[i] in 'se':
+                # \zs and \ze do not affect whether a line matches
+                tokens.append(('zero', ''))
+                i += 1
+            elif c.isalnum() or c == '_':
+                raise ValueError("unsupported item: \\%s" % c)
+            else:
+                tokens.append(('lit', c))
+
+        # the operators that consume the characters following them
+        if tokens[-1] == ('op', '['):
+            collection = _translateCollection(pattern, i)
+            if collection is None:
+                tokens[-1] = ('lit', '[')
+            else:
+                tokens[-1] = ('re', collection[0])
+                i = collection[1]
+        elif tokens[-1] == ('op', '{'):
+            end = pattern.find('}', i)
+            if end == -1:
+                raise ValueError("missing }")
+            count = pattern[i:end]
+            if count.endswith('\\'):
+                count = count[:-1]
+            tokens[-1] = ('count', count)
+            i = end + 1
+        elif tokens[-1] == ('op', '%'):
+            if i < n and pattern[i] == '(':
+                tokens[-1] = ('op', '%(')
+                i += 1
+            else:
+                raise ValueError("unsupported item: \\%%%s" % pattern[i:i+1])
+
+    return tokens
+
+def translateVimRegex(pattern, ignorecase=False, magic=True):
+    r"""
+    translate the vim regular expression `pattern` to a python one.
+    `ignorecase` and `magic` are the values of 'ignorecase' and 'magic'.
+    raise ValueError if `pattern` contains something that can not be translated,
+    e.g., \%V, \@<=, \_s, ~.
+    return a compiled python regular expression object, it is only used to
+    test whether a line matches, so \zs and \ze are ignored.
+    """
+    tokens = _tokenizeVimRegex(pattern, magic)
+    result = []
+    has_atom = False    # whether a multi can follow
+    at_start = True     # whether it is at the start of a branch
+    for i, (kind, value) in enumerate(tokens):
+        if kind == 'lit':
+            result.append(re.escape(value))
+            has_atom = True
+        elif kind == 're':
+            result.append(value)
+            has_atom = True
+        elif kind == 'zero':
+            has_atom = False
+        elif kind == 'case':
+            ignorecase = value == 'c'
+            continue
+        elif kind == 'count':
+            m = re.match(r'^(-?)(\d*)(,?)(\d*)$', value)
+            if m is None or not has_atom:
+                raise ValueError("invalid count: %s" % value)
+            lazy, low, comma, high = m.groups()
+            if comma:
+                multi = '{%s,%s}' % (low or '0', high)
+            elif low:
+                multi = '{%s}' % low
+            else:
+                multi = '*'
+            result.append(multi + ('?' if lazy else ''))
+            has_atom = False
+        elif value == '^':
+            if at_start:
+                result.append('^')
+            else:
+                result.append(r'\^')
+                has_atom = True
+        elif value == '$':
+            if i + 1 == len(tokens) or tokens[i+1] in (('op', '|'), ('op', ')'), ('op', '&')):
+                result.append('$')
+            else:
+                result.append(r'\$')
+                has_atom = True
+        elif value == '.':
+            result.append('.')
+            has_atom = True
+        elif value in '*+=?':
+            if not has_atom:
+                if value != '*':
+                    raise ValueError("%s follows nothing" % value)
+                result.append(r'\*')
+                has_atom = True
+            else:
+                result.append('*' if value == '*' else '+' if value == '+' else '?')
+                has_atom = False
+        elif value in ('(', '%('):
+            result.append('(' if value == '(' else '(?:')
+            has_atom = False
+            at_start = True
+            continue
+        elif value == ')':
+            result.append(')')
+            has_atom = True
+        elif value == '|':
+            result.append('|')
+            has_atom = False
+            at_start = True
+            continue
+        elif value == '<':
+            result.append(r'\b(?=\w)')
+            has_atom = False
+        elif value == '>':
+            result.append(r'\b(?<=\w)')
+            has_atom = False
+        else:
+            # ~, \@, \&
+            raise ValueError("unsupported item: %s" % value)
+
+        at_start = False
+
+    flags = re.IGNORECASE if ignorecase else 0
+    try:
+        return re.compile(''.join(result), flags)
+    except re.error as e:
+        raise ValueError(str(e))
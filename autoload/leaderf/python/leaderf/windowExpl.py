@@ -195,6 +195,19 @@ class WindowExplManager(Manager):
             start_pos = line.find(' "')
             return lfBytesLen(line[:start_pos+2])
 
+    def _getDigestSpec(self, mode):
+        """
+        describe the digest returned by _getDigest()
+        Args:
+            mode: 0, the full path
+                  1, the name only
+        """
+        prefix_len = self._getExplorer().getPrefixLength()
+        if mode == 0:
+            return {"skip": prefix_len}
+        else:
+            return {"skip": prefix_len, "separator": ' "', "maxsplit": 1}
+
     def _afterEnter(self):
         super(WindowExplManager, self)._afterEnter()
 
@@ -286,7 +299,7 @@ class WindowExplManager(Manager):
         else:
             lfCmd("setlocal modifiable")
         if len(self._content) > 0:
-            self._content.remove(line)
+            self._removeContentLine(line)
             self._getInstance().setStlTotal(len(self._content)//self._getUnit())
             self._getInstance().setStlResultsCount(len(self._content)//self._getUnit())
 